@@ -0,0 +1,304 @@
+"""
+Scaling benchmarks of the lef generation, parsing and chaining.
+
+    python -m benchmarks.bench run [--grid 1x1000,10x1000] [--save-baseline]
+    python -m benchmarks.bench compare [--threshold 0.2]
+    python -m benchmarks.bench startup [--budget 0.3]
+
+Each run appends its timings and peak memory to a json history, `compare` checks
+the last run of the history against the baseline and fails on regressions.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Iterable, List, Optional, Tuple
+from definition import ROOT_DIR
+from src.chain import Chain
+from src.generate_lef import GenerateLef
+from src.lef_parser import LefParser
+from src.stats import RunStats
+
+# Cells x pins per cell, from 10^3 to 10^6 pins.
+DEFAULT_GRID = ((1, 1_000), (10, 1_000), (10, 10_000), (100, 10_000))
+# Chaining runs `Chain.route` on the pins of one cell, with a dense matrix up to DENSE_LIMIT pins,
+# the k nearest neighbours graph up to CHAIN_LIMIT pins and not at all above.
+DENSE_LIMIT = 2_000
+CHAIN_LIMIT = 10_000
+NEIGHBORS = 10
+# Phases of the RunStats of the route reported on their own, see `Chain.get_path`.
+ROUTE_PHASES = ('neighbors', 'initial_path', 'dist_matrix', 'model', 'solve', 'walk')
+SOLVE_TIME_LIMIT = 2.0
+REGRESSION_THRESHOLD = 0.2
+# Differences below these are noise, never regressions.
+MIN_SECONDS = 0.01
+MIN_BYTES = 1 << 20
+# Modules imported by the generate and parse commands, their import time budget in seconds
+# and the modules they must not import.
+STARTUP_MODULES = ('src.generate_lef', 'src.lef_parser')
+STARTUP_BUDGET = 0.3
+HEAVY_MODULES = ('pandas', 'ortools')
+HISTORY_FILE = f"{ROOT_DIR}/benchmarks/history.json"
+BASELINE_FILE = f"{ROOT_DIR}/benchmarks/baseline.json"
+
+
+def measure(function: Callable,
+            setup: Optional[Callable[[], tuple]] = None,
+            memory: bool = True) -> Tuple[object, dict]:
+    """Time a function, then run it again under tracemalloc to get its peak memory.
+
+    Args:
+        function (Callable): Function to measure.
+        setup (Callable[[], tuple], optional): Builds the arguments of the function, not measured. Defaults to None.
+        memory (bool, optional): Measure the peak memory, the function runs twice. Defaults to True.
+
+    Returns:
+        Tuple[object, dict]: Result of the function and its seconds and peak_bytes.
+    """
+    args = setup() if setup else ()
+    begin = time.perf_counter()
+    result = function(*args)
+    metrics = {'seconds': time.perf_counter() - begin, 'peak_bytes': None}
+    if memory:
+        args = setup() if setup else ()
+        tracemalloc.start()
+        try:
+            function(*args)
+            metrics['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, metrics
+
+
+def bench_size(cells: int, pins: int, work_dir: str, memory: bool = True) -> List[dict]:
+    """Run every phase on a generated library.
+
+    Args:
+        cells (int): Number of cells.
+        pins (int): Number of pins per cell.
+        work_dir (str): Directory of the generated lef.
+        memory (bool, optional): Measure the peak memory of each phase. Defaults to True.
+
+    Returns:
+        List[dict]: One result per phase with cells, pins, phase, seconds and peak_bytes,
+            and the length of the chain for the route phase. The ROUTE_PHASES of the route
+            have no peak_bytes.
+    """
+    lef_path = os.path.join(work_dir, f"{cells}_cells_{pins}_pins.lef")
+    results = []
+
+    def record(phase: str, function: Callable, setup: Optional[Callable] = None) -> object:
+        result, metrics = measure(function, setup, memory)
+        results.append({'cells': cells, 'pins': pins, 'phase': phase, **metrics})
+        return result
+
+    record('generate', lambda: GenerateLef(cells, pins, seed=0).stream_lef(lef_path))
+    record('parse', lambda: sum(1 for _ in LefParser(lef_path).iter_events()))
+    record('get_cells', lambda: LefParser(lef_path).get_cells())
+    table = record('pin_table', lambda: LefParser(lef_path).to_pin_table())
+    if pins > CHAIN_LIMIT:
+        return results
+    cell = table[table['macro_id'] == 0].reset_index(drop=True)
+    k = None if pins <= DENSE_LIMIT else NEIGHBORS
+    chained = record('route', lambda: Chain.route(cell.copy(), 0, len(cell) - 1, k=k, time_limit=SOLVE_TIME_LIMIT,
+                                                  stats=RunStats()))
+    results[-1]['length'] = chained.attrs['length']
+    stats = chained.attrs['stats']
+    results += [{'cells': cells, 'pins': pins, 'phase': phase, 'seconds': stats.phases[phase], 'peak_bytes': None}
+                for phase in ROUTE_PHASES if phase in stats.phases]
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Get the commit of the working tree.
+
+    Returns:
+        Optional[str]: Commit hash, None outside of a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(grid: Iterable[Tuple[int, int]] = DEFAULT_GRID, memory: bool = True) -> dict:
+    """Benchmark every size of the grid.
+
+    Args:
+        grid (Iterable[Tuple[int, int]], optional): Cells and pins per cell of each library. Defaults to DEFAULT_GRID.
+        memory (bool, optional): Measure the peak memory of each phase. Defaults to True.
+
+    Returns:
+        dict: Run with its date, commit, platform and results.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for cells, pins in grid:
+            results += bench_size(cells, pins, work_dir, memory)
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+
+
+def load_runs(path: str) -> List[dict]:
+    """Load a json history, or a single run like the baseline.
+
+    Args:
+        path (str): Path of the json file.
+
+    Returns:
+        List[dict]: Runs, oldest first, empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as json_stream:
+        runs = json.load(json_stream)
+    return runs if isinstance(runs, list) else [runs]
+
+
+def save_json(path: str, content: object) -> None:
+    """Write a json file.
+
+    Args:
+        path (str): Path of the json file.
+        content (object): Content.
+    """
+    with open(path, 'w', encoding='utf-8') as json_stream:
+        json.dump(content, json_stream, indent=1)
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> List[dict]:
+    """Compare the results of two runs.
+    A phase regresses when its time or peak memory grows by more than threshold, and by
+    more than MIN_SECONDS or MIN_BYTES.
+
+    Args:
+        current (dict): Run to check.
+        baseline (dict): Reference run.
+        threshold (float, optional): Relative growth allowed. Defaults to REGRESSION_THRESHOLD.
+
+    Returns:
+        List[dict]: One row per phase of both runs with cells, pins, phase, metric, baseline,
+            current, ratio and regression.
+    """
+    reference = {(result['cells'], result['pins'], result['phase']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = (result['cells'], result['pins'], result['phase'])
+        if key not in reference:
+            continue
+        for metric, noise in (('seconds', MIN_SECONDS), ('peak_bytes', MIN_BYTES)):
+            before, after = reference[key][metric], result[metric]
+            if before is None or after is None:
+                continue
+            ratio = after / before if before else float('inf') if after else 1.0
+            rows.append({'cells': key[0], 'pins': key[1], 'phase': key[2], 'metric': metric, 'baseline': before,
+                         'current': after, 'ratio': ratio,
+                         'regression': ratio > 1 + threshold and after - before > noise})
+    return rows
+
+
+def parse_grid(grid: str) -> List[Tuple[int, int]]:
+    """Parse a grid argument.
+
+    Args:
+        grid (str): Comma separated <cells>x<pins>, e.g. 1x1000,10x1000.
+
+    Returns:
+        List[Tuple[int, int]]: Cells and pins per cell of each library.
+    """
+    return [tuple(int(value) for value in size.split('x')) for size in grid.split(',')]
+
+
+def startup(module: str, repeat: int = 3) -> dict:
+    """Import a module in new interpreters.
+
+    Args:
+        module (str): Module name.
+        repeat (int, optional): Number of interpreters, the fastest import is kept. Defaults to 3.
+
+    Returns:
+        dict: seconds of the import and the HEAVY_MODULES it loaded.
+    """
+    code = (f"import sys, time; begin = time.perf_counter(); import {module}; print(time.perf_counter() - begin); "
+            f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    seconds, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True,
+                                check=True).stdout.split('\n')
+        seconds.append(float(output[0]))
+        heavy = output[1].split()
+    return {'module': module, 'seconds': min(seconds), 'heavy': heavy}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point.
+
+    Args:
+        argv (List[str], optional): Arguments, sys.argv if None. Defaults to None.
+
+    Returns:
+        int: Exit code, 1 if compare found a regression.
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench', description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='benchmark the grid and append the run to the history')
+    run_parser.add_argument('--grid', type=parse_grid, default=DEFAULT_GRID, help='e.g. 1x1000,10x1000')
+    run_parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    run_parser.add_argument('--history', default=HISTORY_FILE)
+    run_parser.add_argument('--save-baseline', nargs='?', const=BASELINE_FILE, default=None,
+                            help='also save the run as the baseline')
+    compare_parser = commands.add_parser('compare', help='compare the last run of the history with the baseline')
+    compare_parser.add_argument('--history', default=HISTORY_FILE)
+    compare_parser.add_argument('--baseline', default=BASELINE_FILE)
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    startup_parser = commands.add_parser('startup', help='check the import time of the generate and parse modules')
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET)
+    args = parser.parse_args(argv)
+
+    if args.command == 'startup':
+        failed = False
+        for module in STARTUP_MODULES:
+            result = startup(module)
+            over = result['seconds'] > args.budget or result['heavy']
+            failed = failed or bool(over)
+            heavy = f" imports {', '.join(result['heavy'])}" if result['heavy'] else ''
+            print(f"{module:<20} {result['seconds']:9.3f} s{heavy} {'OVER BUDGET' if over else ''}")
+        return 1 if failed else 0
+
+    if args.command == 'run':
+        current = run(args.grid, memory=not args.no_memory)
+        save_json(args.history, load_runs(args.history) + [current])
+        if args.save_baseline:
+            save_json(args.save_baseline, current)
+        for result in current['results']:
+            peak = f"{result['peak_bytes'] / 1e6:10.1f} MB" if result['peak_bytes'] is not None else ''
+            print(f"{result['cells']:>6} x {result['pins']:<7} {result['phase']:<12} {result['seconds']:9.3f} s {peak}")
+        return 0
+
+    runs, baselines = load_runs(args.history), load_runs(args.baseline)
+    if not runs or not baselines:
+        print(f"Nothing to compare, run `{parser.prog} run` and `{parser.prog} run --save-baseline` first")
+        return 1
+    rows = compare(runs[-1], baselines[-1], args.threshold)
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"{row['cells']:>6} x {row['pins']:<7} {row['phase']:<12} {row['metric']:<10} "
+              f"{row['baseline']:>14.4g} {row['current']:>14.4g} {row['ratio']:7.2f} {flag}")
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
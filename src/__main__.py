@@ -0,0 +1,144 @@
+"""
+Command line of the lef generation, parsing and chaining.
+
+    python -m src generate CELLS PINS [-o dummy.lef] [--seed 0] [--processes 4]
+    python -m src parse LEF [--cache] [--table pins.csv]
+    python -m src chain LEF [--cell cell_0] [--start 0] [--end 1] [-o chain.csv]
+    python -m src chain LEF --per-cell -o chains.csv
+
+Modules are imported by the command that needs them, so `generate` and `parse`
+never load ortools, nor pandas unless `parse --table` writes the pin table.
+"""
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+
+def generate(args: argparse.Namespace) -> int:
+    """Write a generated lef.
+
+    Args:
+        args (argparse.Namespace): cells, pins, output, seed and processes
+
+    Returns:
+        int: Exit code
+    """
+    from src.generate_lef import GenerateLef
+    begin = time.perf_counter()
+    GenerateLef(args.cells, args.pins, seed=args.seed).stream_lef(args.output, processes=args.processes)
+    print(f"{args.cells} cells of {args.pins} pins written to {args.output} in {time.perf_counter() - begin:.3f} s")
+    return 0
+
+
+def parse(args: argparse.Namespace) -> int:
+    """Parse a lef and print its size and the parsing speed.
+
+    Args:
+        args (argparse.Namespace): lef, cache and table
+
+    Returns:
+        int: Exit code
+    """
+    from src.lef_parser import LefParser
+    from src.stats import RunStats
+    cache = None
+    if args.cache:
+        from src.lef_cache import LefCache
+        cache = LefCache()
+    stats = RunStats()
+    lef_parser = LefParser(args.lef, cache=cache, stats=stats)
+    if args.table:
+        lef_parser.to_pin_table().to_csv(args.table, index=False)
+    else:
+        lef_parser.get_cells()
+    metrics = stats.metrics
+    print(f"{metrics['cells']} cells, {metrics['pins']} pins, {metrics['bytes'] / 1e6:.1f} MB "
+          f"in {sum(stats.phases.values()):.3f} s ({metrics['bytes_per_second'] / 1e6:.1f} MB/s)")
+    return 0
+
+
+def chain(args: argparse.Namespace) -> int:
+    """Chain the pins of a lef, or of one of its cells, and print the length of the chain.
+
+    Args:
+        args (argparse.Namespace): lef, cell, start, end, output, per_cell and the options of `Chain.route`
+
+    Returns:
+        int: Exit code, 1 if the cell is not in the lef
+    """
+    options = {'k': args.k, 'metric': args.metric, 'engine': args.engine, 'time_limit': args.time_limit,
+               'perimeter': args.perimeter}
+    if args.per_cell:
+        from src.pipeline import chain_lef
+        summary = chain_lef(args.lef, args.output, processes=args.processes, start=args.start[0], end=args.end[0],
+                            **options)
+        print(f"{summary['cells']} cells, {summary['pins']} pins chained in {summary['seconds']:.3f} s, "
+              f"length {summary['length']:.3f}")
+        return 0
+    from src.chain import Chain
+    from src.lef_parser import LefParser
+    table = LefParser(args.lef).to_pin_table()
+    if args.cell:
+        table = table[table['macro'] == args.cell].reset_index(drop=True)
+        if table.empty:
+            print(f"No pin found in cell {args.cell}", file=sys.stderr)
+            return 1
+    start, end = args.start[0] if len(args.start) == 1 else args.start, args.end[0] if len(args.end) == 1 else args.end
+    begin = time.perf_counter()
+    table = Chain.route(table, start, end, hierarchical=args.hierarchical, processes=args.processes,
+                        target_gap=args.target_gap, **options)
+    seconds = time.perf_counter() - begin
+    if args.output:
+        columns = ['macro', 'pin', 'x', 'y', 'chain_id', 'order']
+        table.sort_values(['chain_id', 'order'])[columns].to_csv(args.output, index=False)
+    gap = f", gap {table.attrs['gap']:.1%}" if 'gap' in table.attrs else ''
+    print(f"{len(table)} pins chained in {seconds:.3f} s, length {table.attrs['length']:.3f}{gap}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point.
+
+    Args:
+        argv (List[str], optional): Arguments, sys.argv if None. Defaults to None.
+
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(prog='python -m src', description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='write a generated lef')
+    generate_parser.add_argument('cells', type=int)
+    generate_parser.add_argument('pins', type=int, help='pins of each cell')
+    generate_parser.add_argument('-o', '--output', default='dummy.lef', help='name in lef_files or absolute path')
+    generate_parser.add_argument('--seed', type=int, default=None)
+    generate_parser.add_argument('--processes', type=int, default=1)
+    parse_parser = commands.add_parser('parse', help='parse a lef and print its size and the parsing speed')
+    parse_parser.add_argument('lef', help='name in lef_files or path')
+    parse_parser.add_argument('--cache', action='store_true', help='read and fill the binary cache of parsed lefs')
+    parse_parser.add_argument('--table', default=None, help='write the pin table to this csv')
+    chain_parser = commands.add_parser('chain', help='chain the pins of a lef')
+    chain_parser.add_argument('lef', help='name in lef_files or path')
+    chain_parser.add_argument('--cell', default=None, help='only chain the pins of this cell')
+    chain_parser.add_argument('--start', type=int, nargs='+', default=[0], help='start pin row of each chain')
+    chain_parser.add_argument('--end', type=int, nargs='+', default=[1], help='end pin row of each chain')
+    chain_parser.add_argument('-o', '--output', default=None, help='write the chained pins to this csv')
+    chain_parser.add_argument('--engine', default='ortools', choices=('ortools', 'heuristic'))
+    chain_parser.add_argument('-k', type=int, default=None, help='nearest neighbours of the sparse mode')
+    chain_parser.add_argument('--metric', default='euclidean', choices=('euclidean', 'manhattan', 'chebyshev'))
+    chain_parser.add_argument('--time-limit', type=float, default=None, help='seconds of each solve')
+    chain_parser.add_argument('--target-gap', type=float, default=None, help='stop within this gap to the lower bound')
+    chain_parser.add_argument('--hierarchical', action='store_true', help='chain cell by cell')
+    chain_parser.add_argument('--perimeter', action='store_true', help='walk along the border of boundary pins')
+    chain_parser.add_argument('--processes', type=int, default=None)
+    chain_parser.add_argument('--per-cell', action='store_true',
+                              help='chain each cell on its own while the lef is parsed, needs --output')
+    args = parser.parse_args(argv)
+    if args.command == 'chain' and args.per_cell and not args.output:
+        parser.error("--per-cell needs --output")
+    return {'generate': generate, 'parse': parse, 'chain': chain}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Lower bounds of the length of chains, to tell how far a chain is from optimal.
+A set of chains is a spanning forest with one tree per chain, in which every pin
+has two links except the chain ends, so both the minimum spanning forest and the
+distances to the nearest neighbours of each pin bound its length from below.
+"""
+from typing import Optional, Sequence
+import numpy as np
+from src.spatial_index import GridIndex, metric_dist
+
+DEFAULT_BOUND_NEIGHBORS = 10
+
+
+def neighbor_distances(locations: np.ndarray, neighbors: np.ndarray, metric: str = 'euclidean') -> np.ndarray:
+    """Distance from each location to each of its neighbours.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        neighbors (np.ndarray): (n, k) array of neighbour indexes, closest first
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+    Returns:
+        np.ndarray: (n, k) array of distances
+    """
+    delta = locations[:, np.newaxis, :] - locations[neighbors]
+    return metric_dist(delta[..., 0], delta[..., 1], metric)
+
+
+def neighbor_bound(distances: np.ndarray, ends: Sequence[int]) -> float:
+    """Half the sum, over the pins, of the distances to their nearest neighbours, two for
+    inner pins and one for chain ends, since each link is counted by both of its pins.
+
+    Args:
+        distances (np.ndarray): (n, k) distances to the nearest neighbours, closest first, k >= 2
+        ends (Sequence[int]): Start and end index of every chain
+
+    Returns:
+        float: Lower bound of the total length
+    """
+    total = distances[:, 0].sum() + distances[:, 1].sum() - distances[np.asarray(ends, dtype=np.int64), 1].sum()
+    return float(total / 2)
+
+
+def spanning_bound(neighbors: np.ndarray, distances: np.ndarray, chains: int = 1) -> float:
+    """Lower bound of the minimum spanning forest with one tree per chain, from the k nearest neighbours graph.
+    The forest weight is the integral over t of the number of components of the links shorter than t,
+    minus the number of chains. A link missing from the graph is longer than the k-th neighbour
+    distance of both of its pins, so at t a component can only merge through a missing link if one of
+    its pins is past its k-th neighbour distance. Counting those components as one at most gives a number
+    of components never above the real one, hence a valid bound, equal to the exact forest when no
+    missing link is needed. Pins past their k-th neighbour distance are linked to an extra node, so the
+    counted components are those of the minimum spanning forest of this graph, see `spanning_forest`.
+
+    Args:
+        neighbors (np.ndarray): (n, k) array of neighbour indexes, closest first
+        distances (np.ndarray): (n, k) distances to the neighbours
+        chains (int, optional): Number of chains. Defaults to 1.
+
+    Returns:
+        float: Lower bound of the total length
+    """
+    n_points, k = neighbors.shape
+    if n_points <= chains or k == 0:
+        return 0.0
+    sources = np.repeat(np.arange(n_points), k)
+    targets = neighbors.ravel()
+    # Each link once, including the links in the neighbours of only one of their pins.
+    keep = (sources < targets) | ~(neighbors[targets] == sources[:, np.newaxis]).any(axis=1)
+    sources, targets, weights = sources[keep], targets[keep], distances.ravel()[keep]
+    # Every link is in the graph when each pin has all the others as neighbours, and no pin saturates.
+    if k < n_points - 1:
+        # The components without the extra node are counted, the ones merged into it count as one.
+        saturation = distances[:, -1]
+        sources = np.concatenate([sources, np.arange(n_points)])
+        targets = np.concatenate([targets, np.full(n_points, n_points)])
+        weights = np.concatenate([weights, saturation])
+        first_saturation = saturation.min()
+    else:
+        first_saturation = np.inf
+    sort = np.argsort(weights, kind='stable')
+    # The components only change on the links of the minimum spanning forest.
+    times = weights[sort][spanning_forest(sources[sort], targets[sort], n_points + 1)]
+    steps = np.unique(np.concatenate([[0.0], times, [first_saturation]]))
+    steps = steps[np.isfinite(steps)]
+    counted = n_points - np.searchsorted(times, steps, side='right') + (steps >= first_saturation)
+    return float(np.sum(np.maximum(counted[:-1] - chains, 0) * np.diff(steps)))
+
+
+def spanning_forest(sources: np.ndarray, targets: np.ndarray, n_points: int) -> np.ndarray:
+    """Minimum spanning forest of a graph with Borůvka's algorithm, vectorised over the components.
+    Each round links every component to its cheapest link to another component, which at least
+    halves the number of components, so there are at most log2(n_points) rounds.
+
+    Args:
+        sources (np.ndarray): First pin of each link, links sorted by weight
+        targets (np.ndarray): Second pin of each link
+        n_points (int): Number of pins
+
+    Returns:
+        np.ndarray: Sorted indexes of the links of the forest
+    """
+    labels = np.arange(n_points)
+    links = np.arange(len(sources))
+    forest = []
+    while len(links):
+        firsts, seconds = labels[sources[links]], labels[targets[links]]
+        between = firsts != seconds
+        links, firsts, seconds = links[between], firsts[between], seconds[between]
+        if not len(links):
+            break
+        # Links are sorted by weight, so the smallest index is the cheapest link, ties included.
+        cheapest = np.full(n_points, len(sources))
+        np.minimum.at(cheapest, firsts, links)
+        np.minimum.at(cheapest, seconds, links)
+        roots = np.flatnonzero(cheapest < len(sources))
+        chosen = cheapest[roots]
+        forest.append(np.unique(chosen))
+        # Point each component to the other end of its cheapest link. Two components pointing to
+        # each other picked the same link, the smallest label of the two becomes the root.
+        pointers = np.arange(n_points)
+        ends = labels[sources[chosen]]
+        pointers[roots] = np.where(ends == roots, labels[targets[chosen]], ends)
+        mutual = (pointers[pointers] == np.arange(n_points)) & (pointers > np.arange(n_points))
+        pointers[mutual] = np.flatnonzero(mutual)
+        while True:
+            jumped = pointers[pointers]
+            if np.array_equal(jumped, pointers):
+                break
+            pointers = jumped
+        labels = pointers[labels]
+    return np.sort(np.concatenate(forest)) if forest else np.zeros(0, dtype=np.int64)
+
+
+def lower_bound(locations: np.ndarray,
+                starts: Sequence[int],
+                ends: Sequence[int],
+                k: int = DEFAULT_BOUND_NEIGHBORS,
+                metric: str = 'euclidean',
+                neighbors: Optional[np.ndarray] = None) -> float:
+    """Lower bound of the total length of chains from each start to its end covering every location.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        starts (Sequence[int]): Start index of each chain
+        ends (Sequence[int]): End index of each chain
+        k (int, optional): Number of nearest neighbours of the graph. Defaults to DEFAULT_BOUND_NEIGHBORS.
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+        neighbors (np.ndarray, optional): Precomputed (n, k) neighbour indexes, closest first. Defaults to None.
+
+    Returns:
+        float: Largest of the spanning forest bound, the nearest neighbours bound and,
+            for a single chain, the distance from start to end
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    starts, ends = np.atleast_1d(starts), np.atleast_1d(ends)
+    delta = locations[starts] - locations[ends]
+    bounds = [float(metric_dist(delta[:, 0], delta[:, 1], metric).max()) if len(starts) == 1 else 0.0]
+    if neighbors is None:
+        neighbors = GridIndex(locations).knn(k, metric)
+    if neighbors.shape[1]:
+        distances = neighbor_distances(locations, neighbors, metric)
+        bounds.append(spanning_bound(neighbors, distances, len(starts)))
+        if neighbors.shape[1] >= 2:
+            bounds.append(neighbor_bound(distances, np.concatenate([starts, ends])))
+    return max(bounds)
@@ -1,7 +1,31 @@
-import pandas as pd
-from math import hypot
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from src import bounds, heuristic
+from src.perimeter import perimeter_path
+from src.spatial_index import GridIndex, metric_dist, scalar_dist
+from src.stats import NULL_STATS, RunStats
+
+# pandas and ortools are only imported when a chain is solved, so that importing the module stays fast.
+if TYPE_CHECKING:
+    import pandas as pd
+    from ortools.constraint_solver import pywrapcp
+    from src.geometry_cache import GeometryCache
+
+DIST_SCALE = 1000
+FORBIDDEN_ARC_COST = 2**31
+ENGINES = ('ortools', 'heuristic')
+DEFAULT_FIRST_SOLUTION = 'LOCAL_CHEAPEST_INSERTION'
+UNBOUNDED_METAHEURISTICS = ('GUIDED_LOCAL_SEARCH', 'SIMULATED_ANNEALING', 'TABU_SEARCH', 'GENERIC_TABU_SEARCH')
+BALANCES = ('pins', 'length')
+# Weight of the longest chain against the total length when balancing the length of several chains.
+SPAN_COST = 100
+# Default number of local search moves allowed per changed pin when repairing a chain.
+ECO_MOVES_PER_CHANGE = 50
 
 
 class Chain:
@@ -21,88 +45,1124 @@ class Chain:
             self.errmsg = errmsg
 
     @staticmethod
-    def route(df: pd.DataFrame,
-              start: int,
-              end: int) -> pd.DataFrame:
+    def route(df: 'pd.DataFrame',
+              start: Union[int, Sequence[int]],
+              end: Union[int, Sequence[int]],
+              scale: float = DIST_SCALE,
+              dtype: type = np.int64,
+              k: Optional[int] = None,
+              metric: str = 'euclidean',
+              engine: str = 'ortools',
+              time_limit: Optional[float] = None,
+              first_solution: str = DEFAULT_FIRST_SOLUTION,
+              metaheuristic: Optional[str] = None,
+              solution_limit: Optional[int] = None,
+              on_solution: Optional[Callable[[float, float], None]] = None,
+              hierarchical: bool = False,
+              processes: Optional[int] = None,
+              stats: Optional[RunStats] = None,
+              balance: str = 'pins',
+              perimeter: bool = False,
+              lower_bound: bool = False,
+              target_gap: Optional[float] = None,
+              cache: Optional['GeometryCache'] = None) -> 'pd.DataFrame':
         """Chain the df (dataframe) from start index to end index. Chain must contain x, y coordinate, pin name and macro name.
+        When k is given, the chain only uses arcs of the k nearest neighbours graph and distances
+        are computed on demand, so memory grows with n * k instead of n * n.
+        The heuristic engine replaces ortools by a nearest neighbour path improved with 2-opt and Or-opt,
+        see `src.heuristic`. When hierarchical, each macro is chained on its own in a process pool and the macros
+        are then chained together, see `get_hierarchical_path`.
+        With a time limit the best chain found when the time is over is returned, and on_solution
+        is called with the length and the elapsed seconds of every improved chain.
+        Given a RunStats, the time of each phase and the size and solver metrics are recorded in it,
+        and it is also returned in `df.attrs['stats']`.
+        Given several start and end indexes, the pins are split into one chain per pair,
+        balanced by pin count or by length, see `get_multi_path`.
+        The total length of the chains is returned in `df.attrs['length']`. With lower_bound or a target gap,
+        a lower bound of the optimal length, see `src.bounds`, and the gap of the chains to this bound are
+        also returned in `df.attrs['lower_bound']` and `df.attrs['gap']`.
+        Given a GeometryCache, the distance matrix and the nearest neighbours of a single chain and of the
+        lower bound are kept between calls on the same locations, see `src.geometry_cache`.
 
 
         Args:
             df (pd.DataFrame): Pandas dataframe
-            start (int): Start index of df
-            end (int): End index of df
+            start (int | Sequence[int]): Start index of df, or start index of each chain
+            end (int | Sequence[int]): End index of df, or end index of each chain
+            scale (float, optional): Factor applied to distances before rounding them to integers. Defaults to DIST_SCALE.
+            dtype (type, optional): Integer type of the distance matrix, np.int32 or np.int64. Defaults to np.int64.
+            k (int, optional): Number of nearest neighbours for the sparse mode, dense matrix if None. Defaults to None.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            engine (str, optional): Solver backend, ortools or heuristic. Defaults to 'ortools'.
+            time_limit (float, optional): Time budget of each solve in seconds, unlimited if None. Defaults to None.
+            first_solution (str, optional): ortools FirstSolutionStrategy name. Defaults to DEFAULT_FIRST_SOLUTION.
+            metaheuristic (str, optional): ortools LocalSearchMetaheuristic name, e.g. GUIDED_LOCAL_SEARCH.
+                Metaheuristics never stop on their own and need a time or solution limit. Defaults to None.
+            solution_limit (int, optional): Maximum number of solutions explored by ortools. Defaults to None.
+            on_solution (Callable[[float, float], None], optional): Called with the length and elapsed seconds of
+                each improved chain. The hierarchical mode and the pins balance solve the chains in parts, possibly
+                in worker processes, and only call it once in this process with the final length, so it does
+                not need to be picklable. Defaults to None.
+            hierarchical (bool, optional): Chain macro by macro. Defaults to False.
+            processes (int, optional): Number of worker processes of the hierarchical mode,
+                number of cpus if None. Defaults to None.
+            stats (RunStats, optional): Filled with phase timings and metrics, see `src.stats`. The sub chains
+                of the hierarchical mode are only timed as a whole. Defaults to None.
+            balance (str, optional): Balance of several chains, pins or length. Defaults to 'pins'.
+            perimeter (bool, optional): Chain pins lying on their bounding box by walking along it,
+                see `src.perimeter`. Other chains use the engine. Defaults to False.
+            lower_bound (bool, optional): Compute a lower bound of the length. Defaults to False.
+            target_gap (float, optional): Stop a single chain solve as soon as its length is at most
+                (1 + target_gap) times the lower bound. Defaults to None.
+            cache (GeometryCache, optional): Cache of the distance matrix and neighbours. Defaults to None.
 
         Raises:
             Chain.ChainException: Start and End index can't be same.
+            Chain.ChainException: One start and one end index per chain.
             Chain.ChainException: Head must contain x, y, pin, macro.
+            Chain.ChainException: Several chains in the hierarchical mode.
 
         Returns:
-            pd.DataFrame: Dataframe having order column added
+            pd.DataFrame: Dataframe having chain_id and order columns added, order is the position in the chain
+        """
+        starts, ends = Chain._get_ends(df, start, end)
+        if hierarchical and len(starts) > 1:
+            raise Chain.ChainException("The hierarchical mode builds a single chain")
+        locations = df[['x', 'y']].to_numpy(dtype=np.float64)
+        options = {'scale': scale, 'dtype': dtype, 'k': k, 'metric': metric, 'engine': engine,
+                   'time_limit': time_limit, 'first_solution': first_solution, 'metaheuristic': metaheuristic,
+                   'solution_limit': solution_limit, 'on_solution': on_solution, 'perimeter': perimeter}
+        run_stats = stats if stats is not None else NULL_STATS
+        bound, target_length = None, None
+        if lower_bound or target_gap is not None:
+            with run_stats.phase('lower_bound'):
+                neighbors = None
+                if cache is not None:
+                    neighbors = cache.neighbors(locations, bounds.DEFAULT_BOUND_NEIGHBORS, metric)
+                bound = bounds.lower_bound(locations, starts, ends, metric=metric, neighbors=neighbors)
+            if target_gap is not None:
+                target_length = (1 + target_gap) * bound
+        with run_stats.phase('route'):
+            if hierarchical:
+                with run_stats.phase('hierarchical'):
+                    paths = [Chain.get_hierarchical_path(locations, df['macro'].to_numpy(), starts[0], ends[0],
+                                                         processes, **options)]
+            elif len(starts) > 1:
+                paths = Chain.get_multi_path(locations, starts, ends, balance, processes, stats=stats, **options)
+            else:
+                paths = [Chain.get_path(locations, starts[0], ends[0], stats=stats, target_length=target_length,
+                                        cache=cache, **options)]
+            df['chain_id'], df['order'] = Chain.paths_to_order(paths)
+        Chain._set_length(df, locations, paths, metric, bound)
+        run_stats.set('length', df.attrs['length'])
+        if bound is not None:
+            run_stats.set('lower_bound', bound)
+            run_stats.set('gap', df.attrs['gap'])
+        if stats is not None:
+            stats.set('nodes', len(locations))
+            df.attrs['stats'] = stats
+        return df
+
+    @staticmethod
+    def _set_length(df: 'pd.DataFrame',
+                    locations: np.ndarray,
+                    paths: List[np.ndarray],
+                    metric: str = 'euclidean',
+                    bound: Optional[float] = None) -> None:
+        """Set the length of the chains in `df.attrs`, and their lower bound and gap when there is one, see `route`.
+
+        Args:
+            df (pd.DataFrame): Chained dataframe
+            locations (np.ndarray): (n, 2) array of coordinates of df
+            paths (List[np.ndarray]): indexes by order of routing, for each chain
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            bound (float, optional): Lower bound of the length. Defaults to None.
         """
-        if start == end:
-            raise Chain.ChainException("Start chaining index can't be the same as the end")
+        df.attrs['length'] = sum(heuristic.path_length(locations, path, metric) for path in paths)
+        if bound is not None:
+            df.attrs['lower_bound'] = bound
+            df.attrs['gap'] = df.attrs['length'] / bound - 1 if bound > 0 else 0.0
+
+    @staticmethod
+    def _get_ends(df: 'pd.DataFrame',
+                  start: Union[int, Sequence[int]],
+                  end: Union[int, Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Check the columns of a df and its start and end indexes, see `route`.
+
+        Args:
+            df (pd.DataFrame): Pandas dataframe
+            start (int | Sequence[int]): Start index of df, or start index of each chain
+            end (int | Sequence[int]): End index of df, or end index of each chain
+
+        Raises:
+            Chain.ChainException: Start and End index can't be same.
+            Chain.ChainException: One start and one end index per chain.
+            Chain.ChainException: Head must contain x, y, pin, macro.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: start and end index of each chain
+        """
+        starts = np.atleast_1d(np.asarray(start, dtype=np.int64))
+        ends = np.atleast_1d(np.asarray(end, dtype=np.int64))
+        if len(starts) != len(ends):
+            raise Chain.ChainException(f"{len(starts)} start indexes for {len(ends)} end indexes")
+        if len(np.unique(np.concatenate([starts, ends]))) != 2 * len(starts):
+            raise Chain.ChainException("Start chaining index can't be the same as the end or another chain's start or end")
         for column in {'x', 'y', 'pin', 'macro'}:
             if column not in df.head():
                 raise Chain.ChainException(f"{column} not found in dataframe")
-        locations: list[tuple[int, int]] = [(x, y) for (x, y) in zip(df['x'], df['y'])]
+        return starts, ends
+
+    @staticmethod
+    def route_many(jobs: Iterable[Tuple['pd.DataFrame', Union[int, Sequence[int]], Union[int, Sequence[int]]]],
+                   pool: Optional['RoutePool'] = None,
+                   processes: Optional[int] = None,
+                   ordered: bool = True,
+                   chunksize: Optional[int] = None,
+                   balance: str = 'pins',
+                   lower_bound: bool = False,
+                   target_gap: Optional[float] = None,
+                   **options) -> Iterator[Tuple[int, 'pd.DataFrame']]:
+        """Chain many independent dataframes in a pool of worker processes, as `route` does for one.
+        The jobs are checked, their coordinates written once in a shared memory block and every job
+        submitted before this returns, each worker reads its slice of the block so no dataframe is
+        pickled. Workers start once per pool, pass a RoutePool to keep them, and ortools warmed up,
+        between calls. The shared memory and the pool started for the call are released once the
+        returned iterator is exhausted, closed or garbage collected.
+        As with `route`, the chain_id and order columns are added to the dataframes of the jobs in place,
+        and the length of their chains, and their lower bound and gap when asked for, set in their attrs.
+
+        Args:
+            jobs (Iterable[Tuple[pd.DataFrame, int | Sequence[int], int | Sequence[int]]]): df, start and end
+                of each job, as given to `route`
+            pool (RoutePool, optional): Worker pool, a pool is started for this call if None. Defaults to None.
+            processes (int, optional): Number of workers of the pool started for this call,
+                number of cpus if None. Defaults to None.
+            ordered (bool, optional): Yield the jobs in order, else as soon as they are chained. Defaults to True.
+            chunksize (int, optional): Number of jobs sent to a worker at once,
+                a quarter of the jobs of each worker if None. Defaults to None.
+            balance (str, optional): Balance of the jobs with several chains, pins or length. Defaults to 'pins'.
+            lower_bound (bool, optional): Compute a lower bound of the length of each job. Defaults to False.
+            target_gap (float, optional): Stop the solve of a job with a single chain as soon as its length is at
+                most (1 + target_gap) times its lower bound. Defaults to None.
+            **options: Picklable options of `get_path`. on_solution is not sent to the workers, it is called
+                in this process with the length of each job and the seconds since the call, as the job is yielded.
+
+        Raises:
+            Chain.ChainException: Invalid df, start or end of a job.
+
+        Returns:
+            Iterator[Tuple[int, pd.DataFrame]]: position of each job and its df
+        """
+        begin = time.perf_counter()
+        jobs = list(jobs)
+        job_ends = [Chain._get_ends(df, start, end) for df, start, end in jobs]
+        on_solution = options.pop('on_solution', None)
+        sizes = [len(df) for df, _, _ in jobs]
+        offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).tolist()
+        own_pool = pool is None
+        pool = pool or RoutePool(processes)
+        resources = {'futures': {}, 'block': None, 'pool': pool if own_pool else None}
+        try:
+            block = resources['block'] = shared_memory.SharedMemory(create=True, size=max(offsets[-1] * 2 * 8, 1))
+            coordinates = np.ndarray((offsets[-1], 2), dtype=np.float64, buffer=block.buf)
+            for (df, _, _), offset, size in zip(jobs, offsets, sizes):
+                coordinates[offset:offset + size] = df[['x', 'y']].to_numpy(dtype=np.float64)
+            del coordinates
+            chunksize = chunksize or max(1, len(jobs) // (4 * pool.processes))
+            for first in range(0, len(jobs), chunksize):
+                items = [(offsets[position], sizes[position], *job_ends[position])
+                         for position in range(first, min(first + chunksize, len(jobs)))]
+                task = (block.name, offsets[-1], items, balance, lower_bound, target_gap, options)
+                resources['futures'][pool.executor.submit(Chain._route_chunk, task)] = first
+        except BaseException:
+            Chain._release(resources)
+            raise
+        results = Chain._iter_routes(jobs, resources, ordered, options.get('metric', 'euclidean'), on_solution, begin)
+        weakref.finalize(results, Chain._release, resources)
+        return results
+
+    @staticmethod
+    def _iter_routes(jobs: list,
+                     resources: dict,
+                     ordered: bool,
+                     metric: str,
+                     on_solution: Optional[Callable[[float, float], None]],
+                     begin: float) -> Iterator[Tuple[int, 'pd.DataFrame']]:
+        """Yield the jobs of `route_many` as their chunks are chained, then release the resources of the call.
+
+        Args:
+            jobs (list): df, start and end of each job
+            resources (dict): futures of the chunks with the position of their first job, shared memory block
+                and pool to close, see `_release`
+            ordered (bool): Yield the jobs in order, else as soon as they are chained.
+            metric (str): euclidean, manhattan or chebyshev.
+            on_solution (Callable[[float, float], None], optional): Called with the length of each job
+                and the seconds since begin.
+            begin (float): perf_counter time of the call.
+
+        Yields:
+            Iterator[Tuple[int, pd.DataFrame]]: position of the job and its df, having chain_id and order columns added
+        """
+        futures = resources['futures']
+        try:
+            for future in (futures if ordered else as_completed(futures)):
+                for position, (paths, bound) in enumerate(future.result(), start=futures[future]):
+                    df = jobs[position][0]
+                    df['chain_id'], df['order'] = Chain.paths_to_order(paths)
+                    Chain._set_length(df, df[['x', 'y']].to_numpy(dtype=np.float64), paths, metric, bound)
+                    if on_solution:
+                        on_solution(df.attrs['length'], time.perf_counter() - begin)
+                    yield position, df
+        finally:
+            Chain._release(resources)
+
+    @staticmethod
+    def _release(resources: dict) -> None:
+        """Cancel the pending chunks of `route_many`, wait for the running ones, then remove the shared
+        memory block and close the pool started for the call. Releasing twice does nothing.
+
+        Args:
+            resources (dict): futures, block and pool, None for a pool given by the caller
+        """
+        futures = resources['futures']
+        # Workers must be done with the block before it is removed.
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        block, pool = resources.pop('block', None), resources.pop('pool', None)
+        if block is not None:
+            block.close()
+            block.unlink()
+        if pool is not None:
+            pool.close()
+
+    @staticmethod
+    def _route_chunk(task: tuple) -> List[Tuple[List[np.ndarray], Optional[float]]]:
+        """Chain jobs whose coordinates are in a shared memory block, worker of `route_many`.
+
+        Args:
+            task (tuple): block name, number of coordinates in the block, offset, size, starts and ends
+                of each job, balance, lower_bound, target_gap and options of `get_path`
+
+        Returns:
+            List[Tuple[List[np.ndarray], Optional[float]]]: paths and lower bound, None if not asked for, of each job
+        """
+        name, total, items, balance, lower_bound, target_gap, options = task
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            coordinates = np.ndarray((total, 2), dtype=np.float64, buffer=block.buf)
+            job_locations = [coordinates[offset:offset + size].copy() for offset, size, _, _ in items]
+            del coordinates
+        finally:
+            block.close()
+        results = []
+        for locations, (_, _, starts, ends) in zip(job_locations, items):
+            bound, target_length = None, None
+            if lower_bound or target_gap is not None:
+                bound = bounds.lower_bound(locations, starts, ends, metric=options.get('metric', 'euclidean'))
+                if target_gap is not None:
+                    target_length = (1 + target_gap) * bound
+            if len(starts) > 1:
+                paths = Chain.get_multi_path(locations, starts, ends, balance, 1, **options)
+            else:
+                paths = [Chain.get_path(locations, starts[0], ends[0], target_length=target_length, **options)]
+            results.append((paths, bound))
+        return results
+
+    @staticmethod
+    def _init_worker() -> None:
+        """Chain three points, so that the first job of a worker doesn't pay the ortools warm up."""
+        Chain.get_path(np.array([(0.0, 0.0), (1.0, 0.0), (0.0, 1.0)]), 0, 1)
+
+    @staticmethod
+    def reroute(df: 'pd.DataFrame',
+                changed: Sequence = (),
+                k: int = heuristic.DEFAULT_NEIGHBORS,
+                metric: str = 'euclidean',
+                max_moves: Optional[int] = None,
+                time_limit: Optional[float] = None) -> 'pd.DataFrame':
+        """Repair the chains of a df already chained by `route` after a small change, instead of chaining it again.
+        Removed pins are rows dropped from the df, added pins are rows without order and moved pins
+        are given as changed rows. Added and moved pins are inserted where they lengthen the chains
+        the least, then a local search bounded by max_moves improves the chains around the changes only,
+        see `heuristic.repair`. The first and last pin of each chain keep their place even when moved.
+
+        Args:
+            df (pd.DataFrame): Pandas dataframe with x, y and order columns, and chain_id for several chains
+            changed (Sequence, optional): Index labels of the moved rows. Defaults to ().
+            k (int, optional): Number of nearest neighbours considered. Defaults to heuristic.DEFAULT_NEIGHBORS.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            max_moves (int, optional): Local search moves of each chain,
+                ECO_MOVES_PER_CHANGE per change if None. Defaults to None.
+            time_limit (float, optional): Time budget of the local search in seconds. Defaults to None.
+
+        Raises:
+            Chain.ChainException: Head must contain x, y, order.
+            Chain.ChainException: Changed rows not in the df.
+            Chain.ChainException: Chain with less than two pins left.
+
+        Returns:
+            pd.DataFrame: Dataframe with repaired chain_id and order columns
+        """
+        for column in ('x', 'y', 'order'):
+            if column not in df.head():
+                raise Chain.ChainException(f"{column} not found in dataframe")
+        locations = df[['x', 'y']].to_numpy(dtype=np.float64)
+        order = df['order'].to_numpy(dtype=np.float64)
+        chain_ids = df['chain_id'].to_numpy(dtype=np.float64) if 'chain_id' in df.head() else np.zeros(len(df))
+        rows = df.index.get_indexer(list(changed))
+        if (rows < 0).any():
+            raise Chain.ChainException(f"{int((rows < 0).sum())} changed rows not found in dataframe")
+        known = ~np.isnan(order) & ~np.isnan(chain_ids)
+        changed_rows = ~known
+        changed_rows[rows] = True
+
+        chains = np.unique(chain_ids[known])
+        paths, seeds = [], []
+        for chain in chains:
+            members = np.flatnonzero(known & (chain_ids == chain))
+            if len(members) < 2:
+                raise Chain.ChainException(f"Chain {chain:g} has less than two pins left")
+            members = members[np.argsort(order[members], kind='stable')]
+            ends = members[[0, -1]]
+            seeds.extend(ends[changed_rows[ends]].tolist())
+            changed_rows[ends] = False
+            path = members[~changed_rows[members]]
+            # Pins next to a removed or moved pin are no longer consecutive in order.
+            gaps = np.flatnonzero(np.diff(order[path]) != 1)
+            seeds.extend(path[gaps].tolist() + path[gaps + 1].tolist())
+            paths.append(path)
+        pending = np.flatnonzero(changed_rows)
+        if max_moves is None:
+            max_moves = ECO_MOVES_PER_CHANGE * (len(pending) + len(seeds))
+        paths = heuristic.repair(locations, paths, pending, seeds, k, metric, max_moves, time_limit)
+        chain_index, df['order'] = Chain.paths_to_order(paths)
+        df['chain_id'] = chains.astype(np.int64)[chain_index]
+        return df
+
+    @staticmethod
+    def paths_to_order(paths: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Invert chains, giving the chain of each index and its position in the chain.
+
+        Args:
+            paths (List[np.ndarray]): indexes by order of routing, for each chain
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: chain and order of each index
+        """
+        chain_ids = np.repeat(np.arange(len(paths)), [len(path) for path in paths])
+        indexes = np.concatenate(paths).astype(np.int64)
+        chain_id = np.empty(len(indexes), dtype=np.int64)
+        chain_id[indexes] = chain_ids
+        order = np.empty(len(indexes), dtype=np.int64)
+        order[indexes] = np.concatenate([np.arange(len(path)) for path in paths])
+        return chain_id, order
+
+    @staticmethod
+    def path_to_order(path: np.ndarray) -> np.ndarray:
+        """Invert a path, giving the position of each index in the chain.
+
+        Args:
+            path (np.ndarray): indexes, by order of routing
+
+        Returns:
+            np.ndarray: order of each index
+        """
+        order = np.empty(len(path), dtype=np.int64)
+        order[np.asarray(path, dtype=np.int64)] = np.arange(len(path))
+        return order
+
+    @staticmethod
+    def get_path(locations: np.ndarray,
+                 start: int,
+                 end: int,
+                 scale: float = DIST_SCALE,
+                 dtype: type = np.int64,
+                 k: Optional[int] = None,
+                 metric: str = 'euclidean',
+                 engine: str = 'ortools',
+                 time_limit: Optional[float] = None,
+                 first_solution: str = DEFAULT_FIRST_SOLUTION,
+                 metaheuristic: Optional[str] = None,
+                 solution_limit: Optional[int] = None,
+                 on_solution: Optional[Callable[[float, float], None]] = None,
+                 stats: Optional[RunStats] = None,
+                 perimeter: bool = False,
+                 target_length: Optional[float] = None,
+                 cache: Optional['GeometryCache'] = None) -> np.ndarray:
+        """Chain locations from start index to end index.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            start (int): Start index
+            end (int): End index
+            scale (float, optional): Factor applied to distances before rounding them to integers. Defaults to DIST_SCALE.
+            dtype (type, optional): Integer type of the distance matrix, np.int32 or np.int64. Defaults to np.int64.
+            k (int, optional): Number of nearest neighbours for the sparse mode, dense matrix if None. Defaults to None.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            engine (str, optional): Solver backend, ortools or heuristic. Defaults to 'ortools'.
+            time_limit (float, optional): Time budget in seconds, unlimited if None. Defaults to None.
+            first_solution (str, optional): ortools FirstSolutionStrategy name. Defaults to DEFAULT_FIRST_SOLUTION.
+            metaheuristic (str, optional): ortools LocalSearchMetaheuristic name. Defaults to None.
+            solution_limit (int, optional): Maximum number of solutions explored by ortools. Defaults to None.
+            on_solution (Callable[[float, float], None], optional): Called with the length and elapsed seconds of
+                each improved chain. Defaults to None.
+            stats (RunStats, optional): Filled with phase timings and metrics. Defaults to None.
+            perimeter (bool, optional): Walk along the bounding box when every location is on it. Defaults to False.
+            target_length (float, optional): Stop the search once a chain this short is found. Defaults to None.
+            cache (GeometryCache, optional): Distance matrix and neighbours of previous calls. Defaults to None.
+
+        Raises:
+            Chain.ChainException: Unknown engine.
+
+        Returns:
+            np.ndarray: indexes, by order of routing
+        """
+        if engine not in ENGINES:
+            raise Chain.ChainException(f"Unknown engine {engine}, expected one of {ENGINES}")
+        start, end = int(start), int(end)
+        if len(locations) == 2:
+            return np.array([start, end], dtype=np.int64)
+        run_stats = stats if stats is not None else NULL_STATS
+        if perimeter:
+            with run_stats.phase('perimeter'):
+                path = perimeter_path(locations, start, end, metric)
+            if path is not None:
+                return path
+        if engine == 'heuristic':
+            with run_stats.phase('heuristic'):
+                k = k or heuristic.DEFAULT_NEIGHBORS
+                neighbors = cache.neighbors(locations, k, metric) if cache is not None else None
+                path = heuristic.solve(locations, start, end, k, metric, neighbors=neighbors,
+                                       time_limit=time_limit, on_solution=on_solution, target_length=target_length)
+            if run_stats:
+                run_stats.set('objective', heuristic.path_length(locations, path, metric))
+            return path
         data_set = {
             'num_vehicles': 1,
             'locations': locations,
             'depot': 0,
             'starts': [start],
-            'ends': [end]
+            'ends': [end],
+            'scale': scale,
+            'metric': metric,
+            'time_limit': time_limit,
+            'first_solution': first_solution,
+            'metaheuristic': metaheuristic,
+            'solution_limit': solution_limit,
+            'on_solution': on_solution,
+            'target_length': target_length,
+            'stats': run_stats
         }
-        dist_matrix = Chain.get_dist_matrix(locations)
-        path = Chain.solve_routing(data_set, dist_matrix)
-        order = [0]*len(path)
-        for k, index in enumerate(path):
-            order[index] = k
-        df['order'] = order
-        return df
+        if k:
+            with run_stats.phase('neighbors'):
+                data_set['neighbors'] = (cache.neighbors(locations, k, metric) if cache is not None
+                                         else Chain.get_neighbors(locations, k, metric))
+            with run_stats.phase('initial_path'):
+                data_set['initial_path'] = Chain.get_greedy_path(locations, data_set['neighbors'], start, end, metric)
+            dist_matrix = None
+        else:
+            with run_stats.phase('dist_matrix'):
+                dist_matrix = (cache.dist_array(locations, scale, dtype, metric) if cache is not None
+                               else Chain.get_dist_array(locations, scale=scale, dtype=dtype, metric=metric))
+                if cache is not None:
+                    data_set['dist_rows'] = cache.dist_rows(locations, scale, dtype, metric)
+            run_stats.set('matrix_bytes', dist_matrix.nbytes)
+        return np.array(Chain.solve_routing(data_set, dist_matrix), dtype=np.int64)
+
+    @staticmethod
+    def get_hierarchical_path(locations: np.ndarray,
+                              macros: np.ndarray,
+                              start: int,
+                              end: int,
+                              processes: Optional[int] = None,
+                              **options) -> np.ndarray:
+        """Chain each macro on its own, then chain the macros together.
+        Macros are ordered by chaining their centroids from the macro of start to the macro of end.
+        Each macro leaves through its pin closest to the next centroid and is entered through
+        its pin closest to the exit of the previous macro, so every sub chain is independent and
+        solved in a process pool. Fall back on a single chain when start and end share a macro.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            macros (np.ndarray): macro of each location
+            start (int): Start index
+            end (int): End index
+            processes (int, optional): Number of worker processes, number of cpus if None. Defaults to None.
+            **options: Options of `get_path` used for every sub chain. on_solution is not sent to the sub chains,
+                it is called once with the length of the whole chain.
+
+        Returns:
+            np.ndarray: indexes, by order of routing
+        """
+        import pandas as pd
+        begin = time.perf_counter()
+        codes, uniques = pd.factorize(macros)
+        if len(uniques) == 1 or codes[start] == codes[end]:
+            return Chain.get_path(locations, start, end, **options)
+        on_solution = options.pop('on_solution', None)
+        grouped = np.argsort(codes, kind='stable')
+        members = np.split(grouped, np.cumsum(np.bincount(codes))[:-1])
+        centroids = np.stack([locations[indexes].mean(axis=0) for indexes in members])
+        macro_path = Chain.get_path(centroids, codes[start], codes[end], **options)
+        metric = options.get('metric', 'euclidean')
+
+        exits = [end] * len(macro_path)
+        for position, macro in enumerate(macro_path[:-1]):
+            excluded = start if position == 0 else -1
+            exits[position] = Chain._closest(locations, members[macro], centroids[macro_path[position + 1]], excluded, metric)
+        jobs = []
+        for position, macro in enumerate(macro_path):
+            indexes = members[macro]
+            if position == 0:
+                entry = start
+            else:
+                entry = Chain._closest(locations, indexes, locations[exits[position - 1]], exits[position], metric)
+            local = {index: local_i for local_i, index in enumerate(indexes.tolist()) if index in (entry, exits[position])}
+            jobs.append((locations[indexes], local[entry], local[exits[position]], options))
+
+        sub_paths = Chain._solve_jobs(jobs, processes)
+        path = np.concatenate([members[macro][sub_path] for macro, sub_path in zip(macro_path, sub_paths)])
+        if on_solution:
+            on_solution(heuristic.path_length(locations, path, metric), time.perf_counter() - begin)
+        return path
+
+    @staticmethod
+    def get_multi_path(locations: np.ndarray,
+                       starts: np.ndarray,
+                       ends: np.ndarray,
+                       balance: str = 'pins',
+                       processes: Optional[int] = None,
+                       stats: Optional[RunStats] = None,
+                       **options) -> List[np.ndarray]:
+        """Chain locations into one chain per start and end pair.
+        Balanced by pins, the locations are split by `partition` and every part is chained
+        on its own in a process pool. Balanced by length, a single ortools model with one vehicle
+        per chain minimizes the total length plus SPAN_COST times the length of the longest chain.
+        It starts from heuristic chains of the pins balance and moves pins between chains, which is
+        slow on large sets, so it is best used with a time limit.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            starts (np.ndarray): Start index of each chain
+            ends (np.ndarray): End index of each chain
+            balance (str, optional): pins or length. Defaults to 'pins'.
+            processes (int, optional): Number of worker processes of the pins balance,
+                number of cpus if None. Defaults to None.
+            stats (RunStats, optional): Filled with phase timings and metrics. Defaults to None.
+            **options: Options of `get_path`. With the pins balance, on_solution is not sent to the chains,
+                it is called once with the total length.
+
+        Raises:
+            Chain.ChainException: Unknown balance.
+            Chain.ChainException: Length balance with the sparse mode or the heuristic engine.
+
+        Returns:
+            List[np.ndarray]: indexes by order of routing, for each chain
+        """
+        if balance not in BALANCES:
+            raise Chain.ChainException(f"Unknown balance {balance}, expected one of {BALANCES}")
+        run_stats = stats if stats is not None else NULL_STATS
+        metric = options.get('metric', 'euclidean')
+        if balance == 'pins':
+            begin = time.perf_counter()
+            on_solution = options.pop('on_solution', None)
+            with run_stats.phase('partition'):
+                labels = Chain.partition(locations, starts, ends, metric)
+            grouped = np.argsort(labels, kind='stable')
+            members = np.split(grouped, np.cumsum(np.bincount(labels, minlength=len(starts)))[:-1])
+            jobs = [(locations[indexes], np.searchsorted(indexes, start), np.searchsorted(indexes, end), options)
+                    for indexes, start, end in zip(members, starts, ends)]
+            with run_stats.phase('chains'):
+                sub_paths = Chain._solve_jobs(jobs, processes)
+            paths = [indexes[sub_path] for indexes, sub_path in zip(members, sub_paths)]
+            if on_solution:
+                on_solution(sum(heuristic.path_length(locations, path, metric) for path in paths),
+                            time.perf_counter() - begin)
+            return paths
+
+        if options.get('engine', 'ortools') != 'ortools' or options.get('k'):
+            raise Chain.ChainException("Balancing the length needs the dense ortools model, use engine='ortools' and no k")
+        scale = options.get('scale', DIST_SCALE)
+        data_set = {
+            'num_vehicles': len(starts),
+            'locations': locations,
+            'depot': 0,
+            'starts': [int(start) for start in starts],
+            'ends': [int(end) for end in ends],
+            'scale': scale,
+            'metric': metric,
+            'span_cost': SPAN_COST,
+            'stats': run_stats
+        }
+        data_set.update({key: options.get(key) for key in
+                         ('time_limit', 'first_solution', 'metaheuristic', 'solution_limit', 'on_solution')})
+        with run_stats.phase('initial_path'):
+            data_set['initial_paths'] = Chain.get_multi_path(locations, starts, ends, 'pins', 1,
+                                                             engine='heuristic', metric=metric)
+        with run_stats.phase('dist_matrix'):
+            dist_matrix = Chain.get_dist_array(locations, scale=scale, dtype=options.get('dtype', np.int64),
+                                               metric=metric)
+        run_stats.set('matrix_bytes', dist_matrix.nbytes)
+        return [np.array(path, dtype=np.int64) for path in Chain.solve_routes(data_set, dist_matrix)]
+
+    @staticmethod
+    def partition(locations: np.ndarray,
+                  starts: np.ndarray,
+                  ends: np.ndarray,
+                  metric: str = 'euclidean') -> np.ndarray:
+        """Split locations into one part per chain, with the same number of locations in each part
+        up to one. A location goes to the chain whose segment from start to end is the closest
+        one with room left. Locations are placed by decreasing regret, the extra distance to their
+        second closest segment, so locations with a single good chain are placed first.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            starts (np.ndarray): Start index of each chain, placed in its own chain
+            ends (np.ndarray): End index of each chain, placed in its own chain
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: chain of each location
+        """
+        chains = len(starts)
+        labels = np.full(len(locations), -1, dtype=np.int64)
+        labels[starts] = np.arange(chains)
+        labels[ends] = np.arange(chains)
+        room = (len(locations) // chains + (np.arange(chains) < len(locations) % chains) - 2).tolist()
+        free = np.flatnonzero(labels < 0)
+
+        origin = locations[starts]
+        segment = locations[ends] - origin
+        points = locations[free][:, np.newaxis, :]
+        along = ((points - origin) * segment).sum(axis=2) / np.maximum((segment * segment).sum(axis=1), heuristic.EPSILON)
+        delta = points - (origin + np.clip(along, 0, 1)[..., np.newaxis] * segment)
+        cost = metric_dist(delta[..., 0], delta[..., 1], metric)
+        preference = np.argsort(cost, axis=1, kind='stable')
+        if chains > 1:
+            ranked = np.take_along_axis(cost, preference[:, :2], axis=1)
+            regret = ranked[:, 1] - ranked[:, 0]
+        else:
+            regret = np.zeros(len(free))
+        preference_rows = preference.tolist()
+        for position in np.argsort(-regret, kind='stable').tolist():
+            for chain in preference_rows[position]:
+                if room[chain]:
+                    labels[free[position]] = chain
+                    room[chain] -= 1
+                    break
+        return labels
+
+    @staticmethod
+    def _solve_jobs(jobs: list, processes: Optional[int] = None) -> list:
+        """Run `_get_sub_path` on every job, in a process pool when there are several.
+
+        Args:
+            jobs (list): jobs of `_get_sub_path`
+            processes (int, optional): Number of worker processes, number of cpus if None. Defaults to None.
+
+        Returns:
+            list: local indexes by order of routing, for each job
+        """
+        if processes == 1 or len(jobs) == 1:
+            return list(map(Chain._get_sub_path, jobs))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chunksize = max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))
+            return list(executor.map(Chain._get_sub_path, jobs, chunksize=chunksize))
+
+    @staticmethod
+    def _closest(locations: np.ndarray,
+                 indexes: np.ndarray,
+                 point: np.ndarray,
+                 excluded: int = -1,
+                 metric: str = 'euclidean') -> int:
+        """Get the index closest to a point.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            indexes (np.ndarray): candidate indexes
+            point (np.ndarray): target coordinates
+            excluded (int, optional): index that can't be chosen unless it is the only candidate. Defaults to -1.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            int: closest index
+        """
+        delta = locations[indexes] - point
+        dist = metric_dist(delta[:, 0], delta[:, 1], metric)
+        if len(indexes) > 1:
+            dist[indexes == excluded] = np.inf
+        return int(indexes[np.argmin(dist)])
 
     @staticmethod
-    def solve_routing(data: dict, dist_matrix: dict) -> tuple:
+    def _get_sub_path(job: tuple) -> np.ndarray:
+        """Chain one macro, worker of `get_hierarchical_path`.
+
+        Args:
+            job (tuple): locations, local start index, local end index and options of `get_path`
+
+        Returns:
+            np.ndarray: local indexes, by order of routing
+        """
+        locations, start, end, options = job
+        if len(locations) == 1:
+            return np.zeros(1, dtype=np.int64)
+        return Chain.get_path(locations, start, end, **options)
+
+    @staticmethod
+    def solve_routing(data: dict, dist_matrix: Optional[np.ndarray]) -> list:
         """Solve routing using ortools
 
         Args:
-            data (dict): dataset
-            dist_matrix (dict): distance matrix
+            data (dict): dataset, its optional stats get the model, solve and walk phases and the solver metrics,
+                its optional dist_rows are the rows of dist_matrix as lists, registered instead of converting it again
+            dist_matrix (np.ndarray, optional): integer distance matrix, see `get_dist_array`.
+                If None, the dataset must contain the neighbors of the sparse mode.
+
+        Raises:
+            Chain.ChainException: No solution found.
 
         Returns:
             list: list of indexes, by order of routing
         """
-        manager = pywrapcp.RoutingIndexManager(
-            len(data['locations']),
-            data['num_vehicles'],
-            data['starts'],
-            data['ends'])
+        return Chain.solve_routes(data, dist_matrix)[0]
 
-        routing = pywrapcp.RoutingModel(manager)
+    @staticmethod
+    def solve_routes(data: dict, dist_matrix: Optional[np.ndarray]) -> list:
+        """Solve routing using ortools, with one route per vehicle.
+        When the dataset has a span_cost, the length of the routes is a dimension whose
+        global span is added to the cost with this coefficient, which balances the routes.
 
-        transit_callback_index = routing.RegisterTransitCallback(
-            lambda from_i, to_i:
-                dist_matrix[manager.IndexToNode(from_i)][
-                    manager.IndexToNode(to_i)])
+        Args:
+            data (dict): dataset, see `solve_routing`
+            dist_matrix (np.ndarray, optional): integer distance matrix, see `get_dist_array`.
+                If None, the dataset must contain the neighbors of the sparse mode.
+
+        Raises:
+            Chain.ChainException: No solution found.
+
+        Returns:
+            list: list of indexes by order of routing, for each vehicle
+        """
+        from ortools.constraint_solver import pywrapcp
+        stats = data.get('stats') or NULL_STATS
+        with stats.phase('model'):
+            manager = pywrapcp.RoutingIndexManager(
+                len(data['locations']),
+                data['num_vehicles'],
+                data['starts'],
+                data['ends'])
+
+            routing = pywrapcp.RoutingModel(manager)
+
+            if dist_matrix is None:
+                transit_callback_index = Chain._register_sparse(routing, manager, data)
+            else:
+                transit_callback_index = Chain._register_matrix(routing, manager, dist_matrix, data.get('dist_rows'))
+
+            routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+            if data.get('span_cost'):
+                routing.AddDimension(transit_callback_index, 0, FORBIDDEN_ARC_COST, True, 'length')
+                routing.GetDimensionOrDie('length').SetGlobalSpanCostCoefficient(data['span_cost'])
+
+            search_parameters = Chain.get_search_parameters(data)
+            if data.get('on_solution'):
+                Chain._add_progress_callback(routing, data)
+            if data.get('target_length') is not None:
+                Chain._add_target_callback(routing, data)
+
+        with stats.phase('solve'):
+            initial_paths = data.get('initial_paths') or ([data['initial_path']] if 'initial_path' in data else None)
+            if initial_paths:
+                routing.CloseModelWithParameters(search_parameters)
+                initial_routes = [[manager.NodeToIndex(node) for node in path[1:-1].tolist()] for path in initial_paths]
+                initial_solution = routing.ReadAssignmentFromRoutes(initial_routes, True)
+                solution = routing.SolveFromAssignmentWithParameters(initial_solution, search_parameters)
+            else:
+                solution = routing.SolveWithParameters(search_parameters)
+        if stats:
+            solver = routing.solver()
+            stats.set('branches', solver.Branches())
+            stats.set('failures', solver.Failures())
+            stats.set('solutions', solver.Solutions())
+            stats.set('status', routing.status())
+        if solution is None:
+            raise Chain.ChainException(f"No chain found, solver status {Chain._status_name(routing.status())}")
+        with stats.phase('walk'):
+            paths = []
+            for vehicle in range(data['num_vehicles']):
+                path = []
+                index = routing.Start(vehicle)
+                while not routing.IsEnd(index):
+                    path.append(manager.IndexToNode(index))
+                    index = solution.Value(routing.NextVar(index))
+                path.append(manager.IndexToNode(index))
+                paths.append(path)
+        stats.set('objective', solution.ObjectiveValue() / data['scale'])
+        return paths
+
+    @staticmethod
+    def get_search_parameters(data: dict) -> 'pywrapcp.DefaultRoutingSearchParameters':
+        """Build the ortools search parameters of a dataset.
+
+        Args:
+            data (dict): dataset, may contain first_solution, metaheuristic, time_limit and solution_limit
 
-        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+        Raises:
+            Chain.ChainException: Unknown first solution strategy or metaheuristic.
+            Chain.ChainException: Metaheuristic without time or solution limit.
 
-        # Setting first solution heuristic.
+        Returns:
+            RoutingSearchParameters: search parameters
+        """
+        from ortools.constraint_solver import pywrapcp, routing_enums_pb2
         search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.LOCAL_CHEAPEST_INSERTION)
-
-        solution = routing.SolveWithParameters(search_parameters)
-        path: tuple = ()
-        index = routing.Start(0)
-        while not routing.IsEnd(index):
-            path += (manager.IndexToNode(index), )
-            index = solution.Value(routing.NextVar(index))
-        path += (manager.IndexToNode(index), )
-        return path
+        first_solution = data.get('first_solution') or DEFAULT_FIRST_SOLUTION
+        if not hasattr(routing_enums_pb2.FirstSolutionStrategy, first_solution):
+            raise Chain.ChainException(f"Unknown first solution strategy {first_solution}")
+        search_parameters.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, first_solution)
+        metaheuristic = data.get('metaheuristic')
+        if metaheuristic:
+            if not hasattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic):
+                raise Chain.ChainException(f"Unknown metaheuristic {metaheuristic}")
+            if metaheuristic in UNBOUNDED_METAHEURISTICS and not (data.get('time_limit') or data.get('solution_limit')):
+                raise Chain.ChainException(f"{metaheuristic} never stops, set a time_limit or a solution_limit")
+            search_parameters.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+        if data.get('time_limit'):
+            search_parameters.time_limit.FromMilliseconds(int(data['time_limit'] * 1000))
+        if data.get('solution_limit'):
+            search_parameters.solution_limit = data['solution_limit']
+        return search_parameters
+
+    @staticmethod
+    def _add_target_callback(routing: 'pywrapcp.RoutingModel', data: dict) -> None:
+        """Finish the search as soon as a solution is not longer than data['target_length'].
+
+        Args:
+            routing (pywrapcp.RoutingModel): Routing model
+            data (dict): dataset with target_length and scale
+        """
+        target = data['target_length'] * data['scale']
+        solver = routing.solver()
+
+        def stop() -> None:
+            if routing.CostVar().Value() <= target:
+                solver.FinishCurrentSearch()
+
+        routing.AddAtSolutionCallback(stop)
+
+    @staticmethod
+    def _add_progress_callback(routing: 'pywrapcp.RoutingModel', data: dict) -> None:
+        """Call data['on_solution'] with the length and elapsed seconds of each improved solution.
+
+        Args:
+            routing (pywrapcp.RoutingModel): Routing model
+            data (dict): dataset with on_solution and scale
+        """
+        begin = time.perf_counter()
+        best: list = []
+
+        def progress() -> None:
+            cost = routing.CostVar().Value()
+            if not best or cost < best[-1]:
+                best.append(cost)
+                data['on_solution'](cost / data['scale'], time.perf_counter() - begin)
+
+        routing.AddAtSolutionCallback(progress)
+
+    @staticmethod
+    def _status_name(status: int) -> str:
+        """Name of a routing status.
+
+        Args:
+            status (int): routing.status()
+
+        Returns:
+            str: status name, or the number for ortools versions without the status enum
+        """
+        from ortools.constraint_solver import routing_enums_pb2
+        try:
+            return routing_enums_pb2.RoutingSearchStatus.Value.Name(status)
+        except (AttributeError, ValueError):
+            return str(status)
+
+    @staticmethod
+    def _register_matrix(routing: 'pywrapcp.RoutingModel',
+                         manager: 'pywrapcp.RoutingIndexManager',
+                         dist_matrix: np.ndarray,
+                         rows: Optional[List[list]] = None) -> int:
+        """Register the distance matrix as the transit of the routing model.
+        Use the native matrix registration when ortools provides it, so the
+        solver never calls back into python to evaluate an arc.
+
+        Args:
+            routing (pywrapcp.RoutingModel): Routing model
+            manager (pywrapcp.RoutingIndexManager): Index manager of the model
+            dist_matrix (np.ndarray): integer distance matrix
+            rows (List[list], optional): rows of dist_matrix as lists, e.g. from `GeometryCache.dist_rows`,
+                converted from dist_matrix if None. Defaults to None.
+
+        Returns:
+            int: transit callback index
+        """
+        if rows is None:
+            rows = dist_matrix.tolist()
+        if hasattr(routing, 'RegisterTransitMatrix'):
+            return routing.RegisterTransitMatrix(rows)
+        return routing.RegisterTransitCallback(
+            lambda from_i, to_i:
+                rows[manager.IndexToNode(from_i)][manager.IndexToNode(to_i)])
+
+    @staticmethod
+    def _register_sparse(routing: 'pywrapcp.RoutingModel',
+                         manager: 'pywrapcp.RoutingIndexManager',
+                         data: dict) -> int:
+        """Register a lazy transit and restrict every node to its nearest neighbours.
+        Neighbours are symmetrised so each node can also be reached from the nodes it is close to,
+        and the arcs of the initial path are kept so the restricted model stays feasible.
+
+        Args:
+            routing (pywrapcp.RoutingModel): Routing model
+            manager (pywrapcp.RoutingIndexManager): Index manager of the model
+            data (dict): dataset with locations, neighbors, initial_path, scale and metric
+
+        Returns:
+            int: transit callback index
+        """
+        candidates: set = set()
+        for from_n, to_nodes in enumerate(Chain.get_candidate_arcs(data['neighbors'], data['initial_path'])):
+            if from_n in data['ends']:
+                continue
+            from_i = manager.NodeToIndex(from_n)
+            to_indexes = [routing.End(0) if to_n in data['ends'] else manager.NodeToIndex(to_n)
+                          for to_n in to_nodes if to_n not in data['starts']]
+            routing.NextVar(from_i).SetValues(to_indexes)
+            candidates.update((from_i, to_i) for to_i in to_indexes)
+
+        x_list, y_list = data['locations'][:, 0].tolist(), data['locations'][:, 1].tolist()
+        scale, metric = data['scale'], data['metric']
+        index_to_node = [manager.IndexToNode(index) for index in range(routing.Size() + routing.vehicles())]
+        cache: dict = {}
+
+        def distance(from_i: int, to_i: int) -> int:
+            # Arcs outside of the candidates are removed from the NextVar domains, their cost is never used.
+            arc = (from_i, to_i)
+            if arc in cache:
+                return cache[arc]
+            if arc not in candidates:
+                return FORBIDDEN_ARC_COST
+            from_n, to_n = index_to_node[from_i], index_to_node[to_i]
+            cache[arc] = round(scale * scalar_dist(x_list[from_n] - x_list[to_n], y_list[from_n] - y_list[to_n], metric))
+            return cache[arc]
+
+        return routing.RegisterTransitCallback(distance)
+
+    @staticmethod
+    def get_neighbors(locations: np.ndarray, k: int, metric: str = 'euclidean') -> np.ndarray:
+        """Compute the k nearest neighbours of each location with a grid index.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates from df
+            k (int): Number of neighbours
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: (n, k) array of neighbour indexes, closest first
+        """
+        return GridIndex(locations).knn(k, metric)
+
+    @staticmethod
+    def get_greedy_path(locations: np.ndarray,
+                        neighbors: np.ndarray,
+                        start: int,
+                        end: int,
+                        metric: str = 'euclidean') -> np.ndarray:
+        """Build a nearest neighbour path from start to end.
+        The next node is the closest unvisited neighbour, or the closest unvisited node
+        when every neighbour has already been visited.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates from df
+            neighbors (np.ndarray): (n, k) array of neighbour indexes, closest first
+            start (int): Start index
+            end (int): End index
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: Node indexes, by order of routing
+        """
+        return heuristic.nearest_neighbor_path(locations, neighbors, start, end, metric)
+
+    @staticmethod
+    def get_candidate_arcs(neighbors: np.ndarray, path: Optional[np.ndarray] = None) -> list:
+        """Symmetrise a nearest neighbours graph.
+
+        Args:
+            neighbors (np.ndarray): (n, k) array of neighbour indexes
+            path (np.ndarray, optional): Path whose arcs are added to the graph. Defaults to None.
+
+        Returns:
+            list: list of sorted arrays, candidate successors of each node
+        """
+        n_nodes, k = neighbors.shape
+        path = np.empty(0, dtype=np.int64) if path is None else np.asarray(path)
+        from_nodes = np.concatenate([np.repeat(np.arange(n_nodes), k), neighbors.ravel(), path[:-1], path[1:]])
+        to_nodes = np.concatenate([neighbors.ravel(), np.repeat(np.arange(n_nodes), k), path[1:], path[:-1]])
+        arcs = np.unique(from_nodes * n_nodes + to_nodes)
+        from_nodes, to_nodes = np.divmod(arcs, n_nodes)
+        return np.split(to_nodes, np.searchsorted(from_nodes, np.arange(1, n_nodes)))
+
+    @staticmethod
+    def _pairwise_dist(locations: np.ndarray, metric: str = 'euclidean') -> np.ndarray:
+        """Distance between every pair of locations.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: (n, n) float matrix
+        """
+        points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        delta = points[:, np.newaxis, :] - points[np.newaxis, :, :]
+        return metric_dist(delta[..., 0], delta[..., 1], metric)
+
+    @staticmethod
+    def get_dist_array(locations: np.ndarray,
+                       scale: float = DIST_SCALE,
+                       dtype: type = np.int64,
+                       metric: str = 'euclidean') -> np.ndarray:
+        """Compute the distance matrix in one numpy broadcast.
+        Distances are multiplied by scale and rounded, since ortools only works with integers.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates from df
+            scale (float, optional): Factor applied to distances before rounding. Defaults to DIST_SCALE.
+            dtype (type, optional): np.int32 or np.int64. Defaults to np.int64.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Raises:
+            Chain.ChainException: dtype is not a supported integer type.
+            Chain.ChainException: Scaled distances overflow dtype.
+
+        Returns:
+            np.ndarray: C-contiguous (n, n) matrix, [index_from, index_to] = scaled dist
+        """
+        if dtype not in (np.int32, np.int64):
+            raise Chain.ChainException(f"Unsupported distance matrix dtype {dtype}")
+        dist = Chain._pairwise_dist(locations, metric)
+        dist *= scale
+        np.rint(dist, out=dist)
+        if dist.size and dist.max() > np.iinfo(dtype).max:
+            raise Chain.ChainException(f"Scaled distances overflow {np.dtype(dtype).name}, lower the scale")
+        return np.ascontiguousarray(dist, dtype=dtype)
 
     @staticmethod
     def get_dist_matrix(locations: list[tuple[int, int]]) -> dict:
-        """Compute the euclidian distance matrix
+        """Compute the euclidian distance matrix.
+        Compatibility accessor returning the unscaled distances as a dict, see `get_dist_array`
+        for the matrix used by the solver.
 
         Args:
             locations (list): List of coordinates from df
@@ -110,11 +1170,30 @@ class Chain:
         Returns:
             dict: dict of ditances [index_from][index_to] = dist
         """
-        distances = {diag: {diag: 0} for diag in range(len(locations))}
-        for from_c, from_n in enumerate(locations):
-            for to_c, to_n in list(enumerate(locations))[from_c+1:]:
-                # Euclidean distance
-                val = hypot((from_n[0] - to_n[0]), (from_n[1] - to_n[1]))
-                distances[from_c][to_c] = val
-                distances[to_c][from_c] = val
-        return distances
+        dist = Chain._pairwise_dist(locations).tolist()
+        return {from_c: dict(enumerate(row)) for from_c, row in enumerate(dist)}
+
+
+class RoutePool:
+    """Worker processes of `Chain.route_many`, kept between calls so that each worker
+    imports and warms up ortools once.
+    """
+
+    def __init__(self, processes: Optional[int] = None) -> None:
+        """Start the workers.
+
+        Args:
+            processes (int, optional): Number of workers, number of cpus if None. Defaults to None.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, initializer=Chain._init_worker)
+
+    def close(self) -> None:
+        """Stop the workers."""
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'RoutePool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -2,11 +2,25 @@
 Generate dummy lef file.
 """
 import os
-from typing import List
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 import random
-from definition import *
+import numpy as np
+from definition import ROOT_DIR
 
 PATH_TO_WRITE_LEF = f"{ROOT_DIR}/lef_files"
+DIRECTIONS = ("INPUT", "OUTPUT", "INOUT")
+USES = ("SIGNAL", "POWER", "GROUND")
+# Sides of the cell, in the order pins are dispatched on them.
+SIDES = ('left', 'right', 'top', 'bottom')
+# Pins formatted per string, and size of the write buffer, when streaming a lef.
+PINS_PER_CHUNK = 4096
+WRITE_BUFFER_SIZE = 1 << 20
+CELL_HEADER_TEMPLATE = "MACRO {cell_name}\n\tSIZE 100 BY 100 ;\n"
+PIN_TEMPLATE = ("\tPIN pin_{0}\n\t\tDIRECTION {1} ;\n\t\tUSE {2} ;\n\t\tPORT\n\t\t\tLAYER M1 ;\n"
+                "\t\t\tRECT {3} ;\n\t\tEND PORT\n\tEND pin_{0}\n")
+CELL_FOOTER = "END MACRO"
 
 
 class GenerateLef:
@@ -14,16 +28,27 @@ class GenerateLef:
     Create a lef file with a specified number of cells and ports.
     """
 
-    def __init__(self, number_of_cells: int = 1, number_of_ports: int = 1) -> None:
+    def __init__(self, number_of_cells: int = 1, number_of_ports: int = 1, seed: Optional[int] = None) -> None:
         """Init method to generate dummy lef file.
 
         Args:
             number_of_cells (int): Number of cells to add in the lef file.
             number_of_ports (int): Number of ports to add for each cells.
+            seed (int, optional): Seed of the DIRECTION and USE choices, the same seed
+                generates the same lef whatever the number of processes. Defaults to None.
         """
         self._nb_cells = number_of_cells
         self._nb_ports = number_of_ports
+        self._random = random.Random(seed)
+        # Each cell draws from its own generator seeded from this one, so a cell does not depend
+        # on the cells generated before it.
+        self._seed = seed if seed is not None else self._random.getrandbits(64)
         self.lef_content: List = []
+        # 8 ports are 2 on each side, 6 ports are 3 on the left and 3 on the right.
+        self.number_of_pin_shapes_to_generate_on_each_side = self._nb_ports // 4 + self._nb_ports % 4
+        self.pin_length, self.pin_spacing = self.get_lenght_of_pin(self.number_of_pin_shapes_to_generate_on_each_side)
+        self._nb_formatted_cells = 0
+        self._pin_rects: Dict[int, List[str]] = {}
 
     def write_lef(self, lef_name: str = 'dummy.lef') -> None:
         """Generate dummy lef file.
@@ -31,12 +56,88 @@ class GenerateLef:
         The amount of cell generate is set during the initialisation of the class.
 
         Args:
-            lef_name (str, optional): Lef filename to generate. Defaults to 'dummy.lef'.
+            lef_name (str, optional): Lef filename to generate, in PATH_TO_WRITE_LEF unless it is
+                an absolute path. Defaults to 'dummy.lef'.
         """
-        os.makedirs(PATH_TO_WRITE_LEF, exist_ok=True)
-        with open(f"{PATH_TO_WRITE_LEF}/{lef_name}", 'w', encoding='utf-8') as lef_stream:
+        lef_path = os.path.join(PATH_TO_WRITE_LEF, lef_name)
+        os.makedirs(os.path.dirname(lef_path), exist_ok=True)
+        with open(lef_path, 'w', encoding='utf-8') as lef_stream:
             lef_stream.write("\n".join(self.lef_content))
 
+    def stream_lef(self, lef_name: str = 'dummy.lef', processes: Optional[int] = 1) -> None:
+        """Generate and write the lef cell by cell, without keeping it in `self.lef_content`.
+        Memory use does not depend on the number of cells and pins, the file is the same
+        as `generate_lef` followed by `write_lef` for the same seed.
+        With several processes the cells are split in contiguous shards written to temporary
+        files by the workers, then appended in order to the lef with copy_file_range.
+
+        Args:
+            lef_name (str, optional): Lef filename to generate, in PATH_TO_WRITE_LEF unless it is
+                an absolute path. Defaults to 'dummy.lef'.
+            processes (int, optional): Number of worker processes, every cpu if None. Defaults to 1.
+        """
+        lef_path = os.path.join(PATH_TO_WRITE_LEF, lef_name)
+        os.makedirs(os.path.dirname(lef_path), exist_ok=True)
+        if processes == 1 or self._nb_cells < 2:
+            GenerateLef._write_shard((self._nb_ports, self._seed, 0, self._nb_cells, lef_path))
+            return
+        nb_shards = min(self._nb_cells, 4 * (processes or os.cpu_count() or 1))
+        bounds = [self._nb_cells * shard // nb_shards for shard in range(nb_shards + 1)]
+        jobs = [(self._nb_ports, self._seed, first, last, f"{lef_path}.{shard}.part")
+                for shard, (first, last) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(GenerateLef._write_shard, jobs))
+            with open(lef_path, 'wb') as lef_stream:
+                for job in jobs:
+                    GenerateLef._append_file(lef_stream, job[-1])
+        finally:
+            for job in jobs:
+                if os.path.exists(job[-1]):
+                    os.remove(job[-1])
+
+    @staticmethod
+    def _write_shard(job: Tuple[int, int, int, int, str]) -> None:
+        """Write a range of cells to a file, run in the worker processes.
+
+        Args:
+            job (Tuple[int, int, int, int, str]): Number of ports, seed, first and last cell indexes
+                and path of the file.
+        """
+        nb_ports, seed, first, last, path = job
+        generator = GenerateLef(number_of_cells=last, number_of_ports=nb_ports, seed=seed)
+        generator._nb_formatted_cells = first
+        with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as lef_stream:
+            for cell_index in range(first, last):
+                if cell_index:
+                    lef_stream.write("\n")
+                for chunk in generator.iter_cell(f"cell_{cell_index}"):
+                    lef_stream.write(chunk)
+
+    @staticmethod
+    def _append_file(lef_stream, path: str) -> None:
+        """Append a file to an open binary file, copied by the kernel when possible.
+
+        Args:
+            lef_stream (BinaryIO): Destination, opened in binary mode.
+            path (str): File to append.
+        """
+        lef_stream.flush()
+        with open(path, 'rb') as shard_stream:
+            remaining = os.fstat(shard_stream.fileno()).st_size
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(shard_stream.fileno(), lef_stream.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):
+                pass
+            if remaining > 0:
+                # No copy_file_range, or not between these file systems, the file positions are up to date.
+                shutil.copyfileobj(shard_stream, lef_stream)
+                lef_stream.flush()
+
     def get_lenght_of_pin(self, number_of_pin_on_one_side: int) -> float:
         """Calculate the length and spacing of pins
 
@@ -57,7 +158,7 @@ class GenerateLef:
         """Add a cell (MACRO) to the lef to be generated.
         Will create a MACRO (lef statement for cell) as a string and
         add it to the class variable `self.lef_content`.
-        It will also add the port for the cell using `add_port` method.
+        Its pins are formatted by `iter_cell`.
 
         Output will look like so:
         MACRO <cell_name>
@@ -68,86 +169,107 @@ class GenerateLef:
         Args:
             cell_name (str): Cell name to add.
         """
-        cell: List = [f"MACRO {cell_name}"]
-        cell.append("\tSIZE 100 BY 100 ;")
-        for pin_index in range(self._nb_ports):
-            cell += self.add_pin(pin_index)
-        cell.append("END MACRO")
-        self.lef_content += cell
-
-    def _get_pin_placement_info(self):
+        self.lef_content += "".join(self.iter_cell(cell_name)).split("\n")
+
+    def iter_cell(self, cell_name: str) -> Iterator[str]:
+        """Format a cell (MACRO) by chunks of PINS_PER_CHUNK pins.
+        DIRECTION and USE of the pins of a chunk are drawn at once, from a generator seeded
+        with the seed of the lef and the index of the cell.
+
+        Args:
+            cell_name (str): Cell name to add.
+
+        Yields:
+            Iterator[str]: Text of the cell, without the newline after `END MACRO`.
+        """
+        rects = self.get_pin_rects(self._get_first_side(self._nb_formatted_cells))
+        cell_random = random.Random(f"{self._seed}:{self._nb_formatted_cells}")
+        self._nb_formatted_cells += 1
+        yield CELL_HEADER_TEMPLATE.format(cell_name=cell_name)
+        for first_pin in range(0, self._nb_ports, PINS_PER_CHUNK):
+            pin_indexes = range(first_pin, min(first_pin + PINS_PER_CHUNK, self._nb_ports))
+            directions = cell_random.choices(DIRECTIONS, k=len(pin_indexes))
+            uses = cell_random.choices(USES, k=len(pin_indexes))
+            yield "".join(map(PIN_TEMPLATE.format, pin_indexes, directions, uses,
+                              rects[first_pin:first_pin + PINS_PER_CHUNK]))
+        yield CELL_FOOTER
+
+    def _get_first_side(self, cell_index: int) -> int:
+        """Get the side of the first pin of a cell.
+        Each cell starts on the side following the last side used by the previous cell,
+        in the order of SIDES.
+
+        Args:
+            cell_index (int): Index of the cell in the lef.
+
+        Returns:
+            int: Index in SIDES.
         """
-        This method will setup multiple variable needed for the pin placement:
-            - number_of_pin_shapes_to_generate_on_each_side to know how the pin will be dispatched
-                on each side if the cell.
-                Examples:
-                    - 8 ports to dispatch on eash side (4) of the cell. Which mean 2 ports on each side.
-                    - 6 ports to dispatch on each side, since we can't have the same amount of port on
-                    each side, we will have 3 ports on the left side and 3 port on the right side.
-            - pin_length and pin_spacing, calculating the dimension of the pins and the spacing
-                between them.
-            - first_pols_on_each_side, we will be calculating the first pin polygon to place on each side
-                and when adding more pin to the side we will be shifting that first shape depending on
-                the side, the pin_length and the pin_spacing.
-            - which_side, will be use to determing on which side are we placing the pin and how we should
-                shift the first shape depending on x or y axis.
+        if not self._nb_ports:
+            return 0
+        sides_per_cell = -(-self._nb_ports // self.number_of_pin_shapes_to_generate_on_each_side)
+        return cell_index * sides_per_cell % len(SIDES)
+
+    def get_pin_shapes(self, first_side: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute the pin shapes of a cell.
+        Pins are dispatched by groups of `number_of_pin_shapes_to_generate_on_each_side` on
+        the sides of the cell, starting from `first_side`. On each side the first pin is
+        placed 10 + pin_spacing away from a corner, then each pin is shifted by pin_spacing
+        from the previous one. Shifts are accumulated with a cumulative sum, so the floating
+        point values are the ones of a pin by pin computation.
+
+        Args:
+            first_side (int, optional): Index in SIDES of the side of the first pin. Defaults to 0.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (n,) side index of each pin in SIDES and (n, 4) array of
+                bottom left x, bottom left y, top right x and top right y.
         """
-        if not hasattr(self, "number_of_pin_shapes_to_generate_on_each_side"):
-            self.number_of_pin_shapes_to_generate_on_each_side = self._nb_ports // 4 + self._nb_ports % 4
-        if not hasattr(self, "pin_length") or not hasattr(self, "pin_spacing"):
-            self.pin_length, self.pin_spacing = self.get_lenght_of_pin(self.number_of_pin_shapes_to_generate_on_each_side)
-        if not hasattr(self, "first_pols_on_each_side"):
-            self.first_pols_on_each_side = {
-                'bottom': (10 + self.pin_spacing, 0, 10 + self.pin_length + self.pin_spacing, self.pin_length),
-                'right': (100 - self.pin_length, 10 + self.pin_spacing, 100, 10 + self.pin_length + self.pin_spacing),
-                'top': (90 - self.pin_length - self.pin_spacing, 100 - self.pin_length, 90 - self.pin_spacing, 100),
-                'left': (0, 90 - self.pin_length - self.pin_spacing, self.pin_length, 90 - self.pin_spacing)
-            }
-        if not hasattr(self, "which_side"):
-            self.which_side = ['left', 'right', 'top', 'bottom']
-
-    def _get_pin_shape(self, pin_index: int) -> str:
-        """Get the pin shape.
+        per_side, length, spacing = self.number_of_pin_shapes_to_generate_on_each_side, self.pin_length, self.pin_spacing
+        positions = np.arange(self._nb_ports) % per_side if per_side else np.empty(0, dtype=np.int64)
+        sides = (first_side + np.arange(self._nb_ports) // max(per_side, 1)) % len(SIDES)
+        # Coordinates going up (bottom and right sides) and going down (top and left sides).
+        steps = np.tile([spacing, length], max(per_side - 1, 0))
+        ascending = np.cumsum(np.concatenate(([10 + length + spacing], steps)))
+        up_low = np.concatenate(([10 + spacing], ascending[1::2]))[positions]
+        up_high = ascending[0::2][positions]
+        descending = np.cumsum(np.concatenate(([90 - length - spacing], -steps)))
+        down_low = descending[0::2][positions]
+        down_high = np.concatenate(([90 - spacing], descending[1::2]))[positions]
+        shapes = np.empty((self._nb_ports, 4), dtype=np.float64)
+        for side, columns in enumerate((
+                (0, down_low, length, down_high),               # left
+                (100 - length, up_low, 100, up_high),           # right
+                (down_low, 100 - length, down_high, 100),       # top
+                (up_low, 0, up_high, length))):                 # bottom
+            on_side = sides == side
+            for column, values in enumerate(columns):
+                shapes[on_side, column] = values[on_side] if isinstance(values, np.ndarray) else values
+        return sides, shapes
+
+    def get_pin_rects(self, first_side: int = 0) -> List[str]:
+        """Format the pin shapes of a cell as RECT coordinates.
+        Fixed coordinates keep the text of their int or float value, moving ones are floats.
 
         Args:
-            pin_index (int): Pin number.
+            first_side (int, optional): Index in SIDES of the side of the first pin. Defaults to 0.
 
         Returns:
-            str: String of the shape created.
+            List[str]: RECT coordinates of each pin.
         """
-        if pin_index % self.number_of_pin_shapes_to_generate_on_each_side == 0 or (not hasattr(self, "pin_shape") and not hasattr(self, "side")):
-            self.side = self.which_side.pop(self.which_side.index(self.which_side[0]))  # remove the first element of the list
-            self.which_side.append(self.side)  # append it to become the last element, in case we have multiple cell to add to restart the algo
-            self.pin_shape = self.first_pols_on_each_side[self.side]
-        elif self.side == 'bottom':
-            self.pin_shape = (
-                self.pin_shape[2] + self.pin_spacing,
-                self.pin_shape[1],
-                self.pin_shape[2] + self.pin_spacing + self.pin_length,
-                self.pin_shape[3]
-            )
-        elif self.side == 'right':
-            self.pin_shape = (
-                self.pin_shape[0],
-                self.pin_shape[3] + self.pin_spacing,
-                self.pin_shape[2],
-                self.pin_shape[3] + self.pin_spacing + self.pin_length
-            )
-        elif self.side == 'top':
-            self.pin_shape = (
-                self.pin_shape[0] - self.pin_spacing - self.pin_length,
-                self.pin_shape[1],
-                self.pin_shape[0] - self.pin_spacing,
-                self.pin_shape[3]
-            )
-        elif self.side == 'left':
-            self.pin_shape = (
-                self.pin_shape[0],
-                self.pin_shape[1] - self.pin_spacing - self.pin_length,
-                self.pin_shape[2],
-                self.pin_shape[1] - self.pin_spacing
-            )
-        return " ".join([str(point) for point in self.pin_shape])
+        if first_side in self._pin_rects:
+            return self._pin_rects[first_side]
+        sides, shapes = self.get_pin_shapes(first_side)
+        length, far = str(self.pin_length), str(100 - self.pin_length)
+        templates = (f"0 {{}} {length} {{}}", f"{far} {{}} 100 {{}}", f"{{}} {far} {{}} 100", f"{{}} 0 {{}} {length}")
+        moving = ((1, 3), (1, 3), (0, 2), (0, 2))
+        rects: List[str] = []
+        for first in range(0, self._nb_ports, max(self.number_of_pin_shapes_to_generate_on_each_side, 1)):
+            side = int(sides[first])
+            group = shapes[first:first + self.number_of_pin_shapes_to_generate_on_each_side]
+            rects += map(templates[side].format, group[:, moving[side][0]].tolist(), group[:, moving[side][1]].tolist())
+        self._pin_rects[first_side] = rects
+        return rects
 
     def add_pin(self, pin_index: int) -> List:
         """Add a pin (PIN) to a cell.
@@ -165,20 +287,10 @@ class GenerateLef:
         Args:
             pin_index (int): Pin index to use for the name `pin_<pin_index>`.
         """
-        pin_name = f"pin_{pin_index}"
-        port: List = [f"\tPIN {pin_name}"]
-        direction = random.choice(["INPUT", "OUTPUT", "INOUT"])
-        use = random.choice(["SIGNAL", "POWER", "GROUND"])
-        port.append(f"\t\tDIRECTION {direction} ;")
-        port.append(f"\t\tUSE {use} ;")
-        port.append("\t\tPORT")
-        port.append("\t\t\tLAYER M1 ;")
-        self._get_pin_placement_info()
-        shape_str = self._get_pin_shape(pin_index=pin_index)
-        port.append(f"\t\t\tRECT {shape_str} ;")
-        port.append("\t\tEND PORT")
-        port.append(f"\tEND {pin_name}")
-        return port
+        direction = self._random.choice(DIRECTIONS)
+        use = self._random.choice(USES)
+        shape_str = self.get_pin_rects(self._get_first_side(self._nb_formatted_cells))[pin_index % self._nb_ports]
+        return PIN_TEMPLATE.format(pin_index, direction, use, shape_str).rstrip("\n").split("\n")
 
     def generate_lef(self) -> None:
         """
@@ -0,0 +1,173 @@
+"""
+In memory cache of the distance matrices and nearest neighbours of pin locations.
+Chaining the same locations again, e.g. with other start and end pins, reuses the
+arrays of the previous chains instead of computing them again.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+import numpy as np
+from src.spatial_index import GridIndex
+
+# Size of the cached arrays above which the least recently used ones are removed.
+GEOMETRY_CACHE_MAX_BYTES = 1 << 28
+# Bytes counted for each value of a nested python list: the pointer and an int object.
+LIST_ITEM_BYTES = 8 + 32
+
+
+class GeometryCache:
+    """
+    Least recently used arrays computed from pin locations.
+    Entries are keyed on a hash of the coordinates, so a copy of the same locations hits
+    the cache and moved locations miss it. Cached arrays are read only, since they are
+    shared by every chain of the same locations. The rows of a distance matrix as python
+    lists, as ortools registers them, are cached too and must not be modified either.
+    """
+
+    def __init__(self, max_bytes: int = GEOMETRY_CACHE_MAX_BYTES) -> None:
+        """Init the cache.
+
+        Args:
+            max_bytes (int, optional): Size of the cached arrays above which the least recently used
+                ones are removed, larger arrays are never cached. Defaults to GEOMETRY_CACHE_MAX_BYTES.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        # Cached value and its size in bytes, by key.
+        self._entries: 'OrderedDict[tuple, Tuple[Any, int]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(locations: np.ndarray) -> str:
+        """Get the key of locations.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+
+        Returns:
+            str: Hash of the coordinates as float64.
+        """
+        points = np.ascontiguousarray(locations, dtype=np.float64).reshape(-1, 2)
+        return hashlib.blake2b(points.data, digest_size=16).hexdigest()
+
+    def get(self, locations: np.ndarray, name: Hashable, build: Callable[[], np.ndarray]) -> np.ndarray:
+        """Get an array of locations, built and cached on a miss.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            name (Hashable): Name of the array and of the parameters it is built with.
+            build (Callable[[], np.ndarray]): Builds the array.
+
+        Returns:
+            np.ndarray: Read only array.
+        """
+        return self._get((self.key(locations), name), build)
+
+    def dist_rows(self, locations: np.ndarray, scale: float, dtype: type, metric: str = 'euclidean') -> List[list]:
+        """Get the distance matrix of locations as nested lists, ready for `Chain.solve_routes`.
+        Converting a large matrix to lists costs about as much as computing it.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            scale (float): Factor applied to distances before rounding.
+            dtype (type): np.int32 or np.int64.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            List[list]: Shared rows of the matrix, never modified.
+        """
+        return self._get((self.key(locations), ('dist_rows', scale, np.dtype(dtype).name, metric)),
+                         lambda: self.dist_array(locations, scale, dtype, metric).tolist(),
+                         lambda rows: LIST_ITEM_BYTES * len(rows) ** 2 + 64 * len(rows))
+
+    def dist_array(self, locations: np.ndarray, scale: float, dtype: type, metric: str = 'euclidean') -> np.ndarray:
+        """Get the distance matrix of locations, see `Chain.get_dist_array`.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            scale (float): Factor applied to distances before rounding.
+            dtype (type): np.int32 or np.int64.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: Read only (n, n) matrix, [index_from, index_to] = scaled dist
+        """
+        from src.chain import Chain
+        return self.get(locations, ('dist_array', scale, np.dtype(dtype).name, metric),
+                        lambda: Chain.get_dist_array(locations, scale=scale, dtype=dtype, metric=metric))
+
+    def neighbors(self, locations: np.ndarray, k: int, metric: str = 'euclidean') -> np.ndarray:
+        """Get the k nearest neighbours of each location.
+        Neighbours are sorted closest first, so the neighbours of a larger k are cut instead of searched again.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            k (int): Number of neighbours
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: Read only (n, k) array of neighbour indexes, closest first
+        """
+        key = (self.key(locations), ('neighbors', metric))
+        cached = self._entries.get(key, (None, 0))[0]
+        if cached is not None and (cached.shape[1] >= k or cached.shape[1] == len(cached) - 1):
+            return self._get(key, None)[:, :k]
+        if cached is not None:
+            self._remove(key)
+        return self._get(key, lambda: GridIndex(locations).knn(k, metric))
+
+    def invalidate(self, locations: Optional[np.ndarray] = None) -> int:
+        """Remove the arrays of locations, or every array.
+
+        Args:
+            locations (np.ndarray, optional): (n, 2) array of coordinates, every array if None. Defaults to None.
+
+        Returns:
+            int: Number of removed arrays.
+        """
+        if locations is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            self.nbytes = 0
+            return removed
+        location_key = self.key(locations)
+        keys = [key for key in self._entries if key[0] == location_key]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def info(self) -> dict:
+        """Get the counters of the cache.
+
+        Returns:
+            dict: hits, misses, arrays and bytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'arrays': len(self._entries), 'bytes': self.nbytes}
+
+    def _get(self,
+             key: tuple,
+             build: Optional[Callable[[], Any]],
+             size: Optional[Callable[[Any], int]] = None) -> Any:
+        cached = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return cached[0]
+        self.misses += 1
+        value = build()
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        nbytes = size(value) if size else value.nbytes
+        if nbytes <= self.max_bytes:
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return value
+
+    def _remove(self, key: tuple) -> None:
+        self.nbytes -= self._entries.pop(key)[1]
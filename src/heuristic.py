@@ -0,0 +1,407 @@
+"""
+Heuristic chain engine.
+A nearest neighbour path improved by 2-opt and Or-opt moves restricted to
+the k nearest neighbours of each node. Start and end of the path never move.
+"""
+import time
+from collections import deque
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+from src.spatial_index import GridIndex, metric_dist, scalar_dist
+
+DEFAULT_NEIGHBORS = 8
+OR_OPT_SEGMENT = 3
+EPSILON = 1e-9
+
+
+def nearest_neighbor_path(locations: np.ndarray,
+                          neighbors: np.ndarray,
+                          start: int,
+                          end: int,
+                          metric: str = 'euclidean') -> np.ndarray:
+    """Build a nearest neighbour path from start to end.
+    The next node is the closest unvisited neighbour, or the closest unvisited node
+    when every neighbour has already been visited.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        neighbors (np.ndarray): (n, k) array of neighbour indexes, closest first
+        start (int): Start index
+        end (int): End index
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+    Returns:
+        np.ndarray: Node indexes, by order of routing
+    """
+    n_nodes = len(locations)
+    unvisited = np.ones(n_nodes, dtype=bool)
+    unvisited[[start, end]] = False
+    is_unvisited = unvisited.tolist()
+    neighbor_lists = neighbors.tolist()
+    path = np.empty(n_nodes, dtype=np.int64)
+    path[0], path[-1] = start, end
+    current = start
+    for position in range(1, n_nodes - 1):
+        current = next((node for node in neighbor_lists[current] if is_unvisited[node]), -1)
+        if current < 0:
+            candidates = np.flatnonzero(unvisited)
+            delta = locations[candidates] - locations[path[position - 1]]
+            current = int(candidates[np.argmin(metric_dist(delta[:, 0], delta[:, 1], metric))])
+        path[position] = current
+        unvisited[current] = is_unvisited[current] = False
+    return path
+
+
+def path_length(locations: np.ndarray, path: np.ndarray, metric: str = 'euclidean') -> float:
+    """Length of a path.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        path (np.ndarray): Node indexes, by order of routing
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+    Returns:
+        float: Sum of the distances between consecutive nodes.
+    """
+    delta = np.diff(np.asarray(locations, dtype=np.float64)[path], axis=0)
+    return float(metric_dist(delta[:, 0], delta[:, 1], metric).sum())
+
+
+class LazyNeighbors:
+    """Nearest neighbours searched on first access and kept, for searches that only visit a few nodes."""
+
+    def __init__(self, grid: GridIndex, k: int, metric: str = 'euclidean', nodes: Optional[np.ndarray] = None) -> None:
+        """Init the neighbours.
+
+        Args:
+            grid (GridIndex): Grid over the locations
+            k (int): Number of neighbours
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            nodes (np.ndarray, optional): Grid index of each node, when the nodes are a subset of the grid.
+                Neighbours outside of the subset are dropped. Defaults to None.
+        """
+        self.grid = grid
+        self.k = k
+        self.metric = metric
+        self.nodes = nodes
+        if nodes is not None:
+            self._node_of = np.full(len(grid.points), -1, dtype=np.int64)
+            self._node_of[nodes] = np.arange(len(nodes))
+        self._neighbors: dict = {}
+
+    def __getitem__(self, node: int) -> list:
+        if node not in self._neighbors:
+            if self.nodes is None:
+                self._neighbors[node] = self.grid.knn(self.k, self.metric, rows=[node])[0].tolist()
+            else:
+                found = self._node_of[self.grid.knn(self.k, self.metric, rows=[self.nodes[node]])[0]]
+                self._neighbors[node] = found[found >= 0].tolist()
+        return self._neighbors[node]
+
+
+class LocalSearch:
+    """2-opt and Or-opt local search over a path with fixed extremities.
+    Nodes whose surroundings changed are queued again (don't look bits), so the
+    search stops when no queued node has an improving move.
+    """
+
+    def __init__(self,
+                 locations: np.ndarray,
+                 path: np.ndarray,
+                 neighbors: np.ndarray,
+                 metric: str = 'euclidean',
+                 seeds: Optional[Sequence[int]] = None) -> None:
+        """Init the search.
+
+        Args:
+            locations (np.ndarray): (n, 2) array of coordinates
+            path (np.ndarray): Initial path, modified in place
+            neighbors (np.ndarray): (n, k) array of neighbour indexes, or a `LazyNeighbors`
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            seeds (Sequence[int], optional): Nodes queued at first, every node if None. Defaults to None.
+        """
+        self.path = path
+        self.position = np.empty(len(path), dtype=np.int64)
+        self.position[path] = np.arange(len(path))
+        self.neighbors = neighbors.tolist() if isinstance(neighbors, np.ndarray) else neighbors
+        self.locations = locations
+        self.x_list = locations[:, 0].tolist()
+        self.y_list = locations[:, 1].tolist()
+        self.metric = metric
+        ends = (int(path[0]), int(path[-1]))
+        nodes = path[1:-1].tolist() if seeds is None else [node for node in dict.fromkeys(seeds) if node not in ends]
+        self.queue = deque(nodes)
+        self.queued = np.zeros(len(path), dtype=bool)
+        self.queued[nodes] = True
+        self.moves = 0
+        # Total length removed by the moves.
+        self.gain = 0.0
+
+    def dist(self, from_n: int, to_n: int) -> float:
+        """Distance between two nodes.
+
+        Args:
+            from_n (int): Node index
+            to_n (int): Node index
+
+        Returns:
+            float: distance
+        """
+        return scalar_dist(self.x_list[from_n] - self.x_list[to_n], self.y_list[from_n] - self.y_list[to_n], self.metric)
+
+    def run(self,
+            max_moves: int = -1,
+            time_limit: Optional[float] = None,
+            target_length: Optional[float] = None) -> np.ndarray:
+        """Apply improving moves until none is found.
+
+        Args:
+            max_moves (int, optional): Stop after this many moves, unlimited if negative. Defaults to -1.
+            time_limit (float, optional): Stop after this many seconds, unlimited if None. Defaults to None.
+            target_length (float, optional): Stop once the path is this short. Defaults to None.
+
+        Returns:
+            np.ndarray: Improved path
+        """
+        deadline = time.perf_counter() + time_limit if time_limit else None
+        target_gain = path_length(self.locations, self.path, self.metric) - target_length if target_length else None
+        iteration = 0
+        while self.queue and self.moves != max_moves:
+            iteration += 1
+            if deadline and iteration % 256 == 0 and time.perf_counter() > deadline:
+                break
+            node = self.queue.popleft()
+            self.queued[node] = False
+            if self.two_opt(node) or self.or_opt(node):
+                self.moves += 1
+                self._push(node)
+                if target_gain is not None and self.gain >= target_gain:
+                    break
+        return self.path
+
+    def _push(self, *nodes: int) -> None:
+        for node in nodes:
+            if not self.queued[node]:
+                self.queued[node] = True
+                self.queue.append(node)
+
+    def _touch(self, *positions: int) -> None:
+        last = len(self.path) - 1
+        self._push(*(int(self.path[position]) for position in positions if 0 < position < last))
+
+    def two_opt(self, node: int) -> bool:
+        """Try to reverse a segment so that node gets linked to one of its neighbours.
+
+        Args:
+            node (int): Node index
+
+        Returns:
+            bool: True if the path was improved
+        """
+        path, last = self.path, len(self.path) - 1
+        node_pos = int(self.position[node])
+        for neighbor in self.neighbors[node]:
+            neighbor_pos = int(self.position[neighbor])
+            low, high = min(node_pos, neighbor_pos), max(node_pos, neighbor_pos)
+            # Reversing [low + 1, high] links path[low] to path[high], reversing [low, high - 1] links path[low - 1]...
+            for first, final in ((low + 1, high), (low, high - 1)):
+                if first < 1 or final > last - 1 or first >= final:
+                    continue
+                before, head, tail, after = (int(path[first - 1]), int(path[first]),
+                                             int(path[final]), int(path[final + 1]))
+                gain = (self.dist(before, head) + self.dist(tail, after)
+                        - self.dist(before, tail) - self.dist(head, after))
+                if gain > EPSILON:
+                    self.gain += gain
+                    path[first:final + 1] = path[first:final + 1][::-1].copy()
+                    self.position[path[first:final + 1]] = np.arange(first, final + 1)
+                    self._touch(first - 1, first, final, final + 1)
+                    return True
+        return False
+
+    def or_opt(self, node: int) -> bool:
+        """Try to move a segment starting at node next to a neighbour of its extremities.
+
+        Args:
+            node (int): Node index
+
+        Returns:
+            bool: True if the path was improved
+        """
+        path, last = self.path, len(self.path) - 1
+        first = int(self.position[node])
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            final = first + length - 1
+            if first < 1 or final > last - 1:
+                break
+            head, tail = int(path[first]), int(path[final])
+            before, after = int(path[first - 1]), int(path[final + 1])
+            removal_gain = self.dist(before, head) + self.dist(tail, after) - self.dist(before, after)
+            if removal_gain <= EPSILON:
+                continue
+            for neighbor in self.neighbors[head] + self.neighbors[tail]:
+                neighbor_pos = int(self.position[neighbor])
+                for insert_pos in (neighbor_pos - 1, neighbor_pos):
+                    # Insert between path[insert_pos] and path[insert_pos + 1], outside of the segment.
+                    if insert_pos < 0 or insert_pos > last - 1 or first - 1 <= insert_pos <= final:
+                        continue
+                    left, right = int(path[insert_pos]), int(path[insert_pos + 1])
+                    forward = self.dist(left, head) + self.dist(tail, right)
+                    backward = self.dist(left, tail) + self.dist(head, right)
+                    gain = removal_gain - min(forward, backward) + self.dist(left, right)
+                    if gain > EPSILON:
+                        self.gain += gain
+                        self._move(first, final, insert_pos, backward < forward)
+                        return True
+        return False
+
+    def _move(self, first: int, final: int, insert_pos: int, reverse: bool) -> None:
+        path = self.path
+        segment = path[first:final + 1].copy()
+        if reverse:
+            segment = segment[::-1]
+        if insert_pos > final:
+            low, high = first, insert_pos
+            path[low:high + 1] = np.concatenate([path[final + 1:insert_pos + 1], segment])
+        else:
+            low, high = insert_pos + 1, final
+            path[low:high + 1] = np.concatenate([segment, path[insert_pos + 1:first]])
+        self.position[path[low:high + 1]] = np.arange(low, high + 1)
+        self._touch(first - 1, first, final + 1, insert_pos, insert_pos + 1, low, high)
+
+
+def solve(locations: np.ndarray,
+          start: int,
+          end: int,
+          k: int = DEFAULT_NEIGHBORS,
+          metric: str = 'euclidean',
+          neighbors: Optional[np.ndarray] = None,
+          time_limit: Optional[float] = None,
+          on_solution: Optional[Callable[[float, float], None]] = None,
+          target_length: Optional[float] = None) -> np.ndarray:
+    """Chain locations from start to end with the heuristic engine.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        start (int): Start index
+        end (int): End index
+        k (int, optional): Number of nearest neighbours considered by the moves. Defaults to DEFAULT_NEIGHBORS.
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+        neighbors (np.ndarray, optional): Precomputed (n, k) neighbour indexes. Defaults to None.
+        time_limit (float, optional): Time budget of the local search in seconds. Defaults to None.
+        on_solution (Callable[[float, float], None], optional): Called with the length and elapsed seconds
+            of the nearest neighbour path and of the improved path. Defaults to None.
+        target_length (float, optional): Stop the local search once the path is this short. Defaults to None.
+
+    Returns:
+        np.ndarray: Node indexes, by order of routing
+    """
+    begin = time.perf_counter()
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    if neighbors is None:
+        neighbors = GridIndex(locations).knn(k, metric)
+    path = nearest_neighbor_path(locations, neighbors, start, end, metric)
+    if on_solution:
+        on_solution(path_length(locations, path, metric), time.perf_counter() - begin)
+    remaining = max(time_limit - (time.perf_counter() - begin), 0.0) if time_limit else None
+    if remaining == 0.0:
+        return path
+    path = LocalSearch(locations, path, neighbors, metric).run(time_limit=remaining, target_length=target_length)
+    if on_solution:
+        on_solution(path_length(locations, path, metric), time.perf_counter() - begin)
+    return path
+
+
+def repair(locations: np.ndarray,
+           paths: List[np.ndarray],
+           pending: Sequence[int],
+           seeds: Sequence[int] = (),
+           k: int = DEFAULT_NEIGHBORS,
+           metric: str = 'euclidean',
+           max_moves: int = -1,
+           time_limit: Optional[float] = None) -> List[np.ndarray]:
+    """Insert nodes into existing paths and improve the paths around the changes only.
+    Each pending node is inserted where it lengthens the paths the least, next to one of
+    its k nearest placed nodes. The local search then starts from the inserted nodes, their
+    new neighbours and the seeds instead of every node, so the time depends on the size of
+    the change rather than on the size of the paths.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        paths (List[np.ndarray]): Paths over part of the nodes, their extremities never move
+        pending (Sequence[int]): Nodes in no path, to insert
+        seeds (Sequence[int], optional): Nodes of the paths whose surroundings changed,
+            e.g. the neighbours of removed nodes. Defaults to ().
+        k (int, optional): Number of nearest neighbours considered. Defaults to DEFAULT_NEIGHBORS.
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+        max_moves (int, optional): Moves of the local search of each path, unlimited if negative. Defaults to -1.
+        time_limit (float, optional): Time budget of the local search in seconds. Defaults to None.
+
+    Returns:
+        List[np.ndarray]: Repaired paths
+    """
+    deadline = time.perf_counter() + time_limit if time_limit else None
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    pending = np.asarray(pending, dtype=np.int64)
+    path_of = np.full(len(locations), -1, dtype=np.int64)
+    next_node = np.full(len(locations), -1, dtype=np.int64)
+    previous_node = np.full(len(locations), -1, dtype=np.int64)
+    position = np.empty(len(locations), dtype=np.int64)
+    for path_id, path in enumerate(paths):
+        path_of[path] = path_id
+        next_node[path[:-1]] = path[1:]
+        previous_node[path[1:]] = path[:-1]
+        position[path] = np.arange(len(path))
+    kept = path_of >= 0
+
+    grid = GridIndex(locations)
+    neighbor_rows = grid.knn(k, metric, rows=pending) if len(pending) else np.empty((0, k), dtype=np.int64)
+    for node, neighbors in zip(pending.tolist(), neighbor_rows):
+        width = k
+        while True:
+            placed = neighbors[path_of[neighbors] >= 0]
+            before = np.concatenate([previous_node[placed], placed])
+            after = np.concatenate([placed, next_node[placed]])
+            valid = (before >= 0) & (after >= 0)
+            if valid.any() or width >= len(locations) - 1:
+                break
+            width *= 2
+            neighbors = grid.knn(width, metric, rows=[node])[0]
+        before, after = before[valid], after[valid]
+        delta_before, delta_after = locations[before] - locations[node], locations[node] - locations[after]
+        delta_edge = locations[before] - locations[after]
+        cost = (metric_dist(delta_before[:, 0], delta_before[:, 1], metric)
+                + metric_dist(delta_after[:, 0], delta_after[:, 1], metric)
+                - metric_dist(delta_edge[:, 0], delta_edge[:, 1], metric))
+        best = int(np.argmin(cost))
+        left, right = int(before[best]), int(after[best])
+        next_node[left], previous_node[node], next_node[node], previous_node[right] = node, left, right, node
+        path_of[node] = path_of[left]
+
+    # Inserted nodes form runs between two kept nodes, each run goes after its kept head.
+    inserts: list = [([], []) for _ in paths]
+    for node in pending.tolist():
+        head = int(previous_node[node])
+        if not kept[head]:
+            continue
+        indexes, values = inserts[path_of[head]]
+        while not kept[node]:
+            indexes.append(position[head] + 1)
+            values.append(node)
+            node = int(next_node[node])
+    paths = [np.insert(path, indexes, values).astype(np.int64) if values else path
+             for path, (indexes, values) in zip(paths, inserts)]
+
+    touched = np.unique(np.concatenate([pending, previous_node[pending], next_node[pending],
+                                        np.asarray(seeds, dtype=np.int64)]))
+    touched_paths = path_of[touched]
+    for path_id, path in enumerate(paths):
+        path_seeds = touched[touched_paths == path_id]
+        if not len(path_seeds) or len(path) < 4:
+            continue
+        position[path] = np.arange(len(path))
+        neighbors = LazyNeighbors(grid, k, metric, nodes=path)
+        remaining = max(deadline - time.perf_counter(), 1e-3) if deadline else None
+        search = LocalSearch(locations[path], np.arange(len(path)), neighbors, metric, seeds=position[path_seeds].tolist())
+        paths[path_id] = path[search.run(max_moves, time_limit=remaining)]
+    return paths
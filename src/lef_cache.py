@@ -0,0 +1,277 @@
+"""
+Persistent binary cache of parsed lef files.
+Each entry is a directory of .npy arrays holding every cell, port and shape of a
+lef file, warm loads map them in memory instead of parsing the text again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import List, Optional
+import numpy as np
+from definition import ROOT_DIR
+from src.lef_parser import MACRO_INDEX_SUFFIX, LefCell
+
+CACHE_DIR = f"{ROOT_DIR}/.lef_cache"
+# Size of the cache directory above which the least recently used entries are removed.
+CACHE_MAX_BYTES = 1 << 30
+# Bumped when the layout of an entry changes, so old entries are never read.
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+# File of the cache directory mapping the absolute path of each lef to its size, modification time
+# and content hash, so that an unchanged lef is not read again to get its key.
+HASHES_FILE = 'hashes.json'
+CACHE_ARRAYS = ('points', 'shape_ends', 'port_shapes', 'cell_points', 'cell_shapes', 'cell_ports',
+                'cell_sizes', 'port_strings')
+
+
+class LefCache:
+    """
+    Directory of parsed lef files.
+    An entry is keyed on the size, modification time and content hash of its lef, a
+    touched or edited file gets a new entry and the old one ages out of the cache.
+    The content hash of a lef is kept in HASHES_FILE and only computed again when the
+    size or the modification time of the lef changes.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        """Init the cache.
+
+        Args:
+            cache_dir (str, optional): Directory of the entries, created if missing. Defaults to CACHE_DIR.
+            max_bytes (int, optional): Size above which the least recently used entries are removed.
+                Defaults to CACHE_MAX_BYTES.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, lef_path: str) -> str:
+        """Get the key of a lef file.
+
+        Args:
+            lef_path (str): Path of the lef.
+
+        Returns:
+            str: Content hash, size and modification time of the file.
+        """
+        stat = os.stat(lef_path)
+        path = os.path.abspath(lef_path)
+        hashes = self._load_hashes()
+        saved = hashes.get(path)
+        if saved is not None and saved[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return f"{saved[2]}-{stat.st_size}-{stat.st_mtime_ns}"
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(CACHE_VERSION).encode())
+        with open(lef_path, 'rb') as lef_stream:
+            for chunk in iter(lambda: lef_stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._save_hashes(hashes)
+        return f"{digest.hexdigest()}-{stat.st_size}-{stat.st_mtime_ns}"
+
+    def _load_hashes(self) -> dict:
+        """Read HASHES_FILE.
+
+        Returns:
+            dict: Size, modification time and content hash by absolute path of lef, empty if the file is missing.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, HASHES_FILE), encoding='utf-8') as hashes_stream:
+                hashes = json.load(hashes_stream)
+        except (OSError, ValueError):
+            return {}
+        return hashes if isinstance(hashes, dict) else {}
+
+    def _save_hashes(self, hashes: dict) -> None:
+        """Write HASHES_FILE, through a temporary file so that a reader never sees a partial file.
+
+        Args:
+            hashes (dict): Size, modification time and content hash by absolute path of lef.
+        """
+        hashes = {path: saved for path, saved in hashes.items() if os.path.exists(path)}
+        partial = os.path.join(self.cache_dir, f"{HASHES_FILE}.{os.getpid()}.tmp")
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(partial, 'w', encoding='utf-8') as hashes_stream:
+                json.dump(hashes, hashes_stream)
+            os.replace(partial, os.path.join(self.cache_dir, HASHES_FILE))
+        except OSError:
+            pass
+
+    def load(self, key: str) -> Optional[List[LefCell]]:
+        """Load the cells of an entry, arrays are memory mapped and not read.
+        Only the cells are built, the ports of a cell are built from its slice of the
+        port strings array on first access, see `LefCell.ports`.
+
+        Args:
+            key (str): Key of the lef, see `key`.
+
+        Returns:
+            Optional[List[LefCell]]: Cells in the order of the lef file, None if the entry does not exist.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as meta_stream:
+                meta = json.load(meta_stream)
+            arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r') for name in CACHE_ARRAYS}
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != CACHE_VERSION:
+            return None
+        os.utime(entry)
+        strings = [sys.intern(string) for string in meta['strings']] + [None]
+        cell_points, cell_shapes, cell_ports = (arrays['cell_points'].tolist(), arrays['cell_shapes'].tolist(),
+                                                arrays['cell_ports'].tolist())
+        cells = []
+        for index, (cell_name, size) in enumerate(zip(meta['cells'], arrays['cell_sizes'].tolist())):
+            cell = LefCell(cell_name)
+            if not np.isnan(size[0]):
+                cell.size = ((0.0, 0.0), (0.0, size[1]), (size[0], size[1]), (size[0], 0.0))
+            cell.points = arrays['points'][cell_points[index]:cell_points[index + 1]]
+            cell.shape_ends = arrays['shape_ends'][cell_shapes[index]:cell_shapes[index + 1]]
+            cell.port_shapes = arrays['port_shapes'][cell_ports[index] + index:cell_ports[index + 1] + index + 1]
+            cell.port_table = (strings, arrays['port_strings'][cell_ports[index]:cell_ports[index + 1]])
+            cells.append(cell)
+        return cells
+
+    def store(self, key: str, cells: List[LefCell]) -> None:
+        """Write the cells of a lef in a new entry, then evict the least recently used entries.
+        Shape indexes are stored relative to their cell so that loaded cells are slices of the arrays.
+
+        Args:
+            key (str): Key of the lef, see `key`.
+            cells (List[LefCell]): Cells of the lef, lazy ports are decoded.
+        """
+        strings: dict = {}
+        points, shape_ends, port_shapes = [], [], []
+        cell_points, cell_shapes, cell_ports = [0], [0], [0]
+        cell_sizes, port_strings = [], []
+        for cell in cells:
+            if cell.source is None:
+                cell_point_array, cell_shape_ends, cell_port_shapes = cell.points, cell.shape_ends, cell.port_shapes
+            else:
+                cell_point_array, cell_shape_ends, cell_port_shapes = self._decoded_arrays(cell)
+            points.append(cell_point_array)
+            shape_ends.append(cell_shape_ends)
+            port_shapes.append(cell_port_shapes)
+            cell_points.append(cell_points[-1] + len(cell_point_array))
+            cell_shapes.append(cell_shapes[-1] + len(cell_shape_ends))
+            cell_ports.append(cell_ports[-1] + len(cell.ports))
+            cell_sizes.append(cell.size[2] if cell.size else (np.nan, np.nan))
+            for port in cell.ports:
+                port_strings.append([-1 if string is None else strings.setdefault(string, len(strings)) for string in
+                                     (port.get_name(), port.get_direction(), port.get_use(), port.get_layer())])
+        arrays = {
+            'points': np.concatenate(points).reshape(-1, 2) if points else np.empty((0, 2)),
+            'shape_ends': np.concatenate(shape_ends) if shape_ends else np.empty(0, dtype=np.int64),
+            'port_shapes': np.concatenate(port_shapes) if port_shapes else np.empty(0, dtype=np.int64),
+            'cell_points': np.array(cell_points, dtype=np.int64),
+            'cell_shapes': np.array(cell_shapes, dtype=np.int64),
+            'cell_ports': np.array(cell_ports, dtype=np.int64),
+            'cell_sizes': np.array(cell_sizes, dtype=np.float64).reshape(-1, 2),
+            'port_strings': np.array(port_strings, dtype=np.int32).reshape(-1, 4)
+        }
+        meta = {'version': CACHE_VERSION, 'cells': [cell.get_name() for cell in cells], 'strings': list(strings)}
+        entry = os.path.join(self.cache_dir, key)
+        # Written in a temporary directory and renamed, a reader never sees a partial entry.
+        partial = f"{entry}.{os.getpid()}.tmp"
+        os.makedirs(partial, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(partial, f"{name}.npy"), array)
+        with open(os.path.join(partial, 'meta.json'), 'w', encoding='utf-8') as meta_stream:
+            json.dump(meta, meta_stream)
+        try:
+            os.rename(partial, entry)
+        except OSError:
+            shutil.rmtree(partial, ignore_errors=True)
+        self.evict(keep=key)
+
+    @staticmethod
+    def _decoded_arrays(cell: LefCell) -> tuple:
+        """Build the shape arrays of a lazy cell from its decoded ports.
+
+        Args:
+            cell (LefCell): Lazy cell.
+
+        Returns:
+            tuple: points, shape_ends and port_shapes arrays.
+        """
+        polygons = [port.get_polygons() for port in cell.ports]
+        shapes = [polygon for port_polygons in polygons for polygon in port_polygons]
+        points = np.array([point for polygon in shapes for point in polygon], dtype=np.float64).reshape(-1, 2)
+        shape_ends = np.cumsum([len(polygon) for polygon in shapes], dtype=np.int64)
+        port_shapes = np.cumsum([0] + [len(port_polygons) for port_polygons in polygons], dtype=np.int64)
+        return points, shape_ends, port_shapes
+
+    def entries(self) -> List[str]:
+        """Get the keys of the cache, least recently used first.
+
+        Returns:
+            List[str]: Keys.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        keys = [key for key in os.listdir(self.cache_dir)
+                if not key.endswith('.tmp') and os.path.isdir(os.path.join(self.cache_dir, key))]
+        return sorted(keys, key=lambda key: os.path.getmtime(os.path.join(self.cache_dir, key)))
+
+    def index_files(self) -> List[str]:
+        """Get the macro index files written in the cache directory by `LefParser.get_macro_index`.
+
+        Returns:
+            List[str]: File names.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(MACRO_INDEX_SUFFIX)]
+
+    def entry_size(self, key: str) -> int:
+        """Get the size of an entry, or of a macro index file, on disk.
+
+        Args:
+            key (str): Key of the entry, or name of the index file.
+
+        Returns:
+            int: Size in bytes.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isfile(entry):
+            return os.path.getsize(entry)
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry or a macro index file.
+
+        Args:
+            key (str): Key of the entry, or name of the index file.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isfile(entry):
+            os.remove(entry)
+        else:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove the least recently used entries and macro index files until the cache fits in max_bytes.
+
+        Args:
+            keep (str, optional): Key never removed, usually the entry just written. Defaults to None.
+        """
+        keys = sorted(self.entries() + self.index_files(),
+                      key=lambda key: os.path.getmtime(os.path.join(self.cache_dir, key)))
+        sizes = {key: self.entry_size(key) for key in keys}
+        total = sum(sizes.values())
+        for key in keys:
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key)
+                total -= sizes[key]
+
+    def clear(self) -> None:
+        """Remove every entry, macro index file and saved hash of the cache."""
+        for key in self.entries() + self.index_files():
+            self._remove(key)
+        if os.path.exists(os.path.join(self.cache_dir, HASHES_FILE)):
+            os.remove(os.path.join(self.cache_dir, HASHES_FILE))
@@ -0,0 +1,165 @@
+"""
+Library of lef files.
+Files are loaded in a process pool, big files are split in shards at MACRO
+boundaries so that one file is also parsed by several processes.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from src.lef_parser import LefCell, LefParser
+
+# Files bigger than this are split in shards parsed in parallel.
+SHARD_BYTES = 1 << 24
+DUPLICATE_POLICIES = ('error', 'first', 'last')
+
+
+class LefLibrary:
+    """
+    Cells of several lef files, indexed by name.
+    """
+
+    class LefLibraryException(Exception):
+        """Exception raised by the LefLibrary class."""
+
+    def __init__(self,
+                 source: Union[str, Iterable[str]],
+                 processes: Optional[int] = None,
+                 shard_bytes: int = SHARD_BYTES,
+                 duplicates: str = 'error') -> None:
+        """Load the library.
+
+        Args:
+            source (Union[str, Iterable[str]]): Directory of lef files, glob pattern, lef file or list of lef files.
+            processes (int, optional): Number of worker processes, every cpu if None and no pool if 1.
+                Defaults to None.
+            shard_bytes (int, optional): Files bigger than this are split in shards of about this size.
+                Defaults to SHARD_BYTES.
+            duplicates (str, optional): What to do when a macro name is in several files: 'error' raises,
+                'first' and 'last' keep the cell of the first or last file. Defaults to 'error'.
+
+        Raises:
+            LefLibraryException: Unknown duplicate policy, no lef file found or duplicate macro name.
+        """
+        if duplicates not in DUPLICATE_POLICIES:
+            raise LefLibrary.LefLibraryException(
+                f"Unknown duplicate policy {duplicates}, expected one of {DUPLICATE_POLICIES}")
+        self.lef_paths = LefLibrary.find_files(source)
+        if not self.lef_paths:
+            raise LefLibrary.LefLibraryException(f"No lef file found in {source}")
+        self.cells: Dict[str, LefCell] = {}
+        self.origins: Dict[str, str] = {}
+        self.duplicates: Dict[str, List[str]] = {}
+        shards = [shard for lef_path in self.lef_paths for shard in LefLibrary.get_shards(lef_path, shard_bytes)]
+        if processes == 1 or len(shards) == 1:
+            shard_cells = [LefLibrary._parse_shard(shard) for shard in shards]
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(shards))) as executor:
+                shard_cells = list(executor.map(LefLibrary._parse_shard, shards))
+        for (lef_path, _, _), cells in zip(shards, shard_cells):
+            self._merge(lef_path, cells, duplicates)
+
+    @staticmethod
+    def find_files(source: Union[str, Iterable[str]]) -> List[str]:
+        """Get the lef files of a source.
+
+        Args:
+            source (Union[str, Iterable[str]]): Directory of lef files, glob pattern, lef file or list of lef files.
+
+        Returns:
+            List[str]: Paths of the lef files, sorted for directories and patterns.
+        """
+        if not isinstance(source, str):
+            return list(source)
+        if os.path.isdir(source):
+            return sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith('.lef'))
+        if os.path.isfile(source):
+            return [source]
+        return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+    @staticmethod
+    def get_shards(lef_path: str, shard_bytes: int = SHARD_BYTES) -> List[Tuple[str, int, int]]:
+        """Split a lef file in byte ranges starting at MACRO lines.
+        The first shard also holds the header of the file.
+
+        Args:
+            lef_path (str): Path of the lef.
+            shard_bytes (int, optional): Approximate size of a shard. Defaults to SHARD_BYTES.
+
+        Returns:
+            List[Tuple[str, int, int]]: Path, start and end offsets of each shard.
+        """
+        parser = LefParser(lef_path)
+        size = os.path.getsize(lef_path)
+        bounds = [0]
+        while bounds[-1] < size:
+            bounds.append(parser.next_macro(bounds[-1] + max(shard_bytes, 1)))
+        if len(bounds) == 1:
+            bounds.append(size)
+        return [(lef_path, start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def _parse_shard(shard: Tuple[str, int, int]) -> List[LefCell]:
+        """Parse the cells of a shard, run in the worker processes.
+
+        Args:
+            shard (Tuple[str, int, int]): Path, start and end offsets of the shard.
+
+        Returns:
+            List[LefCell]: Cells of the shard.
+        """
+        lef_path, start, end = shard
+        return list(LefParser(lef_path).parse_cells(start, end))
+
+    def _merge(self, lef_path: str, cells: List[LefCell], duplicates: str) -> None:
+        """Add the cells of a shard to the name index.
+
+        Args:
+            lef_path (str): Path of the lef of the shard.
+            cells (List[LefCell]): Cells of the shard.
+            duplicates (str): Duplicate policy, see `__init__`.
+
+        Raises:
+            LefLibraryException: Duplicate macro name with the 'error' policy.
+        """
+        for cell in cells:
+            name = cell.get_name()
+            if name in self.cells:
+                self.duplicates.setdefault(name, [self.origins[name]]).append(lef_path)
+                if duplicates == 'error':
+                    raise LefLibrary.LefLibraryException(
+                        f"Macro {name} is defined in {self.origins[name]} and {lef_path}")
+                if duplicates == 'first':
+                    continue
+            self.cells[name] = cell
+            self.origins[name] = lef_path
+
+    def get_cell(self, cell_name: str) -> LefCell:
+        """Get a cell by name.
+
+        Args:
+            cell_name (str): Name of the macro.
+
+        Raises:
+            LefLibraryException: Unknown macro.
+
+        Returns:
+            LefCell: Cell.
+        """
+        if cell_name not in self.cells:
+            raise LefLibrary.LefLibraryException(f"Unknown macro {cell_name}")
+        return self.cells[cell_name]
+
+    def get_cells(self) -> Iterable[LefCell]:
+        """Get every cell of the library.
+
+        Returns:
+            Iterable[LefCell]: Cells, in the order of the files.
+        """
+        return list(self.cells.values())
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __contains__(self, cell_name: str) -> bool:
+        return cell_name in self.cells
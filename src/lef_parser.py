@@ -3,16 +3,67 @@ Lef Parser class.
 """
 
 
-from typing import Iterable, Tuple
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from definition import ROOT_DIR
+from src.stats import NULL_STATS, RunStats
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from src.lef_cache import LefCache
+
+LEF_DIR = f"{ROOT_DIR}/lef_files"
+# Default directory of the macro indexes, the one of the binary cache of `src.lef_cache`, never next to the lef.
+MACRO_INDEX_DIR = f"{ROOT_DIR}/.lef_cache"
+MACRO_INDEX_SUFFIX = '.macros.json'
+CHUNK_SIZE = 1 << 20
+# Lower bound of the size of a pin in a lef file, used to preallocate the pin table.
+BYTES_PER_PIN = 100
+# Categorical columns of the pin table, in the order of their codes.
+PIN_TABLE_CATEGORIES = ('pin', 'macro', 'direction', 'use', 'layer')
+# Statements that are complete at the end of their line, they have no ';'.
+LINE_STATEMENTS = {'MACRO', 'PIN', 'PORT', 'OBS', 'END', 'UNITS', 'LAYER', 'VIA', 'VIARULE', 'SITE',
+                   'PROPERTYDEFINITIONS', 'NONDEFAULTRULE', 'SPACING', 'BEGINEXT', 'ENDEXT',
+                   'DENSITY'}
+# Top level blocks skipped by the parser, closed by `END <name>`.
+NAMED_BLOCKS = {'LAYER', 'VIA', 'VIARULE', 'SITE', 'NONDEFAULTRULE'}
+# Top level blocks skipped by the parser, closed by `END <keyword>`.
+KEYWORD_BLOCKS = {'UNITS', 'PROPERTYDEFINITIONS', 'SPACING'}
+# Blocks of a MACRO skipped by the parser, closed by a bare `END`.
+MACRO_BLOCKS = {'OBS', 'DENSITY'}
+# Line opening a MACRO block, used to split a lef without parsing it. The name must end the
+# line, so that `MACRO <property> <type> ;` lines of PROPERTYDEFINITIONS do not match.
+MACRO_PATTERN = re.compile(rb'^[ \t]*MACRO[ \t]+([^\s;#]+)[ \t]*(?:#[^\n]*)?\r?$', re.MULTILINE)
 
 
 class LefPort:
     """
     Class to describe a lef port.
+    Shapes are stored in the shared arrays of the cell. The port of a lazy cell only
+    keeps its index, its PIN block is decoded from the file on first access.
     """
 
+    __slots__ = ('port_name', '_direction', '_use', '_layer', '_cell', '_index', '_polygons')
+
     def __init__(self, port_name: str) -> None:
         self.port_name = port_name
+        self._direction: Optional[str] = None
+        self._use: Optional[str] = None
+        self._layer: Optional[str] = None
+        self._cell: Optional[LefCell] = None
+        self._index = 0
+        self._polygons: Optional[List[Tuple[Tuple]]] = None
+
+    def _is_lazy(self) -> bool:
+        return self._polygons is None and self._cell is not None and self._cell.source is not None
 
     def get_name(self) -> str:
         """Get the name of the port.
@@ -28,6 +79,9 @@ class LefPort:
         Returns:
             str: Direction of the pin, can be INPUT, OUTPUT or INOUT.
         """
+        if self._is_lazy():
+            self._decode()
+        return self._direction
 
     def get_use(self) -> str:
         """Get the use of the pin.
@@ -35,6 +89,9 @@ class LefPort:
         Returns:
             str: Use of the pin, can be SIGNAL, GROUND or POWER.
         """
+        if self._is_lazy():
+            self._decode()
+        return self._use
 
     def get_layer(self) -> str:
         """Get the layer associated with the pin.
@@ -42,6 +99,9 @@ class LefPort:
         Returns:
             str: Layer name.
         """
+        if self._is_lazy():
+            self._decode()
+        return self._layer
 
     def get_polygon(self) -> Tuple[Tuple]:
         """Get the polygon of the port.
@@ -49,15 +109,92 @@ class LefPort:
         Returns:
             Tuple[Tuple]: Tuple of points.
         """
+        polygons = self.get_polygons()
+        return polygons[0] if polygons else ()
+
+    def get_polygons(self) -> List[Tuple[Tuple]]:
+        """Get every polygon of the port.
+
+        Returns:
+            List[Tuple[Tuple]]: List of tuple of points.
+        """
+        if self._is_lazy():
+            self._decode()
+        if self._polygons is not None:
+            return self._polygons
+        if self._cell is None:
+            return []
+        shapes = self._cell.port_shapes
+        return [self._cell.get_shape(shape) for shape in range(int(shapes[self._index]), int(shapes[self._index + 1]))]
+
+    def _decode(self) -> None:
+        """Parse the PIN block of a lazy port."""
+        self._polygons = []
+        start, end = self._cell.spans[self._index].tolist()
+        for event, statement, _ in self._cell.source.iter_events(start, end, in_cell=True):
+            if event == 'RECT' or event == 'POLYGON':
+                self._polygons.append(LefParser.shape_points(event, statement))
+            elif event == 'LAYER':
+                self._layer = self._layer or sys.intern(statement[1])
+            elif event == 'DIRECTION':
+                self._direction = sys.intern(statement[1])
+            elif event == 'USE':
+                self._use = sys.intern(statement[1])
 
 
 class LefCell:
     """
     Class to describe a lef cell.
+    The points of every port shape are stored in one (n, 2) float array, `shape_ends[i]`
+    is the index of the point following the last point of shape i and the shapes of
+    port i are `port_shapes[i]` to `port_shapes[i + 1]`. A lazy cell has a source parser
+    and the byte range of the PIN block of each port in `spans` instead. A cell loaded from
+    a LefCache keeps the string table and the string codes of its ports in `port_table`,
+    its LefPort objects are only built on first access to `ports`.
     """
 
+    __slots__ = ('cell_name', 'size', '_ports', 'port_table', 'points', 'shape_ends', 'port_shapes', 'spans',
+                 'source')
+
     def __init__(self, cell_name: str) -> None:
         self.cell_name = cell_name
+        self.size: Tuple[Tuple] = ()
+        self.ports: List[LefPort] = []
+        self.points = np.empty((0, 2), dtype=np.float64)
+        self.shape_ends = np.empty(0, dtype=np.int64)
+        self.port_shapes = np.zeros(1, dtype=np.int64)
+        self.spans = np.empty((0, 2), dtype=np.int64)
+        self.source: Optional[LefParser] = None
+
+    @property
+    def ports(self) -> List[LefPort]:
+        """Ports of the cell, built from `port_table` on first access.
+
+        Returns:
+            List[LefPort]: Ports in the order of the cell.
+        """
+        if self.port_table is not None:
+            strings, codes = self.port_table
+            self.port_table = None
+            for name, direction, use, layer in codes.tolist():
+                port = LefPort(strings[name])
+                port._direction, port._use, port._layer = strings[direction], strings[use], strings[layer]
+                port._cell, port._index = self, len(self._ports)
+                self._ports.append(port)
+        return self._ports
+
+    @ports.setter
+    def ports(self, ports: List[LefPort]) -> None:
+        self._ports = ports
+        self.port_table = None
+
+    def get_port_count(self) -> int:
+        """Get the number of ports of the cell without building them.
+
+        Returns:
+            int: Number of ports.
+        """
+        return len(self.port_table[1]) if self.port_table is not None else len(self._ports)
 
     def get_name(self) -> str:
         """Get the name of the cell.
@@ -73,6 +210,7 @@ class LefCell:
         Returns:
             Tuple[Tuple]: Tuple of points representing the bounding box.
         """
+        return self.size
 
     def get_ports(self) -> Iterable[LefPort]:
         """Get the ports in the cell.
@@ -80,19 +218,563 @@ class LefCell:
         Returns:
             Iterable[LefPort]: Iterable of LefPort in the cell.
         """
+        return self.ports
+
+    def __getstate__(self) -> tuple:
+        """Pickle the ports by columns, much faster than one object per port.
+
+        Returns:
+            tuple: State of the cell.
+        """
+        columns = [[port.port_name for port in self.ports], [port._direction for port in self.ports],
+                   [port._use for port in self.ports], [port._layer for port in self.ports],
+                   [port._polygons for port in self.ports]]
+        return (self.cell_name, self.size, self.points, self.shape_ends, self.port_shapes, self.spans, self.source,
+                *columns)
+
+    def __setstate__(self, state: tuple) -> None:
+        """Rebuild the cell and its ports from `__getstate__`.
+
+        Args:
+            state (tuple): State of the cell.
+        """
+        (self.cell_name, self.size, self.points, self.shape_ends, self.port_shapes, self.spans, self.source,
+         names, directions, uses, layers, polygons) = state
+        self.ports = []
+        for index, name in enumerate(names):
+            port = LefPort(name)
+            port._direction, port._use, port._layer, port._polygons = (directions[index], uses[index],
+                                                                       layers[index], polygons[index])
+            port._cell, port._index = self, index
+            self.ports.append(port)
+
+    def get_port_boxes(self) -> np.ndarray:
+        """Get the bounding box of the shapes of each port.
+
+        Returns:
+            np.ndarray: (n_ports, 4) array of xmin, ymin, xmax, ymax, nan for ports without shapes.
+        """
+        boxes = np.full((len(self.ports), 4), np.nan)
+        if self.source is not None:
+            for index, port in enumerate(self.ports):
+                points = np.array([point for polygon in port.get_polygons() for point in polygon], dtype=np.float64)
+                if len(points):
+                    boxes[index] = (*points.min(axis=0), *points.max(axis=0))
+            return boxes
+        if not len(self.shape_ends):
+            return boxes
+        shape_starts = np.concatenate(([0], self.shape_ends[:-1]))
+        shape_boxes = np.hstack((np.minimum.reduceat(self.points, shape_starts, axis=0),
+                                 np.maximum.reduceat(self.points, shape_starts, axis=0)))
+        # A reduceat range ends at the next index, ports without shapes are left out of the indexes.
+        has_shapes = np.flatnonzero(np.diff(self.port_shapes) > 0)
+        port_starts = self.port_shapes[has_shapes]
+        boxes[has_shapes, :2] = np.minimum.reduceat(shape_boxes[:, :2], port_starts, axis=0)
+        boxes[has_shapes, 2:] = np.maximum.reduceat(shape_boxes[:, 2:], port_starts, axis=0)
+        return boxes
+
+    def get_shape(self, shape: int) -> Tuple[Tuple]:
+        """Get the points of a shape of the shared point array.
+
+        Args:
+            shape (int): Shape index.
+
+        Returns:
+            Tuple[Tuple]: Tuple of points.
+        """
+        first = int(self.shape_ends[shape - 1]) if shape else 0
+        return tuple(map(tuple, self.points[first:int(self.shape_ends[shape])].tolist()))
+
+
+def rect_to_polygon(x_1: float, y_1: float, x_2: float, y_2: float) -> Tuple[Tuple]:
+    """Convert a rectangle to its points, clockwise from the bottom left corner.
+
+    Args:
+        x_1 (float): Bottom left x.
+        y_1 (float): Bottom left y.
+        x_2 (float): Top right x.
+        y_2 (float): Top right y.
+
+    Returns:
+        Tuple[Tuple]: Tuple of points.
+    """
+    return ((x_1, y_1), (x_1, y_2), (x_2, y_2), (x_2, y_1))
+
+
+def rect_to_polygon_flat(x_1: float, y_1: float, x_2: float, y_2: float) -> Tuple[float, ...]:
+    """Same as `rect_to_polygon` with flattened coordinates.
+
+    Args:
+        x_1 (float): Bottom left x.
+        y_1 (float): Bottom left y.
+        x_2 (float): Top right x.
+        y_2 (float): Top right y.
+
+    Returns:
+        Tuple[float, ...]: x and y of each point.
+    """
+    return (x_1, y_1, x_1, y_2, x_2, y_2, x_2, y_1)
 
 
 class LefParser:
     """
-    Your lef parser to implement.
+    Streaming lef parser.
+    The file is read by chunks and split in statements, a state machine builds
+    each cell and yields it as soon as its MACRO block is closed.
     """
 
-    def __init__(self, lef_file: str) -> None:
+    class LefParserException(Exception):
+        """Exception raised by the LefParser class."""
+
+    def __init__(self,
+                 lef_file: str,
+                 lazy: bool = False,
+                 cache: Optional['LefCache'] = None,
+                 stats: Optional[RunStats] = None,
+                 index_dir: Optional[str] = None) -> None:
+        """Init the parser.
+
+        Args:
+            lef_file (str): Path of the lef, or its name in the lef_files directory.
+            lazy (bool, optional): Ports only keep their position in the file and are decoded on
+                first access. Defaults to False.
+            cache (LefCache, optional): Binary cache of parsed files, a cached lef is loaded
+                without being parsed. Defaults to None.
+            stats (RunStats, optional): Filled with the time of get_cells and to_pin_table and the bytes,
+                cells and pins per second. Defaults to None.
+            index_dir (str, optional): Directory of the macro index, see `get_macro_index`. The directory
+                of the cache if there is one, MACRO_INDEX_DIR otherwise. Defaults to None.
+        """
         self.lef_file = lef_file
+        self.lef_path = lef_file if os.path.exists(lef_file) else f"{LEF_DIR}/{lef_file}"
+        self.lazy = lazy
+        self.cache = cache
+        self.stats = stats
+        self.index_dir = index_dir or (cache.cache_dir if cache is not None else MACRO_INDEX_DIR)
+        self._macro_index: Optional[Dict[str, Tuple[int, int]]] = None
 
     def get_cells(self) -> Iterable[LefCell]:
-        """Get cells in the lef.
+        """Get cells in the lef, through the cache if there is one.
 
         Returns:
             Iterable[LefCell]: Iterable of LefCell in the lef file.
         """
+        begin = time.perf_counter()
+        with (self.stats or NULL_STATS).phase('get_cells'):
+            cells = self._load_cells()
+        if self.stats is not None:
+            self._set_throughput(time.perf_counter() - begin, len(cells), sum(cell.get_port_count() for cell in cells))
+        return cells
+
+    def _load_cells(self) -> List[LefCell]:
+        """Parse the cells, or load them from the cache.
+
+        Returns:
+            List[LefCell]: LefCell in the order of the lef file.
+        """
+        if self.cache is None:
+            return list(self.parse_cells())
+        key = self.cache.key(self.lef_path)
+        cells = self.cache.load(key)
+        (self.stats or NULL_STATS).set('cache_hit', int(cells is not None))
+        if cells is None:
+            cells = list(self.parse_cells())
+            self.cache.store(key, cells)
+        return cells
+
+    def _set_throughput(self, seconds: float, cells: int, pins: int) -> None:
+        """Record the size of the lef and the parsing speed in the stats.
+
+        Args:
+            seconds (float): Time spent reading the lef.
+            cells (int): Number of cells read.
+            pins (int): Number of pins read.
+        """
+        size = os.path.getsize(self.lef_path)
+        seconds = max(seconds, 1e-9)
+        for name, value in (('bytes', size), ('cells', cells), ('pins', pins), ('bytes_per_second', size / seconds),
+                            ('cells_per_second', cells / seconds), ('pins_per_second', pins / seconds)):
+            self.stats.set(name, value)
+
+    def get_cell(self, cell_name: str) -> LefCell:
+        """Get one cell without parsing the rest of the lef, see `get_macro_index`.
+
+        Args:
+            cell_name (str): Name of the macro.
+
+        Raises:
+            LefParserException: Unknown macro.
+
+        Returns:
+            LefCell: Cell.
+        """
+        span = self.get_macro_index().get(cell_name)
+        if span is None:
+            raise LefParser.LefParserException(f"Unknown macro {cell_name} in {self.lef_path}")
+        return next(self.parse_cells(*span))
+
+    def get_macro_index(self) -> Dict[str, Tuple[int, int]]:
+        """Get the byte range of each MACRO block.
+        The index is read from its file in index_dir if it matches the size and modification
+        time of the lef, otherwise built with one regex scan of the memory mapped lef and saved there.
+        Index files in the directory of a LefCache count in its size and are evicted with its entries.
+        A range ends where the next MACRO starts.
+
+        Returns:
+            Dict[str, Tuple[int, int]]: Start and end byte offsets by macro name.
+        """
+        if self._macro_index is not None:
+            return self._macro_index
+        stat = os.stat(self.lef_path)
+        index_path = self.macro_index_path()
+        try:
+            with open(index_path, encoding='utf-8') as index_stream:
+                saved = json.load(index_stream)
+            if (saved['size'], saved['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                os.utime(index_path)
+                self._macro_index = {name: tuple(span) for name, span in saved['macros'].items()}
+                return self._macro_index
+        except (OSError, ValueError, KeyError):
+            pass
+        starts: List[int] = []
+        names: List[str] = []
+        if stat.st_size:
+            with open(self.lef_path, 'rb') as lef_stream, \
+                    mmap.mmap(lef_stream.fileno(), 0, access=mmap.ACCESS_READ) as lef_map:
+                # find is a memchr scan, much faster than running the regex on every line.
+                position = lef_map.find(b'MACRO')
+                while position >= 0:
+                    line_start = lef_map.rfind(b'\n', 0, position) + 1
+                    match = MACRO_PATTERN.match(lef_map, line_start)
+                    if match:
+                        starts.append(match.start())
+                        names.append(match.group(1).decode('utf-8'))
+                    position = lef_map.find(b'MACRO', match.end() if match else position + 5)
+        ends = starts[1:] + [stat.st_size]
+        self._macro_index = {name: (start, end) for name, start, end in zip(names, starts, ends)}
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(index_path, 'w', encoding='utf-8') as index_stream:
+                json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'macros': self._macro_index},
+                          index_stream)
+        except OSError:
+            pass
+        return self._macro_index
+
+    def macro_index_path(self) -> str:
+        """Get the path of the macro index of the lef.
+
+        Returns:
+            str: File of index_dir named after a hash of the absolute path of the lef.
+        """
+        digest = hashlib.blake2b(os.path.abspath(self.lef_path).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.index_dir, digest + MACRO_INDEX_SUFFIX)
+
+    def iter_cells(self) -> Iterator[LefCell]:
+        """Iterate over the cells of the lef, memory only holds the cell being parsed.
+        A cached lef is read from the cache, a missing entry is not written.
+
+        Yields:
+            Iterator[LefCell]: LefCell in the order of the lef file.
+        """
+        cells = self.cache.load(self.cache.key(self.lef_path)) if self.cache is not None else None
+        yield from cells if cells is not None else self.parse_cells()
+
+    def parse_cells(self, start: int = 0, end: Optional[int] = None) -> Iterator[LefCell]:
+        """Parse the cells of the lef one by one, without the cache.
+
+        Args:
+            start (int, optional): Byte offset to start from, outside of any block. Defaults to 0.
+            end (int, optional): Byte offset to stop at, end of file if None. Defaults to None.
+
+        Yields:
+            Iterator[LefCell]: LefCell in the order of the lef file.
+        """
+        cell: Optional[LefCell] = None
+        port: Optional[LefPort] = None
+        points: List[float] = []
+        shape_ends: List[int] = []
+        port_shapes: List[int] = []
+        spans: List[int] = []
+        for event, statement, offset in self.iter_events(start, end, lazy=self.lazy):
+            if event == 'RECT' or event == 'POLYGON':
+                coordinates = self._coordinates(statement)
+                points.extend(rect_to_polygon_flat(*coordinates[:4]) if event == 'RECT' else coordinates)
+                shape_ends.append(len(points) // 2)
+            elif event == 'LAYER':
+                port._layer = port._layer or sys.intern(statement[1])
+            elif event == 'DIRECTION':
+                port._direction = sys.intern(statement[1])
+            elif event == 'USE':
+                port._use = sys.intern(statement[1])
+            elif event == 'PIN':
+                port = LefPort(sys.intern(statement[1]))
+                port._cell, port._index = cell, len(cell.ports)
+                spans.append(offset)
+            elif event == 'END_PIN':
+                port_shapes.append(len(shape_ends))
+                spans.append(offset)
+                cell.ports.append(port)
+            elif event == 'SIZE':
+                cell.size = rect_to_polygon(0.0, 0.0, float(statement[1]), float(statement[3]))
+            elif event == 'MACRO':
+                cell = LefCell(statement[1])
+                points, shape_ends, port_shapes, spans = [], [], [0], []
+            elif event == 'END_MACRO':
+                cell.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+                cell.shape_ends = np.array(shape_ends, dtype=np.int64)
+                cell.port_shapes = np.array(port_shapes, dtype=np.int64)
+                if self.lazy:
+                    cell.spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+                    cell.source = self
+                yield cell
+
+    def to_pin_table(self) -> 'pd.DataFrame':
+        """Get every pin of the lef in one table, ready for `Chain.route`.
+        Values are written in preallocated numpy arrays while parsing, no LefCell
+        or LefPort is created. x and y are the center of the bounding box of the pin shapes.
+
+        Returns:
+            pd.DataFrame: One row per pin with x, y, xmin, ymin, xmax, ymax, pin, macro, macro_id,
+                direction, use and layer columns. Text columns are categorical.
+        """
+        begin = time.perf_counter()
+        with (self.stats or NULL_STATS).phase('pin_table'):
+            table = self._build_pin_table()
+        if self.stats is not None:
+            self._set_throughput(time.perf_counter() - begin, len(table['macro'].cat.categories), len(table))
+        return table
+
+    def _build_pin_table(self) -> 'pd.DataFrame':
+        """Parse the lef into the pin table, see `to_pin_table`.
+
+        Returns:
+            pd.DataFrame: Pin table.
+        """
+        import pandas as pd
+        capacity = max(os.path.getsize(self.lef_path) // BYTES_PER_PIN, 16)
+        bounds = np.empty((capacity, 4), dtype=np.float64)
+        # Codes of the categorical columns, then the position of the macro in the lef.
+        codes = np.empty((capacity, len(PIN_TABLE_CATEGORIES) + 1), dtype=np.int32)
+        categories: dict = {column: {} for column in PIN_TABLE_CATEGORIES}
+        pin_codes, macro_codes = categories['pin'], categories['macro']
+        direction_codes, use_codes, layer_codes = categories['direction'], categories['use'], categories['layer']
+        row = macro_id = -1
+        pin = macro = direction = use = layer = -1
+        box = (np.inf, np.inf, -np.inf, -np.inf)
+        for event, statement, _ in self.iter_events():
+            if event == 'RECT' or event == 'POLYGON':
+                points = self._coordinates(statement)
+                box = (min(box[0], *points[0::2]), min(box[1], *points[1::2]),
+                       max(box[2], *points[0::2]), max(box[3], *points[1::2]))
+            elif event == 'LAYER':
+                if layer < 0:
+                    layer = layer_codes.setdefault(statement[1], len(layer_codes))
+            elif event == 'DIRECTION':
+                direction = direction_codes.setdefault(statement[1], len(direction_codes))
+            elif event == 'USE':
+                use = use_codes.setdefault(statement[1], len(use_codes))
+            elif event == 'PIN':
+                pin = pin_codes.setdefault(statement[1], len(pin_codes))
+                box = (np.inf, np.inf, -np.inf, -np.inf)
+                direction = use = layer = -1
+            elif event == 'END_PIN':
+                row += 1
+                if row == capacity:
+                    capacity *= 2
+                    bounds = np.resize(bounds, (capacity, 4))
+                    codes = np.resize(codes, (capacity, len(PIN_TABLE_CATEGORIES) + 1))
+                bounds[row] = box
+                codes[row] = (pin, macro, direction, use, layer, macro_id)
+            elif event == 'MACRO':
+                # A name can be used by several macros, each one still gets its own macro_id.
+                macro = macro_codes.setdefault(statement[1], len(macro_codes))
+                macro_id += 1
+        bounds, codes = bounds[:row + 1], codes[:row + 1]
+        bounds[~np.isfinite(bounds)] = np.nan
+        table = pd.DataFrame({
+            'x': (bounds[:, 0] + bounds[:, 2]) / 2,
+            'y': (bounds[:, 1] + bounds[:, 3]) / 2,
+            'xmin': bounds[:, 0],
+            'ymin': bounds[:, 1],
+            'xmax': bounds[:, 2],
+            'ymax': bounds[:, 3],
+            'macro_id': codes[:, -1]
+        })
+        for column_index, column in enumerate(PIN_TABLE_CATEGORIES):
+            table[column] = pd.Categorical.from_codes(codes[:, column_index], list(categories[column]))
+        return table
+
+    def next_macro(self, position: int = 0) -> int:
+        """Find the first MACRO line starting at or after a byte offset.
+
+        Args:
+            position (int, optional): Byte offset. Defaults to 0.
+
+        Returns:
+            int: Byte offset of the MACRO line, size of the file if there is none.
+        """
+        size = os.path.getsize(self.lef_path)
+        if position >= size:
+            return size
+        with open(self.lef_path, 'rb') as lef_stream, \
+                mmap.mmap(lef_stream.fileno(), 0, access=mmap.ACCESS_READ) as lef_map:
+            match = MACRO_PATTERN.search(lef_map, position)
+            return match.start() if match else size
+
+    def iter_events(self,
+                    start: int = 0,
+                    end: Optional[int] = None,
+                    in_cell: bool = False,
+                    lazy: bool = False) -> Iterator[Tuple[str, List[str], int]]:
+        """Run the parser state machine over the statements of the lef.
+        Events are MACRO, SIZE, PIN, DIRECTION, USE, LAYER, RECT, POLYGON, END_PIN and END_MACRO,
+        LAYER, RECT and POLYGON are only the pin shapes, obstructions and other blocks are skipped.
+        A MACRO is only closed by `END <name>` or `END MACRO`, not by the bare END of its blocks.
+
+        Args:
+            start (int, optional): Byte offset to start from. Defaults to 0.
+            end (int, optional): Byte offset to stop at, end of file if None. Defaults to None.
+            in_cell (bool, optional): The range starts inside a MACRO block. Defaults to False.
+            lazy (bool, optional): Skip the DIRECTION, USE, LAYER, RECT and POLYGON events. Defaults to False.
+
+        Yields:
+            Iterator[Tuple[str, List[str], int]]: Event, tokens of its statement and byte offset of its line.
+        """
+        in_pin = in_port = in_block = False
+        skip_until: Optional[str] = None
+        # Name of the open MACRO, None when the range starts inside it.
+        macro_name: Optional[str] = None
+        for offset, statement in self.iter_statements(start, end):
+            keyword = statement[0]
+            if skip_until is not None:
+                if (keyword == 'END' and statement[1:2] == [skip_until]) or keyword == skip_until == 'ENDEXT':
+                    skip_until = None
+            elif not in_cell:
+                if keyword == 'MACRO':
+                    in_cell = True
+                    macro_name = statement[1] if len(statement) > 1 else None
+                    yield keyword, statement, offset
+                elif keyword in NAMED_BLOCKS and len(statement) > 1:
+                    skip_until = statement[1]
+                elif keyword in KEYWORD_BLOCKS:
+                    skip_until = keyword
+                elif keyword == 'BEGINEXT':
+                    # Extensions are closed by ENDEXT, not by END.
+                    skip_until = 'ENDEXT'
+            elif in_port:
+                if keyword == 'END':
+                    in_port = False
+                elif keyword in ('LAYER', 'RECT', 'POLYGON') and not lazy:
+                    yield keyword, statement, offset
+            elif in_pin:
+                if keyword in ('DIRECTION', 'USE') and not lazy:
+                    yield keyword, statement, offset
+                elif keyword == 'PORT':
+                    in_port = True
+                elif keyword == 'END':
+                    in_pin = False
+                    yield 'END_PIN', statement, offset
+            elif in_block:
+                in_block = keyword != 'END'
+            elif keyword in ('SIZE', 'PIN'):
+                in_pin = keyword == 'PIN'
+                yield keyword, statement, offset
+            elif keyword in MACRO_BLOCKS:
+                in_block = True
+            elif keyword == 'END' and (macro_name is None or statement[1:2] in ([macro_name], ['MACRO'])):
+                in_cell = False
+                yield 'END_MACRO', statement, offset
+
+    @staticmethod
+    def shape_points(event: str, statement: List[str]) -> Tuple[Tuple]:
+        """Get the points of a RECT or POLYGON statement.
+
+        Args:
+            event (str): RECT or POLYGON.
+            statement (List[str]): Tokens of the statement.
+
+        Returns:
+            Tuple[Tuple]: Tuple of points.
+        """
+        coordinates = LefParser._coordinates(statement)
+        if event == 'RECT':
+            return rect_to_polygon(*coordinates[:4])
+        return tuple(zip(coordinates[0::2], coordinates[1::2]))
+
+    @staticmethod
+    def _coordinates(statement: List[str]) -> List[float]:
+        """Get the numbers of a RECT or POLYGON statement, skipping the MASK option.
+
+        Args:
+            statement (List[str]): Tokens of the statement.
+
+        Returns:
+            List[float]: Coordinates.
+        """
+        tokens = statement[3:] if statement[1:2] == ['MASK'] else statement[1:]
+        return [float(token) for token in tokens if token != 'ITERATE']
+
+    def iter_lines(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        """Read the lef by chunks of CHUNK_SIZE bytes and split it in lines.
+        A byte range, e.g. the MACRO block of `get_cell` or the PIN block of a lazy port,
+        is read as slices of the memory mapped lef instead of seeking in the file.
+
+        Args:
+            start (int, optional): Byte offset to start from. Defaults to 0.
+            end (int, optional): Byte offset to stop at, end of file if None. Defaults to None.
+
+        Yields:
+            Iterator[Tuple[int, bytes]]: Byte offset and content of each line.
+        """
+        if end is not None and end <= start:
+            return
+        offset = position = start
+        remainder = b''
+        with open(self.lef_path, 'rb') as lef_stream, \
+                (nullcontext() if end is None else
+                 mmap.mmap(lef_stream.fileno(), 0, access=mmap.ACCESS_READ)) as lef_map:
+            lef_stream.seek(start)
+            while True:
+                if lef_map is None:
+                    chunk = lef_stream.read(CHUNK_SIZE)
+                else:
+                    chunk = lef_map[position:min(position + CHUNK_SIZE, end)]
+                position += len(chunk)
+                lines = (remainder + chunk).split(b'\n')
+                remainder = lines.pop() if chunk else b''
+                for line in lines:
+                    yield offset, line
+                    offset += len(line) + 1
+                if not chunk:
+                    break
+
+    def iter_statements(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, List[str]]]:
+        """Split the lef in statements.
+
+        Args:
+            start (int, optional): Byte offset to start from. Defaults to 0.
+            end (int, optional): Byte offset to stop at, end of file if None. Defaults to None.
+
+        Yields:
+            Iterator[Tuple[int, List[str]]]: Byte offset of the first line and tokens of each statement,
+                without the ending ';'.
+        """
+        pending: List[str] = []
+        pending_offset = start
+        for offset, line in self.iter_lines(start, end):
+            if not pending:
+                pending_offset = offset
+            for token in line.split(b'#', 1)[0].replace(b';', b' ; ').decode('utf-8').split():
+                if token == ';':
+                    if pending:
+                        yield pending_offset, pending
+                    pending = []
+                    pending_offset = offset
+                else:
+                    pending.append(token)
+            if pending and pending[0] in LINE_STATEMENTS:
+                yield pending_offset, pending
+                pending = []
+        if pending:
+            yield pending_offset, pending
@@ -0,0 +1,71 @@
+"""
+Perimeter walk of pins lying on the sides of their bounding box.
+Pins on the border of a rectangle are in convex position, so walking along the
+border visits them in a nearly optimal order after a sort of their position on it.
+"""
+from typing import Optional
+import numpy as np
+from src import heuristic
+
+# Distance to a side under which a pin is on it, relative to the size of the bounding box.
+PERIMETER_TOLERANCE = 1e-9
+
+
+def perimeter_coordinates(locations: np.ndarray, tolerance: float = PERIMETER_TOLERANCE) -> Optional[np.ndarray]:
+    """Position of each location along the border of their bounding box, counterclockwise
+    from the bottom left corner.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        tolerance (float, optional): Distance to a side under which a location is on it,
+            relative to the size of the bounding box. Defaults to PERIMETER_TOLERANCE.
+
+    Returns:
+        Optional[np.ndarray]: Perimeter coordinate of each location, None if a location is inside the box.
+    """
+    x, y = locations[:, 0], locations[:, 1]
+    x_min, y_min = locations.min(axis=0)
+    x_max, y_max = locations.max(axis=0)
+    width, height = x_max - x_min, y_max - y_min
+    epsilon = tolerance * max(width, height, 1.0)
+    sides = [np.abs(y - y_min) <= epsilon, np.abs(x - x_max) <= epsilon,
+             np.abs(y - y_max) <= epsilon, np.abs(x - x_min) <= epsilon]
+    if not np.logical_or.reduce(sides).all():
+        return None
+    return np.select(sides, [x - x_min, width + y - y_min, width + height + x_max - x, 2 * width + height + y_max - y])
+
+
+def perimeter_path(locations: np.ndarray,
+                   start: int,
+                   end: int,
+                   metric: str = 'euclidean',
+                   tolerance: float = PERIMETER_TOLERANCE) -> Optional[np.ndarray]:
+    """Chain locations lying on their bounding box by walking along it from start to end.
+    Sorting the perimeter coordinates gives a cycle, split by start and end into two arcs.
+    The path leaves start along one arc and comes back along the other one to end, and the
+    direction leaving start is the one giving the shortest path.
+
+    Args:
+        locations (np.ndarray): (n, 2) array of coordinates
+        start (int): Start index
+        end (int): End index
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+        tolerance (float, optional): See `perimeter_coordinates`. Defaults to PERIMETER_TOLERANCE.
+
+    Returns:
+        Optional[np.ndarray]: indexes by order of routing, None if a location is inside the bounding box.
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    coordinates = perimeter_coordinates(locations, tolerance)
+    if coordinates is None:
+        return None
+    cycle = np.argsort(coordinates, kind='stable')
+    # Rotate the cycle so that it begins at start.
+    cycle = np.roll(cycle, -int(np.flatnonzero(cycle == start)[0]))
+    end_position = int(np.flatnonzero(cycle == end)[0])
+    toward_end = cycle[1:end_position]
+    away_from_end = cycle[end_position + 1:][::-1]
+    candidates = [np.concatenate([[start], away_from_end, toward_end, [end]]),
+                  np.concatenate([[start], toward_end, away_from_end, [end]])]
+    lengths = [heuristic.path_length(locations, candidate, metric) for candidate in candidates]
+    return candidates[int(np.argmin(lengths))].astype(np.int64)
@@ -0,0 +1,120 @@
+"""
+Pipelined chaining of the cells of a lef.
+Each cell is sent to a pool of workers as soon as its MACRO block is parsed, so
+parsing and solving overlap. At most max_pending cells are in flight and chains
+are written in the order of the lef as soon as they are known, so memory holds a
+bounded number of cells whatever the size of the lef.
+"""
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Optional
+import numpy as np
+from src import heuristic
+from src.chain import Chain, RoutePool
+from src.lef_parser import LefParser
+
+if TYPE_CHECKING:
+    from src.lef_cache import LefCache
+
+PIPELINE_HEADER = "macro,pin,x,y,order\n"
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def chain_lef(lef_file: str,
+              output: str,
+              processes: Optional[int] = None,
+              max_pending: Optional[int] = None,
+              start: int = 0,
+              end: int = -1,
+              cache: Optional['LefCache'] = None,
+              pool: Optional[RoutePool] = None,
+              **options) -> dict:
+    """Chain the pins of every cell of a lef, cell by cell, and write the chains to a csv.
+    Pins are located at the center of the bounding box of their shapes, as in `LefParser.to_pin_table`.
+    Pins without shapes have no location, they are left out of the chains and counted in skipped_pins.
+
+    Args:
+        lef_file (str): Path of the lef, or its name in the lef_files directory.
+        output (str): Path of the csv, with one row per pin in chain order: macro, pin, x, y and order.
+        processes (int, optional): Number of workers of the pool started for this call, number of cpus
+            if None and no pool if 1. Defaults to None.
+        max_pending (int, optional): Cells parsed but not written yet, parsing waits for the oldest one
+            when there are this many. Twice the number of workers if None. Defaults to None.
+        start (int, optional): Index of the first pin of each chain in its cell, negative from the end. Defaults to 0.
+        end (int, optional): Index of the last pin of each chain in its cell, negative from the end. Defaults to -1.
+        cache (LefCache, optional): Binary cache of parsed files, see `LefParser.iter_cells`. Defaults to None.
+        pool (RoutePool, optional): Worker pool kept between calls, overrides processes. Defaults to None.
+        **options: Picklable options of `Chain.get_path`.
+
+    Raises:
+        Chain.ChainException: Start or end is out of the pins of a cell, has no shapes, or they are the same pin.
+
+    Returns:
+        dict: Number of cells, chained and skipped pins, total length, seconds spent parsing,
+            waiting for the workers and in total.
+    """
+    begin = time.perf_counter()
+    own_pool = pool is None and processes != 1
+    if own_pool:
+        pool = RoutePool(processes)
+    max_pending = max_pending or 2 * (pool.processes if pool is not None else 1)
+    metric = options.get('metric', 'euclidean')
+    summary = {'cells': 0, 'pins': 0, 'skipped_pins': 0, 'length': 0.0, 'parse_seconds': 0.0, 'wait_seconds': 0.0}
+    pending: deque = deque()
+
+    def write_oldest() -> None:
+        cell_name, pin_names, locations, result = pending.popleft()
+        waited = time.perf_counter()
+        path = result.result() if pool is not None else result
+        summary['wait_seconds'] += time.perf_counter() - waited
+        summary['length'] += heuristic.path_length(locations, path, metric)
+        x_list, y_list = locations[path, 0].tolist(), locations[path, 1].tolist()
+        csv_file.write(''.join(f"{cell_name},{pin_names[node]},{x!r},{y!r},{order}\n"
+                               for order, (node, x, y) in enumerate(zip(path.tolist(), x_list, y_list))))
+
+    try:
+        with open(output, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as csv_file:
+            csv_file.write(PIPELINE_HEADER)
+            cells = LefParser(lef_file, cache=cache).iter_cells()
+            while True:
+                parsing = time.perf_counter()
+                cell = next(cells, None)
+                summary['parse_seconds'] += time.perf_counter() - parsing
+                if cell is None:
+                    break
+                boxes = cell.get_port_boxes()
+                n_pins = len(boxes)
+                if not n_pins:
+                    continue
+                if not (-n_pins <= start < n_pins and -n_pins <= end < n_pins):
+                    raise Chain.ChainException(
+                        f"Start {start} or end {end} is out of the {n_pins} pins of {cell.get_name()}")
+                first, last = start % n_pins, end % n_pins
+                if first == last and n_pins > 1:
+                    raise Chain.ChainException(f"Start and end are the same pin of {cell.get_name()}")
+                pin_names = [port.get_name() for port in cell.get_ports()]
+                placed = np.flatnonzero(~np.isnan(boxes).any(axis=1))
+                if len(placed) < n_pins:
+                    if np.isnan(boxes[[first, last]]).any():
+                        raise Chain.ChainException(f"Start or end pin of {cell.get_name()} has no shapes")
+                    boxes, pin_names = boxes[placed], [pin_names[index] for index in placed.tolist()]
+                    first, last = int(np.searchsorted(placed, first)), int(np.searchsorted(placed, last))
+                    summary['skipped_pins'] += n_pins - len(placed)
+                locations = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+                job = (locations, first, last, options)
+                result = pool.executor.submit(Chain._get_sub_path, job) if pool is not None else Chain._get_sub_path(job)
+                pending.append((cell.get_name(), pin_names, locations, result))
+                summary['cells'] += 1
+                summary['pins'] += len(boxes)
+                while len(pending) >= max_pending:
+                    write_oldest()
+            while pending:
+                write_oldest()
+    finally:
+        for _, _, _, result in pending:
+            if pool is not None:
+                result.cancel()
+        if own_pool:
+            pool.close()
+    summary['seconds'] = time.perf_counter() - begin
+    return summary
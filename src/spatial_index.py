@@ -0,0 +1,351 @@
+"""
+Spatial index over 2D points.
+"""
+from math import hypot
+from typing import Optional
+import numpy as np
+
+METRICS = ('euclidean', 'manhattan', 'chebyshev')
+
+
+def metric_dist(delta_x: np.ndarray, delta_y: np.ndarray, metric: str = 'euclidean') -> np.ndarray:
+    """Distance from coordinate differences.
+
+    Args:
+        delta_x (np.ndarray): Difference on x axis.
+        delta_y (np.ndarray): Difference on y axis.
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+    Raises:
+        ValueError: Unknown metric.
+
+    Returns:
+        np.ndarray: Distances, same shape as the inputs.
+    """
+    if metric == 'euclidean':
+        return np.hypot(delta_x, delta_y)
+    if metric == 'manhattan':
+        return np.abs(delta_x) + np.abs(delta_y)
+    if metric == 'chebyshev':
+        return np.maximum(np.abs(delta_x), np.abs(delta_y))
+    raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+
+
+def scalar_dist(delta_x: float, delta_y: float, metric: str = 'euclidean') -> float:
+    """Distance from coordinate differences of a single pair, without numpy overhead.
+
+    Args:
+        delta_x (float): Difference on x axis.
+        delta_y (float): Difference on y axis.
+        metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+    Raises:
+        ValueError: Unknown metric.
+
+    Returns:
+        float: Distance.
+    """
+    if metric == 'euclidean':
+        return hypot(delta_x, delta_y)
+    if metric == 'manhattan':
+        return abs(delta_x) + abs(delta_y)
+    if metric == 'chebyshev':
+        return max(abs(delta_x), abs(delta_y))
+    raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+
+
+class GridIndex:
+    """Uniform grid over 2D points.
+    Points are bucketed in square cells sorted by cell id, so the points of a
+    row of cells are a contiguous slice of `self.order`.
+    """
+
+    def __init__(self, points: np.ndarray, points_per_cell: int = 4) -> None:
+        """Build the grid.
+
+        Args:
+            points (np.ndarray): (n, 2) array of coordinates.
+            points_per_cell (int, optional): Average number of points per cell. Defaults to 4.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        n_points = len(self.points)
+        self.origin = self.points.min(axis=0) if n_points else np.zeros(2)
+        span = self.points.max(axis=0) - self.origin if n_points else np.zeros(2)
+        # Flat sets of points still get about points_per_cell points per cell along their long side.
+        thickness = max(float(span.max()) / max(n_points, 1), 1e-12)
+        area = max(float(span[0]), thickness) * max(float(span[1]), thickness)
+        self.cell_size = max(float(np.sqrt(area * points_per_cell / max(n_points, 1))), 1e-9)
+        cells = np.floor((self.points - self.origin) / self.cell_size).astype(np.int64)
+        self.shape = tuple(cells.max(axis=0) + 1) if n_points else (1, 1)
+        self.cells = cells
+        cell_ids = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.cell_start = np.searchsorted(cell_ids[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def block(self, cell_x: int, cell_y: int, radius: int) -> np.ndarray:
+        """Indices of the points in the square block of cells around a cell.
+
+        Args:
+            cell_x (int): Cell column.
+            cell_y (int): Cell row.
+            radius (int): Number of cells on each side of the center cell.
+
+        Returns:
+            np.ndarray: Point indices.
+        """
+        y_low = max(cell_y - radius, 0)
+        y_high = min(cell_y + radius, self.shape[1] - 1)
+        slices = [
+            self.order[self.cell_start[i * self.shape[1] + y_low]:self.cell_start[i * self.shape[1] + y_high + 1]]
+            for i in range(max(cell_x - radius, 0), min(cell_x + radius, self.shape[0] - 1) + 1)
+        ]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def covers(self, cell_x: int, cell_y: int, radius: int) -> bool:
+        """Check if the block around a cell covers the whole grid.
+
+        Args:
+            cell_x (int): Cell column.
+            cell_y (int): Cell row.
+            radius (int): Number of cells on each side of the center cell.
+
+        Returns:
+            bool: True if no point can be outside the block.
+        """
+        return (cell_x - radius <= 0 and cell_x + radius >= self.shape[0] - 1
+                and cell_y - radius <= 0 and cell_y + radius >= self.shape[1] - 1)
+
+    def knn(self, k: int, metric: str = 'euclidean', rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the k nearest neighbours of every point, itself excluded.
+        Each cell searches a block of cells, doubling its radius until the k-th distance
+        is shorter than the distance to the border of the block, so the result is exact.
+
+        Args:
+            k (int): Number of neighbours, capped at n - 1.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+            rows (np.ndarray, optional): Only search the neighbours of these points, so the
+                time depends on their number instead of n. Defaults to None.
+
+        Returns:
+            np.ndarray: (n, k) array of neighbour indices, closest first, or (len(rows), k) given rows.
+        """
+        n_points = len(self.points)
+        k = min(k, n_points - 1)
+        if rows is None:
+            cell_ids = np.flatnonzero(np.diff(self.cell_start))
+            groups = [self.order[self.cell_start[cell_id]:self.cell_start[cell_id + 1]] for cell_id in cell_ids]
+            targets = groups
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            row_cells = self.cells[rows, 0] * self.shape[1] + self.cells[rows, 1]
+            targets = np.argsort(row_cells, kind='stable')
+            cell_ids, first = np.unique(row_cells[targets], return_index=True)
+            targets = np.split(targets, first[1:])
+            groups = [rows[positions] for positions in targets]
+        neighbors = np.empty((n_points if rows is None else len(rows), max(k, 0)), dtype=np.int64)
+        if k <= 0:
+            return neighbors
+        for cell_id, members, positions in zip(cell_ids, groups, targets):
+            cell_x, cell_y = divmod(int(cell_id), self.shape[1])
+            radius = 1
+            while True:
+                candidates = self.block(cell_x, cell_y, radius)
+                covers = self.covers(cell_x, cell_y, radius)
+                if len(candidates) > k or covers:
+                    delta = self.points[members][:, np.newaxis, :] - self.points[candidates][np.newaxis, :, :]
+                    dist = metric_dist(delta[..., 0], delta[..., 1], metric)
+                    dist[members[:, np.newaxis] == candidates[np.newaxis, :]] = np.inf
+                    closest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                    closest_dist = np.take_along_axis(dist, closest, axis=1)
+                    if covers or closest_dist.max() <= radius * self.cell_size:
+                        sort = np.argsort(closest_dist, axis=1, kind='stable')
+                        neighbors[positions] = candidates[np.take_along_axis(closest, sort, axis=1)]
+                        break
+                radius *= 2
+        return neighbors
+
+
+SIDES = ('left', 'right', 'bottom', 'top')
+
+
+class PinIndex:
+    """Index over the bounding boxes of pins.
+    Box centers are bucketed in a GridIndex, queries look at the cells around the query
+    grown by the largest half size of a box, then test the boxes exactly.
+    """
+
+    def __init__(self, boxes: np.ndarray, bounds: Optional[tuple] = None,
+                 labels: Optional[np.ndarray] = None) -> None:
+        """Build the index.
+
+        Args:
+            boxes (np.ndarray): (n, 4) array of xmin, ymin, xmax, ymax, rows with nan are never returned.
+            bounds (tuple, optional): xmin, ymin, xmax, ymax of the cell, used by `on_side`.
+                Defaults to the bounding box of the boxes.
+            labels (np.ndarray, optional): Value returned for each box, for example (cell, port) indexes
+                of a library. Defaults to the row indexes.
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.labels = np.arange(len(self.boxes)) if labels is None else np.asarray(labels)
+        self.valid = np.flatnonzero(~np.isnan(self.boxes).any(axis=1))
+        valid_boxes = self.boxes[self.valid]
+        if bounds is None:
+            bounds = ((*valid_boxes[:, :2].min(axis=0), *valid_boxes[:, 2:].max(axis=0)) if len(valid_boxes)
+                      else (0.0, 0.0, 0.0, 0.0))
+        self.bounds = tuple(float(bound) for bound in bounds)
+        self.grid = GridIndex((valid_boxes[:, :2] + valid_boxes[:, 2:]) / 2)
+        self.half_size = (valid_boxes[:, 2:] - valid_boxes[:, :2]).max(axis=0) / 2 if len(valid_boxes) else np.zeros(2)
+
+    @classmethod
+    def from_cell(cls, cell) -> 'PinIndex':
+        """Build the index of the ports of a cell.
+
+        Args:
+            cell (LefCell): Cell.
+
+        Returns:
+            PinIndex: Index returning port indexes.
+        """
+        size = cell.get_size()
+        return cls(cell.get_port_boxes(), (*size[0], *size[2]) if size else None)
+
+    @classmethod
+    def from_cells(cls, cells: list) -> 'PinIndex':
+        """Build one index over the ports of several cells, each one in its own coordinates.
+
+        Args:
+            cells (list): Cells, for example of a LefLibrary.
+
+        Returns:
+            PinIndex: Index returning (cell index, port index) rows.
+        """
+        boxes = [cell.get_port_boxes() for cell in cells]
+        labels = np.concatenate([np.stack([np.full(len(cell_boxes), index), np.arange(len(cell_boxes))], axis=1)
+                                 for index, cell_boxes in enumerate(boxes)]) if boxes else np.empty((0, 2))
+        return cls(np.concatenate(boxes) if boxes else np.empty((0, 4)), labels=labels.astype(np.int64))
+
+    @classmethod
+    def from_pin_table(cls, table) -> 'PinIndex':
+        """Build the index of a pin table, see `LefParser.to_pin_table`.
+
+        Args:
+            table (pd.DataFrame): Table with xmin, ymin, xmax and ymax columns.
+
+        Returns:
+            PinIndex: Index returning row positions.
+        """
+        return cls(table[['xmin', 'ymin', 'xmax', 'ymax']].to_numpy(dtype=np.float64))
+
+    def _candidates(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """Rows of the boxes whose center can be in a rectangle grown by the largest half size.
+
+        Args:
+            xmin (float): Left of the rectangle.
+            ymin (float): Bottom of the rectangle.
+            xmax (float): Right of the rectangle.
+            ymax (float): Top of the rectangle.
+
+        Returns:
+            np.ndarray: Row indexes, a superset of the boxes intersecting the rectangle.
+        """
+        grid = self.grid
+        if not len(grid.points):
+            return np.empty(0, dtype=np.int64)
+        low = np.floor((np.array([xmin, ymin]) - self.half_size - grid.origin) / grid.cell_size).astype(np.int64)
+        high = np.floor((np.array([xmax, ymax]) + self.half_size - grid.origin) / grid.cell_size).astype(np.int64)
+        low, high = np.maximum(low, 0), np.minimum(high, np.array(grid.shape) - 1)
+        if (low > high).any():
+            return np.empty(0, dtype=np.int64)
+        columns = np.arange(low[0], high[0] + 1) * grid.shape[1]
+        slices = [grid.order[grid.cell_start[column + low[1]]:grid.cell_start[column + high[1] + 1]]
+                  for column in columns]
+        return self.valid[np.concatenate(slices)]
+
+    def intersect(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """Get the pins whose box intersects a rectangle, borders included.
+
+        Args:
+            xmin (float): Left of the rectangle.
+            ymin (float): Bottom of the rectangle.
+            xmax (float): Right of the rectangle.
+            ymax (float): Top of the rectangle.
+
+        Returns:
+            np.ndarray: Labels of the pins, by increasing row.
+        """
+        rows = np.sort(self._candidates(xmin, ymin, xmax, ymax))
+        boxes = self.boxes[rows]
+        hit = (boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin)
+        return self.labels[rows[hit]]
+
+    def box_dist(self, rows: np.ndarray, x: float, y: float, metric: str = 'euclidean') -> np.ndarray:
+        """Distance from a point to boxes, 0 inside a box.
+
+        Args:
+            rows (np.ndarray): Row indexes of the boxes.
+            x (float): Point x.
+            y (float): Point y.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: Distances.
+        """
+        boxes = self.boxes[rows]
+        delta_x = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+        delta_y = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+        return metric_dist(delta_x, delta_y, metric)
+
+    def nearest(self, x: float, y: float, k: int = 1, metric: str = 'euclidean') -> np.ndarray:
+        """Get the k pins closest to a point, the search square doubles until the result is exact.
+
+        Args:
+            x (float): Point x.
+            y (float): Point y.
+            k (int, optional): Number of pins, capped at the number of pins. Defaults to 1.
+            metric (str, optional): euclidean, manhattan or chebyshev. Defaults to 'euclidean'.
+
+        Returns:
+            np.ndarray: Labels of the pins, closest first.
+        """
+        k = min(k, len(self.valid))
+        if k <= 0:
+            return self.labels[:0]
+        radius = self.grid.cell_size
+        while True:
+            rows = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            covers = len(rows) == len(self.valid)
+            if len(rows) >= k:
+                dist = self.box_dist(rows, x, y, metric)
+                closest = np.argpartition(dist, k - 1)[:k]
+                # Every box closer than radius has its center in the grown search square.
+                if covers or dist[closest].max() <= radius:
+                    closest = closest[np.lexsort((rows[closest], dist[closest]))]
+                    return self.labels[rows[closest]]
+            radius *= 2
+
+    def on_side(self, side: str, tolerance: float = 0.0) -> np.ndarray:
+        """Get the pins touching a side of the bounds.
+
+        Args:
+            side (str): left, right, bottom or top.
+            tolerance (float, optional): Maximum distance between the box and the side. Defaults to 0.0.
+
+        Raises:
+            ValueError: Unknown side.
+
+        Returns:
+            np.ndarray: Labels of the pins, by increasing row.
+        """
+        if side not in SIDES:
+            raise ValueError(f"Unknown side {side}, expected one of {SIDES}")
+        boxes = self.boxes[self.valid]
+        xmin, ymin, xmax, ymax = self.bounds
+        if side == 'left':
+            hit = boxes[:, 0] <= xmin + tolerance
+        elif side == 'right':
+            hit = boxes[:, 2] >= xmax - tolerance
+        elif side == 'bottom':
+            hit = boxes[:, 1] <= ymin + tolerance
+        else:
+            hit = boxes[:, 3] >= ymax - tolerance
+        return self.labels[self.valid[hit]]
@@ -0,0 +1,121 @@
+"""
+Phase timings and metrics of a run.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Hooks are called with the kind of the value (phase, memory or metric), its name and the value.
+Hook = Callable[[str, str, float], None]
+
+
+class RunStats:
+    """Wall time and peak memory of each phase of a run, and named metrics.
+    Phases can be nested and a phase entered several times accumulates its time.
+    Peak memory uses tracemalloc, which slows python code down, so it is only
+    measured when asked for.
+    """
+
+    def __init__(self, memory: bool = False, hooks: Optional[List[Hook]] = None) -> None:
+        """Init the stats.
+
+        Args:
+            memory (bool, optional): Measure the peak memory of each phase with tracemalloc. Defaults to False.
+            hooks (List[Hook], optional): Called with every phase time, peak memory and metric, e.g. to
+                export them to a metrics system. Defaults to None.
+        """
+        self.memory = memory
+        self.hooks = hooks or []
+        self.phases: Dict[str, float] = {}
+        self.peak_memory: Dict[str, int] = {}
+        self.metrics: Dict[str, float] = {}
+        # Peak of each open phase before the peak was reset by a nested phase.
+        self._peaks: List[int] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure a phase.
+
+        Args:
+            name (str): Name of the phase.
+
+        Yields:
+            Iterator[None]: Context of the phase.
+        """
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - begin
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self._emit('phase', name, seconds)
+            if self.memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                self._emit('memory', name, peak)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def set(self, name: str, value: float) -> None:
+        """Record a metric.
+
+        Args:
+            name (str): Name of the metric.
+            value (float): Value.
+        """
+        self.metrics[name] = value
+        self._emit('metric', name, value)
+
+    def _emit(self, kind: str, name: str, value: float) -> None:
+        for hook in self.hooks:
+            hook(kind, name, value)
+
+    def as_dict(self) -> dict:
+        """Get the stats as plain values.
+
+        Returns:
+            dict: phases, peak_memory and metrics.
+        """
+        return {'phases': dict(self.phases), 'peak_memory': dict(self.peak_memory), 'metrics': dict(self.metrics)}
+
+
+class NullStats:
+    """Stats that record nothing, used when instrumentation is disabled."""
+
+    _context = nullcontext()
+
+    def __bool__(self) -> bool:
+        return False
+
+    def phase(self, name: str) -> nullcontext:
+        """Do nothing.
+
+        Args:
+            name (str): Name of the phase.
+
+        Returns:
+            nullcontext: Shared empty context.
+        """
+        return self._context
+
+    def set(self, name: str, value: float) -> None:
+        """Do nothing.
+
+        Args:
+            name (str): Name of the metric.
+            value (float): Value.
+        """
+
+
+NULL_STATS = NullStats()
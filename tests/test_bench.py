@@ -0,0 +1,34 @@
+"""
+Test file for the benchmark suite.
+"""
+from benchmarks import bench
+
+
+def test_bench_run_and_compare(tmp_path) -> None:
+    """
+    Test that a run measures every phase, is saved in the history and that
+    compare flags the phases slower than the threshold.
+    """
+    history = str(tmp_path / "history.json")
+    baseline = str(tmp_path / "baseline.json")
+    assert bench.main(['run', '--grid', '1x50', '--no-memory', '--history', history, '--save-baseline', baseline]) == 0
+    runs = bench.load_runs(history)
+    assert len(runs) == 1
+    assert [result['phase'] for result in runs[0]['results']] == [
+        'generate', 'parse', 'get_cells', 'pin_table', 'route', 'dist_matrix', 'model', 'solve', 'walk']
+    assert runs[0]['results'][4]['length'] > 0
+    assert bench.main(['compare', '--history', history, '--baseline', baseline]) == 0
+    slower = {'results': [dict(result, seconds=result['seconds'] * 2 + 1) for result in runs[0]['results']]}
+    rows = bench.compare(slower, runs[0])
+    assert all(row['regression'] for row in rows if row['metric'] == 'seconds')
+    bench.save_json(history, runs + [slower])
+    assert bench.main(['compare', '--history', history, '--baseline', baseline]) == 1
+
+
+def test_startup_does_not_import_heavy_modules() -> None:
+    """
+    Test that the generate and parse modules load neither pandas nor ortools.
+    """
+    for module in bench.STARTUP_MODULES + ('src.chain',):
+        assert bench.startup(module, repeat=1)['heavy'] == []
+    assert bench.main(['startup', '--budget', '10']) == 0
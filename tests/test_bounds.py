@@ -0,0 +1,84 @@
+"""
+Test file for the lower bounds.
+"""
+from itertools import permutations
+import numpy as np
+import pytest
+from src import heuristic
+from src.bounds import lower_bound, neighbor_distances, spanning_bound, spanning_forest
+from src.spatial_index import GridIndex, METRICS
+
+
+def minimum_spanning_tree(locations: np.ndarray) -> list:
+    """
+    Weights of the links of the minimum spanning tree, with Prim's algorithm.
+    """
+    delta = locations[:, np.newaxis, :] - locations[np.newaxis, :, :]
+    dist = np.hypot(delta[..., 0], delta[..., 1])
+    reached, best, weights = np.zeros(len(locations), dtype=bool), dist[0].copy(), []
+    reached[0] = True
+    for _ in range(len(locations) - 1):
+        node = int(np.argmin(np.where(reached, np.inf, best)))
+        weights.append(best[node])
+        reached[node] = True
+        best = np.minimum(best, dist[node])
+    return weights
+
+
+@pytest.mark.parametrize("k", [3, 6, 199])
+def test_spanning_bound_under_spanning_tree(k: int) -> None:
+    """
+    Test that the spanning bound never exceeds the minimum spanning forest and is exact on the complete graph.
+    """
+    locations = np.random.default_rng(0).random((200, 2))
+    neighbors = GridIndex(locations).knn(k)
+    distances = neighbor_distances(locations, neighbors)
+    weights = sorted(minimum_spanning_tree(locations))
+    for chains in (1, 3):
+        bound = spanning_bound(neighbors, distances, chains)
+        forest = sum(weights[:len(weights) - chains + 1])
+        assert bound <= forest + 1e-9
+        if k == 199:
+            assert bound == pytest.approx(forest)
+
+
+def test_spanning_forest_matches_prim() -> None:
+    """
+    Test that the forest of the complete graph is a spanning tree of the same weight as Prim's, ties included.
+    """
+    locations = np.round(np.random.default_rng(3).random((120, 2)) * 8) / 8
+    sources, targets = np.triu_indices(len(locations), 1)
+    weights = np.hypot(*(locations[sources] - locations[targets]).T)
+    sort = np.argsort(weights, kind='stable')
+    forest = spanning_forest(sources[sort], targets[sort], len(locations))
+    assert len(forest) == len(locations) - 1
+    assert weights[sort][forest].sum() == pytest.approx(sum(minimum_spanning_tree(locations)))
+    assert len(spanning_forest(np.array([0]), np.array([1]), 4)) == 1
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+def test_spanning_bound_one_sided_neighbors(k: int) -> None:
+    """
+    Test the spanning bound on many small sets, where neighbours are often one sided.
+    """
+    rng = np.random.default_rng(2)
+    for _ in range(100):
+        locations = rng.random((int(rng.integers(4, 12)), 2))
+        neighbors = GridIndex(locations).knn(k)
+        distances = neighbor_distances(locations, neighbors)
+        weights = sorted(minimum_spanning_tree(locations))
+        for chains in (1, 2):
+            assert spanning_bound(neighbors, distances, chains) <= sum(weights[:len(weights) - chains + 1]) + 1e-9
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_lower_bound_under_optimal_chain(metric: str) -> None:
+    """
+    Test the bound against every chain of a few pins.
+    """
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        locations = rng.random((7, 2))
+        optimal = min(heuristic.path_length(locations, np.array([0, *inner, 1]), metric)
+                      for inner in permutations(range(2, 7)))
+        assert 0 < lower_bound(locations, [0], [1], k=3, metric=metric) <= optimal + 1e-9
@@ -6,7 +6,11 @@ import sys
 import pytest
 import numpy as np
 import pandas as pd
-from src.chain import Chain
+from ortools.constraint_solver import pywrapcp
+from src import heuristic
+from src.chain import Chain, RoutePool
+from src.geometry_cache import GeometryCache
+from src.stats import RunStats
 import random
 
 
@@ -50,3 +54,243 @@ def test_routing() -> None:
     print(df['order'])
     print(np.arange(1, len(df), 1))
     assert sorted(list(df['order'])) == [k for k in range(n_pins*n_macros)]
+
+
+@pytest.mark.parametrize("dtype", [np.int32, np.int64])
+def test_distance_array(dtype: type) -> None:
+    """
+    Test the scaled integer distance matrix used by the solver.
+    """
+    locations = np.array([(k, k) for k in range(10)], dtype=float)
+    matrix = Chain.get_dist_array(locations, scale=100, dtype=dtype)
+    assert matrix.dtype == dtype
+    assert matrix.flags['C_CONTIGUOUS']
+    assert (np.diag(matrix) == 0).all()
+    assert (matrix == matrix.T).all()
+    assert matrix[0][1] == round(100 * np.sqrt(2))
+    with pytest.raises(Chain.ChainException):
+        Chain.get_dist_array(locations, scale=1e12, dtype=np.int32)
+
+
+def test_routing_sparse() -> None:
+    """
+    Test that the sparse mode chains every pin from start to end.
+    """
+    n_pins = 60
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    df = Chain.route(df=df, start=3, end=7, k=5)
+    assert sorted(df['order']) == list(range(n_pins))
+    assert df['order'][3] == 0
+    assert df['order'][7] == n_pins - 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_routing_hierarchical(processes: int) -> None:
+    """
+    Test that the hierarchical mode keeps the pins of a macro together.
+    """
+    n_pins = 8
+    n_macros = 5
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'x': rng.random(n_pins * n_macros) + np.repeat(np.arange(n_macros) * 3, n_pins),
+        'y': rng.random(n_pins * n_macros),
+        'macro': np.repeat(np.arange(n_macros), n_pins),
+        'pin': np.tile(np.arange(n_pins), n_macros)
+    })
+    start_index, end_index = 2, len(df) - 3
+    solutions = []
+    df = Chain.route(df=df, start=start_index, end=end_index, hierarchical=True, processes=processes,
+                     on_solution=lambda length, seconds: solutions.append(length))
+    assert solutions == [pytest.approx(df.attrs['length'])]
+    assert sorted(df['order']) == list(range(len(df)))
+    assert df['order'][start_index] == 0
+    assert df['order'][end_index] == len(df) - 1
+    macros = df.sort_values('order')['macro'].tolist()
+    assert macros == sorted(macros)
+
+
+def test_routing_heuristic_engine() -> None:
+    """
+    Test that the heuristic engine returns the same order column.
+    """
+    n_pins = 40
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    df = Chain.route(df=df, start=0, end=1, engine='heuristic')
+    assert sorted(df['order']) == list(range(n_pins))
+    assert df['order'][0] == 0
+    assert df['order'][1] == n_pins - 1
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=0, end=1, engine='unknown')
+
+
+def test_routing_time_limit_and_progress() -> None:
+    """
+    Test the time budget, the metaheuristic and the progress callback.
+    """
+    n_pins = 30
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    progress = []
+    df = Chain.route(df=df, start=0, end=1, time_limit=0.5, first_solution='PATH_CHEAPEST_ARC',
+                     metaheuristic='GUIDED_LOCAL_SEARCH', on_solution=lambda cost, elapsed: progress.append(cost))
+    assert sorted(df['order']) == list(range(n_pins))
+    assert progress
+    assert progress == sorted(progress, reverse=True)
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=0, end=1, metaheuristic='GUIDED_LOCAL_SEARCH')
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=0, end=1, first_solution='UNKNOWN')
+
+
+def test_routing_no_solution(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a failed solve raises instead of reading a missing solution.
+    """
+    n_pins = 10
+    df = pd.DataFrame({'x': np.arange(n_pins), 'y': 0, 'macro': 0, 'pin': np.arange(n_pins)})
+    monkeypatch.setattr(pywrapcp.RoutingModel, 'SolveWithParameters', lambda self, parameters: None)
+    with pytest.raises(Chain.ChainException, match="No chain found"):
+        Chain.route(df=df, start=0, end=1)
+
+
+@pytest.mark.parametrize("k", [None, 5])
+def test_routing_stats(k: int) -> None:
+    """
+    Test that the phases and solver metrics of a chain are recorded.
+    """
+    n_pins = 30
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    stats = RunStats()
+    df = Chain.route(df=df, start=0, end=1, k=k, stats=stats)
+    assert df.attrs['stats'] is stats
+    assert {'route', 'model', 'solve', 'walk'} <= set(stats.phases)
+    assert ('dist_matrix' in stats.phases) == (k is None)
+    assert stats.metrics['nodes'] == n_pins
+    assert stats.metrics['solutions'] >= 1
+    assert stats.metrics['objective'] > 0
+
+
+@pytest.mark.parametrize("balance", ['pins', 'length'])
+def test_routing_multi_chain(balance: str) -> None:
+    """
+    Test that several chains cover every pin once, from their own start to their own end.
+    """
+    n_pins = 40
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    starts, ends = [0, 1, 2], [3, 4, 5]
+    solutions = []
+    df = Chain.route(df=df, start=starts, end=ends, balance=balance, processes=1,
+                     on_solution=lambda length, seconds: solutions.append(length))
+    assert solutions
+    if balance == 'pins':
+        assert solutions == [pytest.approx(df.attrs['length'])]
+    assert sorted(df['chain_id'].unique()) == [0, 1, 2]
+    for chain_id, (start, end) in enumerate(zip(starts, ends)):
+        chain = df[df['chain_id'] == chain_id].sort_values('order')
+        assert chain['order'].tolist() == list(range(len(chain)))
+        assert (chain.index[0], chain.index[-1]) == (start, end)
+        if balance == 'pins':
+            assert len(chain) in (13, 14)
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=starts, end=[3, 4, 0])
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=starts, end=ends, hierarchical=True)
+    with pytest.raises(Chain.ChainException):
+        Chain.route(df=df, start=starts, end=ends, balance='length', k=5)
+
+
+def test_reroute_repairs_chain() -> None:
+    """
+    Test that removed, added and moved pins are repaired without touching the chain extremities.
+    """
+    n_pins = 300
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    df = Chain.route(df=df, start=[0, 1], end=[2, 3], engine='heuristic', processes=1)
+    length = sum(heuristic.path_length(chain[['x', 'y']].to_numpy(), np.argsort(chain['order'].to_numpy()))
+                 for _, chain in df.groupby('chain_id'))
+    df = df.drop(index=[10, 11, 2])
+    df.loc[20, ['x', 'y']] = (0.5, 0.5)
+    added = pd.DataFrame({'x': [0.25, 0.75], 'y': [0.75, 0.25], 'macro': 0, 'pin': -1, 'order': np.nan},
+                         index=[n_pins, n_pins + 1])
+    df = Chain.reroute(pd.concat([df, added]), changed=[20, 0])
+    assert len(df) == n_pins - 1
+    repaired = 0.0
+    for chain_id, chain in df.groupby('chain_id'):
+        chain = chain.sort_values('order')
+        assert chain['order'].tolist() == list(range(len(chain)))
+        assert chain.index[0] == [0, 1][chain_id]
+        repaired += heuristic.path_length(chain[['x', 'y']].to_numpy(), np.arange(len(chain)))
+    assert df.loc[[n_pins, n_pins + 1], 'chain_id'].notna().all()
+    assert repaired < 1.1 * length
+    with pytest.raises(Chain.ChainException):
+        Chain.reroute(df, changed=[10])
+
+
+def test_route_many_matches_route() -> None:
+    """
+    Test that a batch chained by a worker pool gives the chains of route, in order or as completed.
+    """
+    rng = np.random.default_rng(0)
+    jobs = [(pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)}),
+             start, end) for n_pins, start, end in [(12, 0, 1), (2, 1, 0), (30, [0, 1], [2, 3]), (20, 5, 9)]]
+    expected = [Chain.route(df=df.copy(), start=start, end=end, processes=1, lower_bound=True)
+                for df, start, end in jobs]
+    with RoutePool(2) as pool:
+        results = list(Chain.route_many(jobs, pool=pool, chunksize=1, lower_bound=True))
+        assert [position for position, _ in results] == [0, 1, 2, 3]
+        for (_, df), expected_df in zip(results, expected):
+            assert df[['chain_id', 'order']].equals(expected_df[['chain_id', 'order']])
+            for name in ('length', 'lower_bound', 'gap'):
+                assert df.attrs[name] == pytest.approx(expected_df.attrs[name])
+        lengths = []
+        unordered = list(Chain.route_many(jobs, pool=pool, ordered=False,
+                                          on_solution=lambda length, seconds: lengths.append(length)))
+        assert sorted(position for position, _ in unordered) == [0, 1, 2, 3]
+        assert lengths == [pytest.approx(df.attrs['length']) for _, df in unordered]
+        results = Chain.route_many(jobs, pool=pool)
+        next(results)
+        results.close()
+        assert [position for position, _ in Chain.route_many(jobs[:1], pool=pool)] == [0]
+    with pytest.raises(Chain.ChainException):
+        Chain.route_many([(jobs[0][0], 0, 0)], processes=1)
+
+
+@pytest.mark.parametrize("engine", ['ortools', 'heuristic'])
+def test_routing_target_gap(engine: str) -> None:
+    """
+    Test that the length and the lower bound are reported and that the solve stops at the target gap.
+    """
+    n_pins = 200
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    df = Chain.route(df=df, start=0, end=1, engine=engine, time_limit=10, metaheuristic='GUIDED_LOCAL_SEARCH',
+                     target_gap=0.4)
+    path = np.argsort(df['order'].to_numpy())
+    assert df.attrs['length'] == pytest.approx(heuristic.path_length(df[['x', 'y']].to_numpy(), path))
+    assert 0 < df.attrs['lower_bound'] < df.attrs['length']
+    assert df.attrs['gap'] <= 0.4
+
+
+@pytest.mark.parametrize("engine, k", [('ortools', None), ('ortools', 5), ('heuristic', None)])
+def test_routing_geometry_cache(engine: str, k: int) -> None:
+    """
+    Test that chains of the same pins with other ends reuse the cached arrays and are not changed by the cache.
+    """
+    n_pins = 60
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.random(n_pins), 'y': rng.random(n_pins), 'macro': 0, 'pin': np.arange(n_pins)})
+    cache = GeometryCache()
+    for end in range(1, 4):
+        cached = Chain.route(df.copy(), 0, end, k=k, engine=engine, lower_bound=True, cache=cache)
+        expected = Chain.route(df.copy(), 0, end, k=k, engine=engine, lower_bound=True)
+        assert cached['order'].tolist() == expected['order'].tolist()
+        assert cached.attrs['lower_bound'] == pytest.approx(expected.attrs['lower_bound'])
+    dense = engine == 'ortools' and not k
+    assert cache.misses == len(cache) == (3 if dense else 1)
+    assert cache.hits == (10 if dense else 6) - cache.misses
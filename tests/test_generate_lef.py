@@ -106,3 +106,54 @@ def test_generate_1_cell_with_x_pins(number_of_pin: int) -> None:
     lef.generate_lef()
     lef.write_lef(f"1_cells_{number_of_pin}_pins.lef")
     assert os.path.exists(f"{PATH_TO_WRITE_LEF}/1_cells_{number_of_pin}_pins.lef")
+
+
+def test_stream_lef_matches_write_lef() -> None:
+    """
+    Test that the streamed lef is the lef written from `lef_content` and that
+    the same seed generates the same lef.
+    """
+    lef = GenerateLef(number_of_cells=2, number_of_ports=6, seed=7)
+    lef.generate_lef()
+    lef.write_lef("2_cells_6_pins_list.lef")
+    GenerateLef(number_of_cells=2, number_of_ports=6, seed=7).stream_lef("2_cells_6_pins_stream.lef")
+    GenerateLef(number_of_cells=2, number_of_ports=6, seed=8).stream_lef("2_cells_6_pins_other.lef")
+    contents = []
+    for name in ("list", "stream", "other"):
+        with open(f"{PATH_TO_WRITE_LEF}/2_cells_6_pins_{name}.lef", 'r', encoding="utf-8") as lef_stream:
+            contents.append(lef_stream.read())
+        os.remove(f"{PATH_TO_WRITE_LEF}/2_cells_6_pins_{name}.lef")
+    assert contents[0] == contents[1] == "\n".join(lef.lef_content)
+    assert contents[2] != contents[0]
+
+
+def test_pin_shapes_are_dispatched_on_each_side() -> None:
+    """
+    Test the pin shapes of a cell with 2 pins on each side and that the next
+    cell starts on the side following the last side used.
+    """
+    lef = GenerateLef(number_of_cells=1, number_of_ports=8)
+    sides, shapes = lef.get_pin_shapes()
+    assert sides.tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert shapes[:2].tolist() == [[0, 63, 1, 64], [0, 36, 1, 37]]
+    assert lef.get_pin_rects()[2:] == ["99 36.0 100 37.0", "99 63.0 100 64.0", "63.0 99 64.0 100",
+                                       "36.0 99 37.0 100", "36.0 0 37.0 1", "63.0 0 64.0 1"]
+    lef = GenerateLef(number_of_cells=2, number_of_ports=1)
+    lef.generate_lef()
+    assert [line for line in lef.lef_content if "\tRECT" in line] == ["\t\t\tRECT 0 49.5 1 50.5 ;",
+                                                                      "\t\t\tRECT 99 49.5 100 50.5 ;"]
+
+
+def test_parallel_stream_lef_is_deterministic() -> None:
+    """
+    Test that the lef generated by several processes is the lef generated by one.
+    """
+    contents = []
+    for processes in (1, 2):
+        GenerateLef(number_of_cells=5, number_of_ports=10, seed=3).stream_lef("5_cells_10_pins_parallel.lef", processes)
+        with open(f"{PATH_TO_WRITE_LEF}/5_cells_10_pins_parallel.lef", 'r', encoding="utf-8") as lef_stream:
+            contents.append(lef_stream.read())
+        os.remove(f"{PATH_TO_WRITE_LEF}/5_cells_10_pins_parallel.lef")
+    assert contents[0] == contents[1]
+    assert contents[0].count("\nMACRO ") == 4
+    assert not [name for name in os.listdir(PATH_TO_WRITE_LEF) if name.endswith(".part")]
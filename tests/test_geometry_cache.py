@@ -0,0 +1,43 @@
+"""
+Test file for the cache of distance matrices and neighbours.
+"""
+import numpy as np
+import pytest
+from src.chain import Chain
+from src.geometry_cache import GeometryCache
+from src.spatial_index import GridIndex
+
+
+def test_geometry_cache() -> None:
+    """
+    Test hits, misses, the reuse of wider neighbours, the memory cap and the invalidation.
+    """
+    rng = np.random.default_rng(0)
+    locations, other = rng.random((50, 2)), rng.random((50, 2))
+    cache = GeometryCache()
+    dist = cache.dist_array(locations, 1000, np.int64)
+    assert np.array_equal(dist, Chain.get_dist_array(locations))
+    assert cache.dist_array(locations.copy(), 1000, np.int64) is dist
+    assert cache.dist_array(locations, 1000, np.int32) is not dist
+    assert (cache.hits, cache.misses) == (1, 2)
+    with pytest.raises(ValueError):
+        dist[0, 1] = 0
+    assert np.array_equal(cache.neighbors(locations, 8), GridIndex(locations).knn(8))
+    assert np.array_equal(cache.neighbors(locations, 3), GridIndex(locations).knn(3))
+    assert cache.info() == {'hits': 2, 'misses': 3, 'arrays': 3, 'bytes': 50 * 50 * 12 + 50 * 8 * 8}
+    cache.neighbors(other, 4)
+    assert cache.invalidate(locations) == 3
+    assert cache.info()['arrays'] == 1
+    assert cache.invalidate() == 1
+    assert (len(cache), cache.nbytes) == (0, 0)
+    rows = cache.dist_rows(locations, 1000, np.int64)
+    assert rows == dist.tolist() and cache.dist_rows(locations.copy(), 1000, np.int64) is rows
+    assert cache.nbytes >= 50 * 50 * 36 + 50 * 50 * 8
+    small = GeometryCache(max_bytes=50 * 50 * 8)
+    small.dist_array(locations, 1000, np.int64)
+    small.dist_array(other, 1000, np.int64)
+    assert len(small) == 1
+    small.dist_array(other, 1000, np.int64)
+    assert small.hits == 1
+    small.dist_array(locations, 1000, np.int64)
+    assert small.misses == 3
@@ -0,0 +1,40 @@
+"""
+Test file for the heuristic chain engine.
+"""
+import numpy as np
+from src import heuristic
+from src.chain import Chain
+
+
+def test_solve_keeps_extremities() -> None:
+    """
+    Test that the heuristic path visits every node once from start to end.
+    """
+    locations = np.random.default_rng(0).random((300, 2)) * 100
+    path = heuristic.solve(locations, start=10, end=20)
+    assert sorted(path.tolist()) == list(range(300))
+    assert path[0] == 10
+    assert path[-1] == 20
+
+
+def test_local_search_improves_nearest_neighbour() -> None:
+    """
+    Test that 2-opt and Or-opt never make the nearest neighbour path longer
+    and stay close to the ortools chain.
+    """
+    locations = np.random.default_rng(1).random((100, 2)) * 100
+    neighbors = Chain.get_neighbors(locations, heuristic.DEFAULT_NEIGHBORS)
+    greedy = heuristic.nearest_neighbor_path(locations, neighbors, 0, 1)
+    improved = heuristic.LocalSearch(locations, greedy.copy(), neighbors).run()
+    reference = Chain.get_path(locations, 0, 1)
+    assert heuristic.path_length(locations, improved) < heuristic.path_length(locations, greedy)
+    assert heuristic.path_length(locations, improved) < 1.1 * heuristic.path_length(locations, reference)
+
+
+def test_straight_line() -> None:
+    """
+    Test that points on a line are chained in order.
+    """
+    locations = np.array([(x, 0) for x in (0, 9, 3, 1, 7, 2, 8, 5, 4, 6)], dtype=float)
+    path = heuristic.solve(locations, start=0, end=1)
+    assert locations[path, 0].tolist() == list(range(10))
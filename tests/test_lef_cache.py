@@ -0,0 +1,69 @@
+"""
+Test file for LefCache.
+"""
+import hashlib
+import os
+import shutil
+import pytest
+from src.lef_cache import LefCache
+from src.lef_parser import LEF_DIR, LefParser
+
+
+def port_values(cells: list) -> list:
+    """
+    Get every value of the cells of a lef.
+
+    Args:
+        cells (list): LefCell list.
+
+    Returns:
+        list: Name, size and values of the ports of each cell.
+    """
+    return [(cell.get_name(), cell.get_size(),
+             [(port.get_name(), port.get_direction(), port.get_use(), port.get_layer(), port.get_polygons())
+              for port in cell.get_ports()]) for cell in cells]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_cache_round_trip(tmp_path, lazy: bool) -> None:
+    """
+    Verify that cached cells match parsed cells and that a warm load does not parse the lef.
+    """
+    cache = LefCache(str(tmp_path / "cache"))
+    expected = port_values(LefParser("golden_3_cells_1000_pins.lef").get_cells())
+    assert port_values(LefParser("golden_3_cells_1000_pins.lef", lazy=lazy, cache=cache).get_cells()) == expected
+    assert len(cache.entries()) == 1
+    warm_parser = LefParser("golden_3_cells_1000_pins.lef", cache=cache)
+    warm_parser.parse_cells = None
+    warm_cells = warm_parser.get_cells()
+    assert all(cell.port_table is not None for cell in warm_cells)
+    assert sum(cell.get_port_count() for cell in warm_cells) == 3000
+    assert port_values(warm_cells) == expected
+    assert port_values(warm_parser.iter_cells()) == expected
+
+
+def test_cache_key_and_eviction(tmp_path, monkeypatch) -> None:
+    """
+    Verify that an unchanged lef is not hashed again, that an edited lef gets a new entry
+    and that old entries are evicted above max_bytes.
+    """
+    lef_path = str(tmp_path / "lib.lef")
+    shutil.copy(os.path.join(LEF_DIR, "golden_3_cells_1000_pins.lef"), lef_path)
+    cache = LefCache(str(tmp_path / "cache"))
+    first_key = cache.key(lef_path)
+    with monkeypatch.context() as patch:
+        patch.setattr(hashlib, 'blake2b', None)
+        assert cache.key(lef_path) == first_key
+    LefParser(lef_path, cache=cache).get_cells()
+    with open(lef_path, 'a', encoding='utf-8') as lef_stream:
+        lef_stream.write("\n")
+    second_key = cache.key(lef_path)
+    assert second_key != first_key
+    LefParser(lef_path, cache=cache).get_cell("cell_0")
+    assert len(cache.index_files()) == 1
+    cache.max_bytes = cache.entry_size(first_key)
+    LefParser(lef_path, cache=cache).get_cells()
+    assert cache.entries() == [second_key]
+    assert cache.index_files() == []
+    cache.clear()
+    assert cache.entries() == []
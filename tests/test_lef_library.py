@@ -0,0 +1,43 @@
+"""
+Test file for LefLibrary.
+"""
+import os
+import pytest
+from src.lef_library import LefLibrary
+from src.lef_parser import LEF_DIR, LefParser
+
+GOLDEN_LEF = os.path.join(LEF_DIR, "golden_3_cells_1000_pins.lef")
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_sharded_library_matches_parser(processes: int) -> None:
+    """
+    Verify that shards split at MACRO lines and parsed in parallel give the cells of the parser.
+    """
+    shards = LefLibrary.get_shards(GOLDEN_LEF, shard_bytes=1000)
+    assert len(shards) == 3
+    assert shards[0][1] == 0 and shards[-1][2] == os.path.getsize(GOLDEN_LEF)
+    library = LefLibrary(GOLDEN_LEF, processes=processes, shard_bytes=1000)
+    cells = LefParser(GOLDEN_LEF).get_cells()
+    assert [cell.get_name() for cell in library.get_cells()] == [cell.get_name() for cell in cells]
+    for cell in cells:
+        library_cell = library.get_cell(cell.get_name())
+        assert library_cell.get_size() == cell.get_size()
+        assert [(port.get_name(), port.get_direction(), port.get_polygons()) for port in library_cell.get_ports()] == \
+            [(port.get_name(), port.get_direction(), port.get_polygons()) for port in cell.get_ports()]
+
+
+def test_library_duplicates(tmp_path) -> None:
+    """
+    Verify that macros defined in several files are detected.
+    """
+    for name in ("a.lef", "b.lef"):
+        (tmp_path / name).write_text(open(GOLDEN_LEF, encoding='utf-8').read())
+    with pytest.raises(LefLibrary.LefLibraryException):
+        LefLibrary(str(tmp_path), processes=1)
+    library = LefLibrary(str(tmp_path / "*.lef"), processes=1, duplicates='last')
+    assert len(library) == 3 and "cell_0" in library
+    assert library.duplicates["cell_0"] == [str(tmp_path / "a.lef"), str(tmp_path / "b.lef")]
+    assert library.origins["cell_0"] == str(tmp_path / "b.lef")
+    with pytest.raises(LefLibrary.LefLibraryException):
+        library.get_cell("unknown")
@@ -4,7 +4,9 @@ Test file for LefParser.
 import pytest
 import os
 import re
-from src.lef_parser import LefParser
+from src.lef_cache import LefCache
+from src.lef_parser import LEF_DIR, LefParser
+from src.stats import RunStats
 
 LEF_FILES = os.listdir("./lef_files")
 
@@ -52,7 +54,7 @@ def test_lef_get_ports(lef_file: str) -> None:
     """
     re_nb_of_pins = re.compile(r"(?P<nb_pins>\d+)_(port|pin)(s)*")
     match = re_nb_of_pins.search(lef_file)
-    nb_of_ports = match.group("nb_pins") if match else 0
+    nb_of_ports = int(match.group("nb_pins")) if match else 0
     lef_parser = LefParser(lef_file)
     lef_cells = lef_parser.get_cells() or []
     assert len(lef_cells) > 0
@@ -66,3 +68,176 @@ def test_lef_get_ports(lef_file: str) -> None:
             assert port.get_direction() in ("INPUT", "OUTPUT", "INOUT")
             assert port.get_layer() == 'M1'
             assert len(port.get_polygon()) == 4
+
+
+LEF_WITH_HEADER = """VERSION 5.8 ;
+UNITS
+    DATABASE MICRONS 1000 ;
+END UNITS
+LAYER M1
+    TYPE ROUTING ;
+END M1
+MACRO inv # comment
+    CLASS CORE ;
+    SIZE 2 BY 4 ;
+    PIN A
+        DIRECTION INPUT ;
+        USE SIGNAL ;
+        PORT
+            LAYER M1 ;
+            RECT 0 1
+                0.5 1.5 ;
+        END
+    END A
+    OBS
+        LAYER M1 ;
+        RECT 1 1 2 2 ;
+    END
+END inv
+END LIBRARY
+"""
+
+
+def test_iter_cells_streams_real_lef(tmp_path) -> None:
+    """
+    Verify that headers, obstructions and multi line statements are handled
+    and that iter_cells is a generator.
+    """
+    lef_path = tmp_path / "inv.lef"
+    lef_path.write_text(LEF_WITH_HEADER)
+    lef_cells = LefParser(str(lef_path)).iter_cells()
+    assert iter(lef_cells) is lef_cells
+    cell = next(lef_cells)
+    assert cell.get_name() == "inv"
+    assert cell.get_size() == ((0.0, 0.0), (0.0, 4.0), (2.0, 4.0), (2.0, 0.0))
+    assert [port.get_name() for port in cell.get_ports()] == ["A"]
+    port = cell.get_ports()[0]
+    assert (port.get_direction(), port.get_use(), port.get_layer()) == ("INPUT", "SIGNAL", "M1")
+    assert port.get_polygon() == ((0.0, 1.0), (0.0, 1.5), (0.5, 1.5), (0.5, 1.0))
+    assert next(lef_cells, None) is None
+
+
+def test_to_pin_table(tmp_path) -> None:
+    """
+    Verify that the pin table has one row per pin with the centroid of its shapes.
+    """
+    lef_path = tmp_path / "inv.lef"
+    lef_path.write_text(LEF_WITH_HEADER)
+    table = LefParser(str(lef_path)).to_pin_table()
+    assert len(table) == 1
+    row = table.iloc[0]
+    assert (row['x'], row['y']) == (0.25, 1.25)
+    assert (row['xmin'], row['ymin'], row['xmax'], row['ymax']) == (0.0, 1.0, 0.5, 1.5)
+    assert (row['pin'], row['macro'], row['macro_id']) == ("A", "inv", 0)
+    assert (row['direction'], row['use'], row['layer']) == ("INPUT", "SIGNAL", "M1")
+    inv = LEF_WITH_HEADER[LEF_WITH_HEADER.index("MACRO inv"):LEF_WITH_HEADER.index("END LIBRARY")]
+    lef_path.write_text(inv + inv.replace("inv", "buf") + inv)
+    table = LefParser(str(lef_path)).to_pin_table()
+    assert table['macro'].tolist() == ["inv", "buf", "inv"]
+    assert table['macro_id'].tolist() == [0, 1, 2]
+
+
+def test_to_pin_table_matches_cells() -> None:
+    """
+    Verify that the pin table and the cells describe the same pins.
+    """
+    lef_parser = LefParser("golden_3_cells_1000_pins.lef")
+    table = lef_parser.to_pin_table()
+    ports = [(cell.get_name(), port) for cell in lef_parser.get_cells() for port in cell.get_ports()]
+    assert len(table) == len(ports) == 3000
+    assert table['macro'].tolist() == [cell_name for cell_name, _ in ports]
+    assert table['pin'].tolist() == [port.get_name() for _, port in ports]
+    assert table['direction'].tolist() == [port.get_direction() for _, port in ports]
+    assert table['xmin'].tolist() == [port.get_polygon()[0][0] for _, port in ports]
+
+
+def test_lazy_ports_match_eager_ports() -> None:
+    """
+    Verify that lazy ports decode the same values as eager ports and that
+    cells and ports have no instance dict.
+    """
+    eager_cells = LefParser("golden_3_cells_1000_pins.lef").get_cells()
+    lazy_cells = LefParser("golden_3_cells_1000_pins.lef", lazy=True).get_cells()
+    for eager_cell, lazy_cell in zip(eager_cells, lazy_cells):
+        assert not hasattr(lazy_cell, '__dict__')
+        assert lazy_cell.get_size() == eager_cell.get_size()
+        for eager_port, lazy_port in zip(eager_cell.get_ports(), lazy_cell.get_ports()):
+            assert not hasattr(lazy_port, '__dict__')
+            assert lazy_port.get_name() == eager_port.get_name()
+            assert lazy_port.get_polygon() == eager_port.get_polygon()
+            assert lazy_port.get_direction() == eager_port.get_direction()
+            assert (lazy_port.get_use(), lazy_port.get_layer()) == (eager_port.get_use(), eager_port.get_layer())
+
+
+def test_extension_before_macro(tmp_path) -> None:
+    """
+    Verify that an extension block, closed by ENDEXT, does not hide the macros after it.
+    """
+    lef_path = tmp_path / "ext.lef"
+    header, macros = LEF_WITH_HEADER.split("MACRO inv", 1)
+    lef_path.write_text(header + 'BEGINEXT "tag"\n    CREATOR "tool" ;\nENDEXT\nMACRO inv' + macros)
+    cells = LefParser(str(lef_path)).get_cells()
+    assert [cell.get_name() for cell in cells] == ["inv"]
+    assert [port.get_name() for port in cells[0].get_ports()] == ["A"]
+
+
+def test_density_block_in_macro(tmp_path) -> None:
+    """
+    Verify that the bare END of a DENSITY block does not close the macro and drop the pins after it.
+    """
+    lef_path = tmp_path / "density.lef"
+    header, macro = LEF_WITH_HEADER.split("    PIN A", 1)
+    density = "    DENSITY\n        LAYER M1 ;\n        RECT 0 0 2 4 50 ;\n    END\n"
+    lef_path.write_text(header + density + "    PIN A" + macro)
+    for lazy in (False, True):
+        cells = LefParser(str(lef_path), lazy=lazy).get_cells()
+        assert [cell.get_name() for cell in cells] == ["inv"]
+        assert [(port.get_name(), port.get_polygon()) for port in cells[0].get_ports()] == \
+            [("A", ((0.0, 1.0), (0.0, 1.5), (0.5, 1.5), (0.5, 1.0)))]
+    assert LefParser(str(lef_path)).to_pin_table()['pin'].tolist() == ["A"]
+
+
+def test_get_cell_with_macro_index(tmp_path) -> None:
+    """
+    Verify that get_cell reads a single macro and that the macro index is saved in the index
+    directory, the directory of the cache by default, and never next to the lef.
+    """
+    lef_dir, index_dir = tmp_path / "lef", str(tmp_path / "index")
+    lef_dir.mkdir()
+    lef_path = str(lef_dir / "lib.lef")
+    with open(lef_path, 'w', encoding='utf-8') as lef_stream:
+        lef_stream.write(LEF_WITH_HEADER + open(f"{LEF_DIR}/golden_3_cells_1000_pins.lef", encoding='utf-8').read())
+    cells = LefParser(lef_path).get_cells()
+    lef_parser = LefParser(lef_path, index_dir=index_dir)
+    assert list(lef_parser.get_macro_index()) == [cell.get_name() for cell in cells]
+    assert os.listdir(index_dir) == [os.path.basename(lef_parser.macro_index_path())]
+    assert os.listdir(lef_dir) == ["lib.lef"]
+    lef_parser = LefParser(lef_path, index_dir=index_dir)
+    lef_parser.iter_statements = None
+    assert lef_parser.get_macro_index()["inv"][0] == LEF_WITH_HEADER.index("MACRO inv")
+    for lazy in (False, True):
+        cell = LefParser(lef_path, lazy=lazy, index_dir=index_dir).get_cell("cell_1")
+        assert cell.get_size() == cells[2].get_size()
+        assert [(port.get_name(), port.get_use(), port.get_polygon()) for port in cell.get_ports()] == \
+            [(port.get_name(), port.get_use(), port.get_polygon()) for port in cells[2].get_ports()]
+    with pytest.raises(LefParser.LefParserException):
+        LefParser(lef_path, index_dir=index_dir).get_cell("unknown")
+    cache = LefCache(str(tmp_path / "cache"))
+    LefParser(lef_path, cache=cache).get_cell("inv")
+    assert cache.index_files() == os.listdir(cache.cache_dir)
+    cache.clear()
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_parser_stats() -> None:
+    """
+    Verify that the parser records its time and throughput.
+    """
+    stats = RunStats()
+    lef_parser = LefParser("golden_3_cells_1000_pins.lef", stats=stats)
+    lef_parser.get_cells()
+    assert (stats.metrics['cells'], stats.metrics['pins']) == (3, 3000)
+    assert stats.metrics['bytes'] == os.path.getsize(f"{LEF_DIR}/golden_3_cells_1000_pins.lef")
+    lef_parser.to_pin_table()
+    assert {'get_cells', 'pin_table'} <= set(stats.phases)
+    assert stats.metrics['pins_per_second'] > 0
@@ -0,0 +1,30 @@
+"""
+Test file for the command line.
+"""
+import pandas as pd
+from src.__main__ import main
+
+
+def test_generate_parse_chain(tmp_path, capsys) -> None:
+    """
+    Test the three commands on a generated lef.
+    """
+    lef_path = str(tmp_path / "cli.lef")
+    assert main(['generate', '2', '20', '-o', lef_path, '--seed', '1']) == 0
+    table_path = tmp_path / "pins.csv"
+    assert main(['parse', lef_path, '--table', str(table_path)]) == 0
+    assert "2 cells, 40 pins" in capsys.readouterr().out
+    assert len(pd.read_csv(table_path)) == 40
+    chain_path = tmp_path / "chain.csv"
+    assert main(['chain', lef_path, '--cell', 'cell_1', '--engine', 'heuristic', '--target-gap', '1',
+                 '-o', str(chain_path)]) == 0
+    assert "20 pins chained" in capsys.readouterr().out
+    chained = pd.read_csv(chain_path)
+    assert chained['order'].tolist() == list(range(20))
+    assert chained['pin'].iloc[0] == 'pin_0'
+    assert main(['chain', lef_path, '--cell', 'unknown']) == 1
+    per_cell_path = tmp_path / "chains.csv"
+    assert main(['chain', lef_path, '--per-cell', '--end', '-1', '--engine', 'heuristic', '--processes', '1',
+                 '-o', str(per_cell_path)]) == 0
+    assert "2 cells, 40 pins chained" in capsys.readouterr().out
+    assert pd.read_csv(per_cell_path).groupby('macro')['order'].max().tolist() == [19, 19]
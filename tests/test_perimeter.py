@@ -0,0 +1,50 @@
+"""
+Test file for the perimeter walk.
+"""
+import numpy as np
+import pandas as pd
+from src import heuristic
+from src.chain import Chain
+from src.lef_parser import LefParser
+from src.perimeter import perimeter_coordinates, perimeter_path
+
+
+def test_perimeter_coordinates() -> None:
+    """
+    Test the position of points along the border and the detection of inner points.
+    """
+    locations = np.array([(0, 0), (2, 0), (2, 1), (1, 1), (0, 0.5)])
+    assert perimeter_coordinates(locations).tolist() == [0, 2, 3, 4, 5.5]
+    assert perimeter_coordinates(np.vstack([locations, (1, 0.5)])) is None
+    assert perimeter_path(np.vstack([locations, (1, 0.5)]), 0, 1) is None
+
+
+def test_perimeter_path_on_macro() -> None:
+    """
+    Test that the walk chains every pin of a generated macro from start to end,
+    as short as the heuristic engine when the extremities are neighbours on the border.
+    """
+    table = LefParser("golden_3_cells_1000_pins.lef").to_pin_table()
+    locations = table.loc[table['macro_id'] == 0, ['x', 'y']].to_numpy()
+    for start, end in [(0, 1), (10, 900), (999, 3)]:
+        path = perimeter_path(locations, start, end)
+        assert sorted(path.tolist()) == list(range(len(locations)))
+        assert (path[0], path[-1]) == (start, end)
+    square = np.array([(0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2), (0, 1)])
+    path = perimeter_path(square, 0, 1)
+    assert heuristic.path_length(square, path) == 7
+    assert path.tolist() == [0, 7, 6, 5, 4, 3, 2, 1]
+
+
+def test_route_perimeter_falls_back() -> None:
+    """
+    Test that macros with inner pins are chained by the engine in the hierarchical mode.
+    """
+    rng = np.random.default_rng(0)
+    border = np.array([(0, 0), (1, 0), (1, 1), (0, 1), (0.5, 0), (0.5, 1)])
+    inner = rng.random((6, 2)) * 0.5 + (5.25, 0.25)
+    df = pd.DataFrame({'x': np.r_[border[:, 0], inner[:, 0]], 'y': np.r_[border[:, 1], inner[:, 1]],
+                       'macro': [0] * 6 + [1] * 6, 'pin': np.arange(12)})
+    df = Chain.route(df=df, start=0, end=11, hierarchical=True, processes=1, perimeter=True)
+    assert sorted(df['order']) == list(range(12))
+    assert df['order'][0] == 0 and df['order'][11] == 11
@@ -0,0 +1,71 @@
+"""
+Test file for the pipelined chaining of a lef.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from src.chain import Chain
+from src.lef_parser import LefParser
+from src.pipeline import chain_lef
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_chain_lef_matches_route(tmp_path, processes: int) -> None:
+    """
+    Test that the pipeline writes the chain of every cell in the order of the lef, as route does.
+    """
+    output = str(tmp_path / "chains.csv")
+    summary = chain_lef("golden_3_cells_1000_pins.lef", output, processes=processes, max_pending=1, engine='heuristic')
+    assert (summary['cells'], summary['pins']) == (3, 3000)
+    chains = pd.read_csv(output)
+    table = LefParser("golden_3_cells_1000_pins.lef").to_pin_table()
+    assert chains['macro'].unique().tolist() == table['macro'].unique().tolist()
+    length = 0.0
+    for name, cell in table.groupby('macro', sort=False, observed=True):
+        cell = Chain.route(cell.reset_index(drop=True), 0, len(cell) - 1, engine='heuristic')
+        expected = cell.sort_values('order')
+        written = chains[chains['macro'] == name]
+        assert written['pin'].tolist() == expected['pin'].tolist()
+        assert written['order'].tolist() == list(range(len(cell)))
+        assert np.allclose(written[['x', 'y']].to_numpy(), expected[['x', 'y']].to_numpy())
+        length += cell.attrs['length']
+    assert summary['length'] == pytest.approx(length)
+    with pytest.raises(Chain.ChainException):
+        chain_lef("golden_3_cells_1000_pins.lef", output, processes=1, start=0, end=-1000)
+
+
+LEF_WITHOUT_SHAPES = """MACRO inv
+    SIZE 2 BY 4 ;
+    PIN A
+        PORT
+            LAYER M1 ;
+            RECT 0 0 1 1 ;
+        END
+    END A
+    PIN VDD
+        USE POWER ;
+    END VDD
+    PIN Z
+        PORT
+            LAYER M1 ;
+            RECT 1 3 2 4 ;
+        END
+    END Z
+END inv
+"""
+
+
+def test_chain_lef_checks_pins(tmp_path) -> None:
+    """
+    Test that pins without shapes are left out of the chains and that out of range or unplaced ends raise.
+    """
+    lef_path, output = tmp_path / "inv.lef", str(tmp_path / "chains.csv")
+    lef_path.write_text(LEF_WITHOUT_SHAPES)
+    summary = chain_lef(str(lef_path), output, processes=1, engine='heuristic')
+    assert (summary['cells'], summary['pins'], summary['skipped_pins']) == (1, 2, 1)
+    chains = pd.read_csv(output)
+    assert chains['pin'].tolist() == ["A", "Z"]
+    assert chains[['x', 'y']].to_numpy().tolist() == [[0.5, 0.5], [1.5, 3.5]]
+    for start, end in [(0, 3), (-4, -1), (1, -1)]:
+        with pytest.raises(Chain.ChainException, match="inv"):
+            chain_lef(str(lef_path), output, processes=1, start=start, end=end, engine='heuristic')
@@ -0,0 +1,74 @@
+"""
+Test file for GridIndex and PinIndex.
+"""
+import pytest
+import numpy as np
+from src.lef_parser import LefParser
+from src.spatial_index import GridIndex, METRICS, PinIndex, metric_dist
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_knn_is_exact(metric: str) -> None:
+    """
+    Test that the grid nearest neighbours match a brute force search.
+    """
+    points = np.random.default_rng(0).random((500, 2)) * 100
+    neighbors = GridIndex(points).knn(6, metric)
+    delta = points[:, np.newaxis, :] - points[np.newaxis, :, :]
+    dist = metric_dist(delta[..., 0], delta[..., 1], metric)
+    np.fill_diagonal(dist, np.inf)
+    expected = np.sort(dist, axis=1)[:, :6]
+    assert neighbors.shape == (500, 6)
+    assert (np.take_along_axis(dist, neighbors, axis=1) == expected).all()
+
+
+def test_knn_small_set() -> None:
+    """
+    Test that k is capped by the number of points.
+    """
+    points = np.array([(0, 0), (0, 1), (5, 5)])
+    neighbors = GridIndex(points).knn(10)
+    assert neighbors.tolist() == [[1, 2], [0, 2], [1, 0]]
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_pin_index_queries(metric: str) -> None:
+    """
+    Test the pin index queries against a brute force search over the port boxes.
+    """
+    cell = LefParser("golden_3_cells_1000_pins.lef").get_cells()[0]
+    boxes = np.array([(*np.min(port.get_polygon(), axis=0), *np.max(port.get_polygon(), axis=0))
+                      for port in cell.get_ports()])
+    assert (cell.get_port_boxes() == boxes).all()
+    pin_index = PinIndex.from_cell(cell)
+    rng = np.random.default_rng(1)
+    for xmin, ymin, width, height in rng.random((50, 4)) * (110, 110, 20, 20) - (5, 5, 0, 0):
+        hit = (boxes[:, 0] <= xmin + width) & (boxes[:, 2] >= xmin) & (boxes[:, 1] <= ymin + height) & (boxes[:, 3] >= ymin)
+        assert pin_index.intersect(xmin, ymin, xmin + width, ymin + height).tolist() == np.flatnonzero(hit).tolist()
+        dist = pin_index.box_dist(np.arange(len(boxes)), xmin, ymin, metric)
+        assert (np.sort(dist[pin_index.nearest(xmin, ymin, 5, metric)]) == np.sort(dist)[:5]).all()
+    assert pin_index.on_side('left').tolist() == np.flatnonzero(boxes[:, 0] == 0).tolist()
+    assert pin_index.on_side('top').tolist() == np.flatnonzero(boxes[:, 3] == 100).tolist()
+    with pytest.raises(ValueError):
+        pin_index.on_side('front')
+
+
+def test_pin_index_over_cells() -> None:
+    """
+    Test that a library index returns (cell, port) labels.
+    """
+    cells = LefParser("golden_3_cells_1000_pins.lef").get_cells()
+    pin_index = PinIndex.from_cells(cells)
+    labels = pin_index.nearest(0, 50, 3)
+    assert sorted(labels[:, 0].tolist()) == [0, 1, 2]
+    assert len(set(labels[:, 1].tolist())) == 1
+
+
+def test_knn_of_rows() -> None:
+    """
+    Test that the neighbours of a few points match the neighbours of every point.
+    """
+    points = np.random.default_rng(2).random((300, 2))
+    grid = GridIndex(points)
+    rows = np.array([5, 250, 17, 5])
+    assert (grid.knn(4, rows=rows) == grid.knn(4)[rows]).all()
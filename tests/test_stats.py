@@ -0,0 +1,32 @@
+"""
+Test file for RunStats.
+"""
+from src.stats import NULL_STATS, RunStats
+
+
+def test_phases_accumulate_and_nest() -> None:
+    """
+    Test that nested phases are timed, repeated phases add up and hooks see every value.
+    """
+    events = []
+    stats = RunStats(memory=True, hooks=[lambda kind, name, value: events.append((kind, name))])
+    for _ in range(2):
+        with stats.phase('outer'):
+            with stats.phase('inner'):
+                buffer = bytearray(1 << 20)
+            del buffer
+    stats.set('nodes', 10)
+    assert stats.phases['outer'] >= stats.phases['inner'] > 0
+    assert stats.peak_memory['outer'] >= stats.peak_memory['inner'] >= 1 << 20
+    assert events.count(('phase', 'outer')) == 2
+    assert ('memory', 'inner') in events and ('metric', 'nodes') in events
+    assert stats.as_dict()['metrics'] == {'nodes': 10}
+
+
+def test_null_stats_records_nothing() -> None:
+    """
+    Test that the disabled stats are falsy and accept every call.
+    """
+    assert not NULL_STATS
+    with NULL_STATS.phase('route'):
+        NULL_STATS.set('nodes', 1)